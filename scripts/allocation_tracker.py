@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+import tracemalloc
+from datetime import datetime
+from typing import Any, Dict, List
+import numpy as np
+
+# Allocations made by the tracing machinery itself are not interesting
+IGNORED_FILES = [tracemalloc.__file__, __file__, '<frozen importlib._bootstrap>',
+                 '<frozen importlib._bootstrap_external>', '<unknown>']
+
+class AllocationTracker:
+    """Track Python heap growth between checkpoints with tracemalloc
+
+    Each ``checkpoint`` takes a snapshot, diffs it against the previous
+    one by allocation site (file:line) and records the top growing sites.
+    Traced memory is kept per checkpoint; ``growth`` fits a line through
+    it and flags sustained linear growth, the usual signature of a leak in
+    a long-running steady workload.
+    """
+
+    def __init__(self, top_n: int = 10, frames: int = 1, min_points: int = 3,
+                 min_r_squared: float = 0.9, min_growth_bytes: int = 1024 * 1024):
+        self.top_n = top_n
+        self.frames = frames
+        self.min_points = min_points
+        self.min_r_squared = min_r_squared
+        self.min_growth_bytes = min_growth_bytes
+        self.history = []
+        self.site_growth = {}
+        self._previous = None
+        self._started_tracing = False
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        filters = [tracemalloc.Filter(False, filename) for filename in IGNORED_FILES]
+        return tracemalloc.take_snapshot().filter_traces(filters)
+
+    def start(self):
+        """Start tracing (if not already) and take the baseline snapshot"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._started_tracing = True
+        self._previous = self._snapshot()
+        self.history = []
+        self.site_growth = {}
+
+    def stop(self):
+        """Stop tracing if this tracker started it"""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self._previous = None
+
+    def checkpoint(self) -> Dict[str, Any]:
+        """Diff the heap against the previous checkpoint"""
+        if self._previous is None:
+            self.start()
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self._previous, 'lineno')
+        self._previous = snapshot
+
+        growing = [stat for stat in stats if stat.size_diff > 0][:self.top_n]
+        top_sites = []
+        for stat in growing:
+            frame = stat.traceback[0]
+            site = f"{frame.filename}:{frame.lineno}"
+            self.site_growth[site] = self.site_growth.get(site, 0) + stat.size_diff
+            top_sites.append({
+                'site': site,
+                'size_diff': stat.size_diff,
+                'size': stat.size,
+                'count_diff': stat.count_diff
+            })
+
+        current, peak = tracemalloc.get_traced_memory()
+        self.history.append(current)
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'interval_growth_bytes': sum(stat.size_diff for stat in stats),
+            'top_sites': top_sites,
+            'growth': self.growth()
+        }
+
+    def growth(self) -> Dict[str, Any]:
+        """Fit traced memory over checkpoints and flag sustained linear growth"""
+        result = {
+            'checkpoints': len(self.history),
+            'slope_bytes_per_interval': 0.0,
+            'r_squared': 0.0,
+            'total_growth_bytes': 0,
+            'linear_growth': False,
+            'top_cumulative_sites': self._top_cumulative_sites()
+        }
+        if len(self.history) < 2:
+            return result
+
+        y = np.asarray(self.history, dtype=np.float64)
+        x = np.arange(len(y), dtype=np.float64)
+        slope, intercept = np.polyfit(x, y, 1)
+        residual = float(np.sum((y - (slope * x + intercept)) ** 2))
+        total = float(np.sum((y - y.mean()) ** 2))
+        r_squared = 1.0 - residual / total if total > 0 else 0.0
+
+        result.update({
+            'slope_bytes_per_interval': float(slope),
+            'r_squared': r_squared,
+            'total_growth_bytes': int(y[-1] - y[0])
+        })
+        result['linear_growth'] = bool(
+            len(y) >= self.min_points and slope > 0 and
+            r_squared >= self.min_r_squared and
+            y[-1] - y[0] >= self.min_growth_bytes
+        )
+        return result
+
+    def _top_cumulative_sites(self) -> List[Dict[str, Any]]:
+        """Sites that grew the most across all checkpoints"""
+        sites = sorted(self.site_growth.items(), key=lambda item: item[1], reverse=True)
+        return [{'site': site, 'size_diff': size} for site, size in sites[:self.top_n]]
@@ -2,27 +2,42 @@
 
 import os
 import json
+import argparse
 import yaml
-import time
 import logging
-from datetime import datetime
 from prometheus_client import start_http_server, Gauge, Counter, Histogram, CollectorRegistry
 from typing import Dict, Any, List
+from metrics_store import SQLiteMetricsStore
+from gorilla_codec import append_block, series_file
+from metrics_sampler import create_probe
+from clock import SystemClock
+import instrumentation
 
 class CIMonitor:
-    def __init__(self):
+    def __init__(self, store=None, series_codec=None, block_size=60, probe=None,
+                 clock=None, metrics_dir=None):
+        # Injected clock: a VirtualClock makes the polling loop deterministic
+        self.clock = clock or SystemClock()
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.config_file = os.path.join(
             self.base_dir,
             "workflows/yaml_workflows/monitoring_config.yml"
         )
-        self.metrics_dir = os.path.join(
+        self.metrics_dir = metrics_dir or os.path.join(
             self.base_dir,
             "sample_analysis_results",
-            f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
+            f"test_results_{self.clock.now().strftime('%Y_%m_%d')}",
             "metrics"
         )
         os.makedirs(self.metrics_dir, exist_ok=True)
+        self.store = store
+        # With series_codec='gorilla', resource samples are buffered and
+        # appended to compressed daily block files every block_size samples
+        self.series_codec = series_codec
+        self.block_size = block_size
+        self._series_buffer = {'timestamps': [], 'cpu_usage': [], 'memory_usage': []}
+        # Resource probe created once (a /proc-backed one where available)
+        self.probe = probe or create_probe()
         self.setup_logging()
         self.load_config()
         self.setup_metrics()
@@ -97,23 +112,63 @@ class CIMonitor:
             ['stage'],
             registry=self.registry
         )
+        
+        # Operation timings from instrumentation.timer / @timed
+        self.operation_duration = Histogram(
+            'operation_duration_seconds',
+            'Instrumented operation duration',
+            ['operation'],
+            registry=self.registry
+        )
 
     def start_monitoring(self, port: int = 8000):
         """Start monitoring server"""
         self.running = True
+        instrumentation.add_listener(self.record_timing)
         start_http_server(port)
         self.logger.info(f"Monitoring server started on port {port}")
         
     def stop_monitoring(self):
         """Stop monitoring server"""
         self.running = False
+        instrumentation.remove_listener(self.record_timing)
+        self.flush_series_blocks()
+        if self.store is not None:
+            self.store.flush()
         self.logger.info("Monitoring server stopped")
 
+    def buffer_series_sample(self, cpu: float, memory: float):
+        """Buffer a resource sample for the compressed series files"""
+        if self.series_codec != 'gorilla':
+            return
+        self._series_buffer['timestamps'].append(self.clock.time())
+        self._series_buffer['cpu_usage'].append(cpu)
+        self._series_buffer['memory_usage'].append(memory)
+        if len(self._series_buffer['timestamps']) >= self.block_size:
+            self.flush_series_blocks()
+
+    def flush_series_blocks(self):
+        """Append buffered resource samples as Gorilla blocks"""
+        timestamps = self._series_buffer['timestamps']
+        if not timestamps:
+            return
+        try:
+            for name in ['cpu_usage', 'memory_usage']:
+                path = series_file(self.metrics_dir, name, timestamps[0])
+                append_block(path, timestamps, self._series_buffer[name])
+        except Exception as e:
+            self.logger.error(f"Error writing series blocks: {str(e)}")
+        self._series_buffer = {'timestamps': [], 'cpu_usage': [], 'memory_usage': []}
+
     def record_test_execution(self, category: str, duration: float, status: str):
         """Record test execution metrics"""
         self.test_duration.labels(category=category).observe(duration)
         self.test_count.labels(category=category, status=status).inc()
 
+    def record_timing(self, name: str, seconds: float):
+        """Record an instrumented operation timing"""
+        self.operation_duration.labels(operation=name).observe(seconds)
+
     def record_resource_usage(self, cpu: float, memory: float):
         """Record resource usage metrics"""
         self.cpu_usage.set(cpu)
@@ -166,24 +221,46 @@ class CIMonitor:
 
     def save_metrics(self, metrics: Dict[str, Any]):
         """Save metrics to file"""
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        if self.store is not None:
+            test_metrics = metrics.get('test_metrics', {})
+            # Gorilla block files already hold the resource samples
+            system = ({'cpu_usage': [], 'memory_usage': []} if self.series_codec == 'gorilla' else {
+                'cpu_usage': [metrics.get('cpu_usage', 0.0)],
+                'memory_usage': [metrics.get('memory_usage', 0.0)]
+            })
+            self.store.write_snapshot({
+                'timestamp': metrics.get('timestamp', self.clock.now().isoformat()),
+                'source': 'ci_monitor',
+                'system': system,
+                'quality': metrics.get('quality_metrics', {}),
+                'tests': {
+                    'passed': test_metrics.get('pass', 0),
+                    'failed': test_metrics.get('fail', 0),
+                    'skipped': test_metrics.get('skip', 0)
+                }
+            })
+            return
+            
+        timestamp = self.clock.now().strftime('%Y%m%d_%H%M%S')
         metrics_file = os.path.join(self.metrics_dir, f'ci_metrics_{timestamp}.json')
         
         with open(metrics_file, 'w') as f:
             json.dump({
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': self.clock.now().isoformat(),
                 'metrics': metrics
             }, f, indent=2)
 
-    def monitor_pipeline(self):
-        """Monitor CI pipeline execution"""
+    def monitor_pipeline(self, iterations=None):
+        """Monitor CI pipeline execution (forever, or for a number of polls)"""
         try:
             self.start_monitoring()
             
-            while True:
+            polls = 0
+            while iterations is None or polls < iterations:
+                polls += 1
                 # Collect metrics
                 metrics = {
-                    'timestamp': datetime.now().isoformat(),
+                    'timestamp': self.clock.now().isoformat(),
                     'cpu_usage': self._get_cpu_usage(),
                     'memory_usage': self._get_memory_usage(),
                     'test_metrics': self._get_test_metrics(),
@@ -196,6 +273,7 @@ class CIMonitor:
                     metrics['memory_usage']
                 )
                 self.record_quality_metrics(metrics['quality_metrics'])
+                self.buffer_series_sample(metrics['cpu_usage'], metrics['memory_usage'])
                 
                 # Check thresholds
                 alerts = self.check_thresholds(metrics)
@@ -205,28 +283,30 @@ class CIMonitor:
                 # Save metrics
                 self.save_metrics(metrics)
                 
-                time.sleep(self.config['monitoring']['interval'])
+                self.clock.sleep(self.config['monitoring']['interval'])
+            
+            self.stop_monitoring()
                 
         except KeyboardInterrupt:
+            self.flush_series_blocks()
             self.logger.info("Monitoring stopped")
         except Exception as e:
+            self.flush_series_blocks()
             self.logger.error(f"Error in monitoring: {str(e)}")
             raise
 
     def _get_cpu_usage(self) -> float:
         """Get CPU usage"""
         try:
-            import psutil
-            return psutil.cpu_percent()
-        except:
+            return self.probe.cpu_percent()
+        except Exception:
             return 0.0
 
     def _get_memory_usage(self) -> float:
         """Get memory usage"""
         try:
-            import psutil
-            return psutil.Process().memory_info().rss
-        except:
+            return self.probe.memory_mb() * 1024 * 1024
+        except Exception:
             return 0.0
 
     def _get_test_metrics(self) -> Dict[str, Any]:
@@ -294,7 +374,20 @@ class CIMonitor:
         pass
 
 def main():
-    monitor = CIMonitor()
+    parser = argparse.ArgumentParser(description="Monitor CI pipeline metrics")
+    parser.add_argument("--store", choices=['json', 'sqlite'], default='json',
+                      help="Metrics storage backend")
+    parser.add_argument("--series-codec", choices=['gorilla'], default=None,
+                      help="Also write compressed per-sample CPU/memory series")
+    parser.add_argument("--probe", choices=['auto', 'psutil', 'proc'], default='auto',
+                      help="Resource probe backend")
+    args = parser.parse_args()
+    
+    monitor = CIMonitor(series_codec=args.series_codec, probe=create_probe(args.probe))
+    if args.store == 'sqlite':
+        # One transaction per minute of samples keeps write overhead low
+        monitor.store = SQLiteMetricsStore(monitor.metrics_dir, source='ci_monitor',
+                                           batch_size=60, flush_interval=60)
     monitor.monitor_pipeline()
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import time
+import heapq
+import itertools
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+class SystemClock:
+    """Wall and monotonic time from the time module"""
+
+    virtual = False
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def perf_counter_ns(self) -> int:
+        return time.perf_counter_ns()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        time.sleep(seconds)
+
+class VirtualClock:
+    """Deterministic clock that only moves when advanced
+
+    ``advance`` (and ``sleep``, which is the same thing) moves time
+    forward and runs the callbacks scheduled with ``call_at`` in time
+    order, each seeing the clock at its due time. Samplers driven by a
+    VirtualClock therefore tick synchronously in the advancing thread, so
+    hours of sampling can be simulated in milliseconds. Sleeping inside a
+    scheduled callback moves time forward without running other callbacks
+    until the callback returns, like a slow callback on a real clock.
+    """
+
+    virtual = True
+
+    def __init__(self, start: Optional[float] = None):
+        self._time = time.time() if start is None else float(start)
+        self._monotonic = 0.0
+        self._timers = []
+        self._seq = itertools.count()
+        self._advancing = False
+        self._lock = threading.RLock()
+
+    def time(self) -> float:
+        return self._time + self._monotonic
+
+    def monotonic(self) -> float:
+        return self._monotonic
+
+    def perf_counter_ns(self) -> int:
+        return int(round(self._monotonic * 1e9))
+
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.time())
+
+    def call_at(self, when: float, callback: Callable[[], None]):
+        """Run callback once monotonic time reaches when"""
+        with self._lock:
+            heapq.heappush(self._timers, (when, next(self._seq), callback))
+
+    def advance(self, seconds: float):
+        """Move time forward, running callbacks that fall due"""
+        if seconds < 0:
+            raise ValueError("Cannot move a clock backwards")
+        with self._lock:
+            target = self._monotonic + seconds
+            if self._advancing:
+                # Called from a callback: the outer advance runs the timers
+                self._monotonic = target
+                return
+            self._advancing = True
+            try:
+                while self._timers and self._timers[0][0] <= target:
+                    when, _, callback = heapq.heappop(self._timers)
+                    self._monotonic = max(self._monotonic, when)
+                    callback()
+                    target = max(target, self._monotonic)
+                self._monotonic = target
+            finally:
+                self._advancing = False
+
+    def sleep(self, seconds: float):
+        self.advance(max(seconds, 0.0))
@@ -9,6 +9,7 @@ from dash.dependencies import Input, Output
 import plotly.graph_objs as go
 import pandas as pd
 from datetime import datetime, timedelta
+from shared_ring import DEFAULT_RING_NAME, attach
 
 class DataQualityDashboard:
     def __init__(self):
@@ -19,6 +20,10 @@ class DataQualityDashboard:
             f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
             "monitoring"
         )
+        # Live quality scores published by a running collector
+        self.live_ring_name = DEFAULT_RING_NAME
+        self.live_reader = None
+        self._live_total = None
         self.app = dash.Dash(__name__)
         self.setup_layout()
         
@@ -46,6 +51,26 @@ class DataQualityDashboard:
                     
         return pd.DataFrame(metrics)
         
+    def load_live_metrics(self, n=300):
+        """Load the latest quality scores from the collector's shared-memory ring"""
+        if self.live_reader is not None and self.live_reader.total == self._live_total:
+            # A stalled ring may have been replaced by a new collector run
+            self.live_reader.close()
+            self.live_reader = None
+        if self.live_reader is None:
+            self.live_reader = attach(self.live_ring_name)
+            if self.live_reader is None:
+                return pd.DataFrame(columns=['timestamps', 'completeness', 'consistency', 'validity'])
+        self._live_total = self.live_reader.total
+        
+        data = self.live_reader.latest(n)
+        return pd.DataFrame({
+            'timestamps': [datetime.fromtimestamp(t) for t in data['timestamp']],
+            'completeness': data['completeness'],
+            'consistency': data['consistency'],
+            'validity': data['validity']
+        })
+        
     def setup_layout(self):
         """Setup dashboard layout"""
         self.app.layout = html.Div([
@@ -68,10 +93,20 @@ class DataQualityDashboard:
                 dcc.Graph(id='quality-metrics')
             ]),
             
+            html.Div([
+                html.H3('Live Quality Scores'),
+                dcc.Graph(id='live-quality')
+            ]),
+            
             dcc.Interval(
                 id='interval-component',
                 interval=30*1000,  # 30 seconds
                 n_intervals=0
+            ),
+            dcc.Interval(
+                id='live-interval',
+                interval=1000,  # Shared memory, no disk I/O
+                n_intervals=0
             )
         ])
         
@@ -153,6 +188,28 @@ class DataQualityDashboard:
             
             return quality_fig, issues_fig, metrics_fig
             
+        @self.app.callback(
+            Output('live-quality', 'figure'),
+            [Input('live-interval', 'n_intervals')]
+        )
+        def update_live_quality(n):
+            df = self.load_live_metrics()
+            
+            live_fig = go.Figure()
+            for metric in ['completeness', 'consistency', 'validity']:
+                live_fig.add_trace(go.Scatter(
+                    x=df['timestamps'],
+                    y=df[metric],
+                    name=metric.capitalize(),
+                    mode='lines'
+                ))
+            live_fig.update_layout(
+                title='Live Quality Scores',
+                yaxis_title='Score',
+                yaxis_range=[0, 1]
+            )
+            return live_fig
+            
     def run(self, host='localhost', port=8050):
         """Run dashboard"""
         self.app.run_server(host=host, port=port, debug=True)
@@ -1,11 +1,11 @@
 #!/usr/bin/env python3
 
 import os
-import json
 import random
 from datetime import datetime, timedelta
+from metrics_store import create_store
 
-def generate_test_results(num_tests=100, days=7):
+def generate_test_results(num_tests=100, days=7, backend='json'):
     base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     metrics_dir = os.path.join(
         base_dir,
@@ -14,6 +14,7 @@ def generate_test_results(num_tests=100, days=7):
         "metrics"
     )
     os.makedirs(metrics_dir, exist_ok=True)
+    store = create_store(backend, metrics_dir)
     
     # Generate data for each day
     for day in range(days):
@@ -44,10 +45,9 @@ def generate_test_results(num_tests=100, days=7):
         }
         
         # Save metrics
-        filename = f'metrics_{date.strftime("%Y%m%d_%H%M%S")}.json'
-        filepath = os.path.join(metrics_dir, filename)
-        with open(filepath, 'w') as f:
-            json.dump(metrics, f, indent=2)
+        store.write_snapshot(metrics)
+    
+    store.close()
             
 if __name__ == '__main__':
     generate_test_results()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+import numpy as np
+
+# Block header: magic, sample count, first/last timestamp (ms), first value
+BLOCK_MAGIC = b'GRL1'
+BLOCK_HEADER = struct.Struct('<4sIqqd')
+RECORD_LENGTH = struct.Struct('<I')
+
+# Delta-of-delta ranges: (prefix bits, prefix length, payload bits)
+DOD_BUCKETS = [
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12)
+]
+
+class BitWriter:
+    """Append-only bit stream"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._acc = 0
+        self._nbits = 0
+
+    def write(self, value: int, nbits: int):
+        """Write the low nbits of value, most significant bit first"""
+        self._acc = (self._acc << nbits) | (value & ((1 << nbits) - 1))
+        self._nbits += nbits
+        while self._nbits >= 8:
+            self._nbits -= 8
+            self.buffer.append((self._acc >> self._nbits) & 0xFF)
+        self._acc &= (1 << self._nbits) - 1
+
+    def getvalue(self) -> bytes:
+        """Get the stream padded to a whole byte"""
+        if self._nbits:
+            return bytes(self.buffer) + bytes([(self._acc << (8 - self._nbits)) & 0xFF])
+        return bytes(self.buffer)
+
+class BitReader:
+    """Sequential reader for a BitWriter stream"""
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def read(self, nbits: int) -> int:
+        """Read nbits as an unsigned integer"""
+        start, end = self.pos >> 3, (self.pos + nbits + 7) >> 3
+        chunk = int.from_bytes(self.data[start:end], 'big')
+        shift = (end - start) * 8 - (self.pos & 7) - nbits
+        self.pos += nbits
+        return (chunk >> shift) & ((1 << nbits) - 1)
+
+    def read_bit(self) -> int:
+        """Read a single bit"""
+        byte = self.data[self.pos >> 3]
+        bit = (byte >> (7 - (self.pos & 7))) & 1
+        self.pos += 1
+        return bit
+
+def _float_bits(value: float) -> int:
+    return struct.unpack('<Q', struct.pack('<d', value))[0]
+
+def _bits_float(bits: int) -> float:
+    return struct.unpack('<d', struct.pack('<Q', bits))[0]
+
+def encode_block(timestamps: Iterable[float], values: Iterable[float]) -> bytes:
+    """Encode epoch-second timestamps and float values as a Gorilla block
+
+    Timestamps are stored at millisecond resolution with delta-of-delta
+    coding; values are XORed with their predecessor and only the
+    meaningful bits are kept, as in Facebook's Gorilla TSDB. Regular 1 Hz
+    samples take about one bit per timestamp, and slowly changing values
+    a few bits each.
+    """
+    ts = np.round(np.asarray(timestamps, dtype=np.float64) * 1000).astype(np.int64).tolist()
+    vals = np.asarray(values, dtype=np.float64).tolist()
+    if len(ts) != len(vals):
+        raise ValueError("Timestamps and values must have the same length")
+    if not ts:
+        return BLOCK_HEADER.pack(BLOCK_MAGIC, 0, 0, 0, 0.0)
+
+    writer = BitWriter()
+    prev_ts, prev_delta = ts[0], 0
+    prev_bits = _float_bits(vals[0])
+    prev_leading, prev_trailing = 65, 0
+
+    for t, v in zip(ts[1:], vals[1:]):
+        # Timestamp: delta-of-delta
+        delta = t - prev_ts
+        dod = delta - prev_delta
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_len, payload in DOD_BUCKETS:
+                if -(1 << (payload - 1)) < dod <= (1 << (payload - 1)):
+                    writer.write(prefix, prefix_len)
+                    writer.write(dod, payload)
+                    break
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod, 64)
+        prev_ts, prev_delta = t, delta
+
+        # Value: XOR with the previous value
+        bits = _float_bits(v)
+        xor = bits ^ prev_bits
+        if xor == 0:
+            writer.write(0, 1)
+        else:
+            leading = min(64 - xor.bit_length(), 31)
+            trailing = (xor & -xor).bit_length() - 1
+            if leading >= prev_leading and trailing >= prev_trailing:
+                writer.write(0b10, 2)
+                writer.write(xor >> prev_trailing, 64 - prev_leading - prev_trailing)
+            else:
+                meaningful = 64 - leading - trailing
+                writer.write(0b11, 2)
+                writer.write(leading, 5)
+                writer.write(meaningful - 1, 6)
+                writer.write(xor >> trailing, meaningful)
+                prev_leading, prev_trailing = leading, trailing
+        prev_bits = bits
+
+    header = BLOCK_HEADER.pack(BLOCK_MAGIC, len(ts), ts[0], ts[-1], vals[0])
+    return header + writer.getvalue()
+
+def block_info(data: bytes) -> Tuple[int, float, float]:
+    """Get (count, first timestamp, last timestamp) without decoding"""
+    magic, count, first_ms, last_ms, _ = BLOCK_HEADER.unpack_from(data)
+    if magic != BLOCK_MAGIC:
+        raise ValueError("Not a Gorilla block")
+    return count, first_ms / 1000, last_ms / 1000
+
+def decode_block(data: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode a block into (epoch-second timestamps, values) arrays"""
+    magic, count, first_ms, _, first_value = BLOCK_HEADER.unpack_from(data)
+    if magic != BLOCK_MAGIC:
+        raise ValueError("Not a Gorilla block")
+
+    ts = np.empty(count, dtype=np.int64)
+    vals = np.empty(count, dtype=np.float64)
+    if count == 0:
+        return ts.astype(np.float64), vals
+
+    reader = BitReader(data[BLOCK_HEADER.size:])
+    ts[0], vals[0] = first_ms, first_value
+    prev_ts, prev_delta = first_ms, 0
+    prev_bits = _float_bits(first_value)
+    leading, trailing = 0, 0
+
+    for i in range(1, count):
+        if reader.read_bit() == 0:
+            dod = 0
+        else:
+            for _, prefix_len, payload in DOD_BUCKETS:
+                if reader.read_bit() == 0:
+                    break
+            else:
+                payload = 64
+            dod = reader.read(payload)
+            if dod >= 1 << (payload - 1) and not (payload < 64 and dod == 1 << (payload - 1)):
+                dod -= 1 << payload
+        prev_delta += dod
+        prev_ts += prev_delta
+        ts[i] = prev_ts
+
+        if reader.read_bit() == 1:
+            if reader.read_bit() == 1:
+                leading = reader.read(5)
+                trailing = 64 - leading - (reader.read(6) + 1)
+            prev_bits ^= reader.read(64 - leading - trailing) << trailing
+        vals[i] = _bits_float(prev_bits)
+
+    return ts / 1000.0, vals
+
+def series_file(metrics_dir: str, name: str, timestamp: float) -> str:
+    """Path of the daily block file holding a series sample"""
+    day = datetime.fromtimestamp(timestamp).strftime('%Y%m%d')
+    return os.path.join(metrics_dir, f'series_{name}_{day}.gts')
+
+def append_block(path: str, timestamps: Iterable[float], values: Iterable[float]):
+    """Append an encoded block to a series file"""
+    block = encode_block(timestamps, values)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'ab') as f:
+        f.write(RECORD_LENGTH.pack(len(block)) + block)
+
+def read_blocks(path: str, start: Optional[float] = None,
+                end: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode the samples in a series file that fall in [start, end]
+
+    Blocks entirely outside the window are skipped using their headers.
+    """
+    ts_parts, value_parts = [], []
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    pos = 0
+    while pos + RECORD_LENGTH.size <= len(data):
+        (length,) = RECORD_LENGTH.unpack_from(data, pos)
+        block = data[pos + RECORD_LENGTH.size:pos + RECORD_LENGTH.size + length]
+        pos += RECORD_LENGTH.size + length
+        if len(block) < length:
+            break  # Torn final record from an interrupted write
+
+        count, first, last = block_info(block)
+        if count == 0 or (start is not None and last < start) or (end is not None and first > end):
+            continue
+        ts, vals = decode_block(block)
+        mask = np.ones(count, dtype=bool)
+        if start is not None:
+            mask &= ts >= start
+        if end is not None:
+            mask &= ts <= end
+        ts_parts.append(ts[mask])
+        value_parts.append(vals[mask])
+
+    if not ts_parts:
+        return np.zeros(0), np.zeros(0)
+    return np.concatenate(ts_parts), np.concatenate(value_parts)
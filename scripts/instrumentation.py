@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import os
+import functools
+import threading
+from time import perf_counter_ns
+from typing import Any, Callable, Dict, List, Optional
+
+# Histogram bucket upper bounds: powers of two from ~1 us to ~137 s (ns),
+# so a timing's bucket follows from its bit length without a search
+MIN_BUCKET_SHIFT = 10
+BUCKET_BOUNDS_NS = [1 << shift for shift in range(MIN_BUCKET_SHIFT, 38)]
+
+class TimingHistogram:
+    """Fixed-bucket latency histogram for one timed operation
+
+    Buckets are allocated once, so recording a timing is a bit-length
+    lookup and a few integer updates. Exact count, sum, min and max are
+    kept alongside the bucket counts; percentiles are estimated from the
+    buckets.
+    """
+
+    __slots__ = ('name', 'counts', 'count', 'sum_ns', 'min_ns', 'max_ns', '_lock')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)
+        self.count = 0
+        self.sum_ns = 0
+        self.min_ns = None
+        self.max_ns = 0
+        self._lock = threading.Lock()
+
+    def record(self, elapsed_ns: int):
+        """Add one timing in nanoseconds"""
+        # Bucket i holds timings in (2**(i + 9), 2**(i + 10)] ns
+        index = min(max((elapsed_ns - 1).bit_length() - MIN_BUCKET_SHIFT, 0), len(BUCKET_BOUNDS_NS))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum_ns += elapsed_ns
+            if self.min_ns is None or elapsed_ns < self.min_ns:
+                self.min_ns = elapsed_ns
+            if elapsed_ns > self.max_ns:
+                self.max_ns = elapsed_ns
+
+    def percentile(self, q: float) -> float:
+        """Estimate the q-th quantile (0-1) in seconds from the bucket bounds"""
+        with self._lock:
+            counts = list(self.counts)
+            total, max_ns = self.count, self.max_ns
+        if total == 0:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKET_BOUNDS_NS[index] if index < len(BUCKET_BOUNDS_NS) else max_ns
+                return min(bound, max_ns) / 1e9
+        return max_ns / 1e9
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get summary statistics in seconds"""
+        with self._lock:
+            count, sum_ns = self.count, self.sum_ns
+            min_ns, max_ns = self.min_ns or 0, self.max_ns
+            buckets = list(self.counts)
+        return {
+            'count': count,
+            'sum': sum_ns / 1e9,
+            'mean': sum_ns / count / 1e9 if count else 0.0,
+            'min': min_ns / 1e9,
+            'max': max_ns / 1e9,
+            'p50': self.percentile(0.50),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': buckets
+        }
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(BUCKET_BOUNDS_NS) + 1)
+            self.count = 0
+            self.sum_ns = 0
+            self.min_ns = None
+            self.max_ns = 0
+
+class _Registry:
+    """Process-wide histograms, listeners and the enabled flag
+
+    Recording is on while it was enabled explicitly (enable() or
+    METRICS_TIMING) or while at least one listener is registered.
+    """
+
+    def __init__(self):
+        self.explicit = os.environ.get('METRICS_TIMING', '') not in ('', '0')
+        self.enabled = self.explicit
+        self.histograms = {}
+        self.listeners = []
+        self.lock = threading.Lock()
+
+_registry = _Registry()
+
+def enable():
+    """Start recording timings"""
+    _registry.explicit = True
+    _registry.enabled = True
+
+def disable():
+    """Stop recording timings; timed code then only pays a flag check"""
+    _registry.explicit = False
+    _registry.enabled = False
+
+def is_enabled() -> bool:
+    return _registry.enabled
+
+def histogram(name: str) -> TimingHistogram:
+    """Get the histogram for name, creating it on first use"""
+    hist = _registry.histograms.get(name)
+    if hist is None:
+        with _registry.lock:
+            hist = _registry.histograms.setdefault(name, TimingHistogram(name))
+    return hist
+
+def add_listener(callback: Callable[[str, float], None]):
+    """Call callback(name, seconds) for every recorded timing and enable recording"""
+    with _registry.lock:
+        if callback not in _registry.listeners:
+            # Copy on write so recording threads can iterate without a lock
+            _registry.listeners = _registry.listeners + [callback]
+        _registry.enabled = True
+
+def remove_listener(callback: Callable[[str, float], None]):
+    """Stop forwarding timings to callback; recording stops with the last
+    listener unless timing was enabled explicitly"""
+    with _registry.lock:
+        _registry.listeners = [c for c in _registry.listeners if c != callback]
+        if not _registry.listeners and not _registry.explicit:
+            _registry.enabled = False
+
+def _record(hist: TimingHistogram, elapsed_ns: int):
+    hist.record(elapsed_ns)
+    listeners = _registry.listeners
+    if listeners:
+        seconds = elapsed_ns / 1e9
+        for callback in listeners:
+            try:
+                callback(hist.name, seconds)
+            except Exception:
+                # A failing consumer must not break the timed code
+                pass
+
+class Timer:
+    """Context manager timing a block with perf_counter_ns
+
+    The elapsed time is always measured and available as ``elapsed_ns`` /
+    ``elapsed`` after the block, so callers can use it directly; it is
+    only recorded into the histogram while timing is enabled. ``now``
+    replaces perf_counter_ns, e.g. with a VirtualClock's.
+    """
+
+    __slots__ = ('histogram', 'now', 'start_ns', 'elapsed_ns')
+
+    def __init__(self, hist: TimingHistogram, now: Callable[[], int] = perf_counter_ns):
+        self.histogram = hist
+        self.now = now
+        self.start_ns = 0
+        self.elapsed_ns = 0
+
+    def __enter__(self) -> 'Timer':
+        self.start_ns = self.now()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self.elapsed_ns = self.now() - self.start_ns
+        if _registry.enabled:
+            _record(self.histogram, self.elapsed_ns)
+        return False
+
+    @property
+    def elapsed(self) -> float:
+        """Elapsed time in seconds"""
+        return self.elapsed_ns / 1e9
+
+def timer(name: str, clock=None) -> Timer:
+    """Time a block: ``with timer('name') as t: ...`` (optionally on clock)"""
+    if clock is None:
+        return Timer(histogram(name))
+    return Timer(histogram(name), clock.perf_counter_ns)
+
+def timed(name: Optional[str] = None) -> Callable:
+    """Decorator recording each call's duration under name (default: qualname)"""
+    def decorator(func: Callable) -> Callable:
+        hist = histogram(name or f'{func.__module__}.{func.__qualname__}')
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _registry.enabled:
+                return func(*args, **kwargs)
+            start_ns = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _record(hist, perf_counter_ns() - start_ns)
+        return wrapper
+    return decorator
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Get summary statistics for every histogram with timings"""
+    with _registry.lock:
+        histograms = list(_registry.histograms.values())
+    return {hist.name: hist.snapshot() for hist in histograms if hist.count}
+
+def reset():
+    """Clear all recorded timings (histograms stay allocated)"""
+    with _registry.lock:
+        histograms = list(_registry.histograms.values())
+    for hist in histograms:
+        hist.reset()
+
+def names() -> List[str]:
+    with _registry.lock:
+        return sorted(_registry.histograms)
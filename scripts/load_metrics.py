@@ -1,53 +1,246 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import json
+import glob
+import math
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
+from metrics_manifest import files_in_range
+from metrics_cache import PARSE_CACHE
+from quantile_sketch import QuantileSketch
+from gorilla_codec import read_blocks
+from runtime_metrics import RUNTIME_SERIES
+from metrics_store import SNAPSHOT_SERIES, SQLITE_FILENAME, SQLiteMetricsStore, empty_snapshot_metrics
 
-def load_metrics(metrics_dir: str, time_range: str) -> Dict[str, Any]:
-    """Load metrics from files based on time range"""
-    days = {'1h': 1, '1d': 1, '1w': 7}[time_range]
-    cutoff_time = datetime.now() - timedelta(days=days)
+# Sections a snapshot must contain to be merged into the dashboard view
+SNAPSHOT_KEYS = ['performance', 'quality', 'system', 'tests', 'timestamp']
+
+# Keys of snapshots that only carry extra 'section.metric' series (e.g.
+# allocation tracking or the metrics daemon)
+SERIES_SNAPSHOT_KEYS = ['series', 'timestamp']
+
+# Units accepted by parse_duration
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Aggregations accepted by query_metrics, besides any 'pNN' percentile
+AGGREGATIONS = ['mean', 'max', 'min', 'count', 'sum']
+
+# Below this many uncached files a process pool costs more than it saves
+MIN_PARALLEL_FILES = 16
+
+def _merge_latest(metrics: Dict[str, Any], data: Dict[str, Any],
+                  timestamp: Optional[datetime],
+                  latest_timestamp: Optional[datetime]) -> Optional[datetime]:
+    """Keep the quality and test metrics of the most recent snapshot"""
+    if timestamp is not None and data['quality'] is not None:
+        if latest_timestamp is None or timestamp > latest_timestamp:
+            latest_timestamp = timestamp
+            # Copied so callers cannot mutate cached snapshots
+            metrics['quality'] = dict(data['quality'])
+            metrics['tests'] = dict(data['tests'])
     
-    metrics = {
-        'performance': {
-            'response_time': [],
-            'throughput': [],
-            'error_rate': []
-        },
-        'quality': None,
-        'tests': None,
-        'system': {
-            'cpu_usage': [],
-            'memory_usage': []
+    return latest_timestamp
+
+def _merge_snapshot(metrics: Dict[str, Any], data: Dict[str, Any],
+                    timestamp: Optional[datetime],
+                    latest_timestamp: Optional[datetime]) -> Optional[datetime]:
+    """Merge one snapshot into the accumulated metrics"""
+    # Collect performance and system series
+    for section, names in SNAPSHOT_SERIES.items():
+        for metric in names:
+            metrics[section][metric].extend(data[section][metric])
+    
+    return _merge_latest(metrics, data, timestamp, latest_timestamp)
+
+def parse_snapshot_file(file_path: str) -> Dict[str, Any]:
+    """Parse a snapshot file into its timestamp, series arrays and latest metrics"""
+    with open(file_path, 'r') as f:
+        data = json.load(f)
+    
+    # Series-only snapshots have no dashboard sections
+    series = {
+        section: {
+            metric: np.asarray(data.get(section, {}).get(metric, []), dtype=np.float64)
+            for metric in names
         }
+        for section, names in SNAPSHOT_SERIES.items()
     }
+    # Extra 'section.metric' series written by other instruments
+    for name, values in data.get('series', {}).items():
+        section, metric = name.split('.', 1)
+        series.setdefault(section, {})[metric] = np.asarray(values, dtype=np.float64)
     
+    return {
+        'timestamp': datetime.fromisoformat(data['timestamp']),
+        'series': series,
+        'quality': data.get('quality'),
+        'tests': data.get('tests')
+    }
+
+def snapshot_entries(metrics_dir: str, start: Optional[datetime] = None,
+                     end: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Get manifest entries of store snapshots (full or series-only) in a window"""
+    return [
+        entry for entry in files_in_range(metrics_dir, start=start, end=end)
+        if set(SNAPSHOT_KEYS).issubset(entry['keys'])
+        or set(SERIES_SNAPSHOT_KEYS).issubset(entry['keys'])
+    ]
+
+def parse_snapshot_files(paths: List[str], workers: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Parse snapshot files through the cache, in input order
+
+    With ``workers`` > 1, files missing from the cache are sharded across a
+    process pool; each worker returns pre-extracted arrays, which are added
+    to the cache by the parent.
+    """
+    snapshots = []
+    missing = []
+    for i, path in enumerate(paths):
+        key, snapshot = PARSE_CACHE.lookup(path)
+        snapshots.append(snapshot)
+        if snapshot is None:
+            missing.append((i, key))
+    
+    if workers and workers > 1 and len(missing) >= MIN_PARALLEL_FILES:
+        chunksize = max(1, len(missing) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = executor.map(parse_snapshot_file, [key[0] for _, key in missing],
+                                  chunksize=chunksize)
+            for (i, key), snapshot in zip(missing, parsed):
+                snapshots[i] = snapshot
+                PARSE_CACHE.put(key, snapshot)
+    else:
+        for i, key in missing:
+            snapshots[i] = parse_snapshot_file(key[0])
+            PARSE_CACHE.put(key, snapshots[i])
+    
+    return snapshots
+
+def load_snapshot_files(metrics_dir: str, start: datetime, end: Optional[datetime] = None,
+                        workers: Optional[int] = None) -> Tuple[Dict[str, Any], Optional[datetime]]:
+    """Load metrics_*.json snapshots whose timestamp falls in [start, end]"""
+    metrics = empty_snapshot_metrics()
     latest_timestamp = None
+    parts = {section: {metric: [] for metric in names} for section, names in SNAPSHOT_SERIES.items()}
     
-    for root, _, files in os.walk(metrics_dir):
-        for file in files:
-            if file.startswith('metrics_'):
-                file_path = os.path.join(root, file)
-                with open(file_path, 'r') as f:
-                    data = json.load(f)
-                    timestamp = datetime.fromisoformat(data['timestamp'])
-                    
-                    if timestamp >= cutoff_time:
-                        # Collect performance metrics
-                        for metric in metrics['performance']:
-                            metrics['performance'][metric].extend(data['performance'][metric])
-                        
-                        # Collect system metrics
-                        for metric in metrics['system']:
-                            metrics['system'][metric].extend(data['system'][metric])
-                        
-                        # Update latest quality and test metrics
-                        if latest_timestamp is None or timestamp > latest_timestamp:
-                            latest_timestamp = timestamp
-                            metrics['quality'] = data['quality']
-                            metrics['tests'] = data['tests']
+    # The manifest lets us skip files outside the window without opening them,
+    # and the parse cache skips re-parsing files that have not changed
+    entries = snapshot_entries(metrics_dir, start=start, end=end)
+    snapshots = parse_snapshot_files([entry['path'] for entry in entries], workers)
+    
+    # Merged in manifest order, so the latest-wins result matches a serial load
+    for snapshot in snapshots:
+        timestamp = snapshot['timestamp']
+        
+        if timestamp >= start and (end is None or timestamp <= end):
+            for section, names in SNAPSHOT_SERIES.items():
+                for metric in names:
+                    parts[section][metric].append(snapshot['series'][section][metric])
+            latest_timestamp = _merge_latest(metrics, snapshot, timestamp, latest_timestamp)
+    
+    for section, names in SNAPSHOT_SERIES.items():
+        for metric in names:
+            if parts[section][metric]:
+                metrics[section][metric] = np.concatenate(parts[section][metric]).tolist()
+    
+    return metrics, latest_timestamp
+
+def parse_duration(value) -> timedelta:
+    """Parse a duration such as '90s', '30m', '6h', '30d' or '2w'
+
+    The unit is required: a bare number is rejected rather than guessed
+    as seconds or days.
+    """
+    if isinstance(value, timedelta):
+        return value
+    if isinstance(value, (int, float)):
+        raise ValueError(f"Duration needs a unit (s, m, h, d or w): {value}")
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([smhdw])\s*', str(value))
+    if not match:
+        raise ValueError(f"Invalid duration: {value}")
+    return timedelta(seconds=float(match.group(1)) * DURATION_UNITS[match.group(2)])
+
+def load_series(metrics_dir: str, name: str, start: Optional[datetime] = None,
+                end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Decode Gorilla-encoded series blocks into (timestamps, values) arrays"""
+    start_ts = start.timestamp() if start is not None else None
+    end_ts = end.timestamp() if end is not None else None
+    ts_parts, value_parts = [], []
+    
+    for path in sorted(glob.glob(os.path.join(metrics_dir, f'series_{name}_*.gts'))):
+        ts, values = read_blocks(path, start_ts, end_ts)
+        ts_parts.append(ts)
+        value_parts.append(values)
+    
+    if not ts_parts:
+        return np.zeros(0), np.zeros(0)
+    ts, values = np.concatenate(ts_parts), np.concatenate(value_parts)
+    order = np.argsort(ts, kind='stable')
+    return ts[order], values[order]
+
+def read_metrics_stream(stream_file: str) -> Dict[str, Any]:
+    """Reassemble collector metrics from an incremental NDJSON stream"""
+    metrics = {
+        'timestamps': [],
+        'cpu_usage': [],
+        'memory_usage': [],
+        'test_results': [],
+        'performance': [],
+        'quality_metrics': {
+            'completeness': 1.0,
+            'consistency': 1.0,
+            'validity': 1.0
+        },
+        'sketches': {}
+    }
+    
+    with open(stream_file, 'r') as f:
+        for line in f:
+            try:
+                segment = json.loads(line)
+            except ValueError:
+                # A torn final line from an interrupted write is skipped
+                continue
+            for name in ['timestamps', 'cpu_usage', 'memory_usage', 'test_results', 'performance']:
+                metrics[name].extend(segment.get(name, []))
+            for name in RUNTIME_SERIES:
+                if name in segment:
+                    metrics.setdefault(name, []).extend(segment[name])
+            metrics['quality_metrics'] = segment.get('quality_metrics', metrics['quality_metrics'])
+            for name, data in segment.get('sketches', {}).items():
+                sketch = QuantileSketch.from_dict(data)
+                if name in metrics['sketches']:
+                    metrics['sketches'][name].merge(sketch)
+                else:
+                    metrics['sketches'][name] = sketch
+    
+    return metrics
+
+def load_metrics(metrics_dir: str, time_range: str, workers: Optional[int] = None) -> Dict[str, Any]:
+    """Load metrics from files based on time range
+
+    ``time_range`` is a duration understood by parse_duration, e.g. '1h'.
+
+    Set ``workers`` to parse uncached files in that many processes.
+    """
+    cutoff_time = datetime.now() - parse_duration(time_range)
+    
+    metrics, latest_timestamp = load_snapshot_files(metrics_dir, cutoff_time, workers=workers)
+    
+    # Merge in snapshots written to a shared SQLite store
+    if os.path.exists(os.path.join(metrics_dir, SQLITE_FILENAME)):
+        with SQLiteMetricsStore(metrics_dir) as store:
+            stored, stored_timestamp = store.load_range(cutoff_time)
+        latest_timestamp = _merge_snapshot(metrics, stored, stored_timestamp, latest_timestamp)
+    
+    # Merge in compressed per-second system samples
+    for metric in metrics['system']:
+        _, values = load_series(metrics_dir, metric, cutoff_time)
+        metrics['system'][metric].extend(values.tolist())
     
     # Set defaults if no data found
     if metrics['quality'] is None:
@@ -65,3 +258,94 @@ def load_metrics(metrics_dir: str, time_range: str) -> Dict[str, Any]:
         }
     
     return metrics
+
+def _bucket(values: np.ndarray, index: np.ndarray, buckets: int, agg: str) -> np.ndarray:
+    """Aggregate values into buckets by index; empty buckets are NaN"""
+    counts = np.bincount(index, minlength=buckets).astype(np.float64)
+    if agg == 'count':
+        return counts
+    
+    result = np.full(buckets, np.nan)
+    filled = counts > 0
+    if agg in ('mean', 'sum'):
+        sums = np.bincount(index, weights=values, minlength=buckets)
+        result[filled] = sums[filled] / counts[filled] if agg == 'mean' else sums[filled]
+    elif agg == 'max':
+        result[filled] = -np.inf
+        np.maximum.at(result, index, values)
+    elif agg == 'min':
+        result[filled] = np.inf
+        np.minimum.at(result, index, values)
+    else:
+        # Exact percentile per bucket over the sorted samples
+        q = float(agg[1:]) / 100
+        order = np.lexsort((values, index))
+        groups = np.split(values[order], np.cumsum(counts[:-1]).astype(np.int64))
+        for i in np.flatnonzero(filled):
+            result[i] = np.quantile(groups[i], q)
+    return result
+
+def query_metrics(metrics_dir: str, start: datetime, end: Optional[datetime] = None,
+                  step='1m', agg: str = 'mean', names: Optional[List[str]] = None,
+                  workers: Optional[int] = None) -> Dict[str, Any]:
+    """Query metrics over [start, end) as aligned, bucketed arrays
+
+    Samples from JSON snapshots, the SQLite store and compressed series
+    files are grouped into ``step``-wide buckets starting at ``start`` and
+    reduced with ``agg`` (mean, max, min, count, sum or a percentile such
+    as 'p95'). Every series in the result has one value per bucket, NaN
+    where a bucket has no samples. Metric names are 'section.metric',
+    e.g. 'performance.response_time'.
+    """
+    if agg not in AGGREGATIONS and not re.fullmatch(r'p\d+(\.\d+)?', agg):
+        raise ValueError(f"Unknown aggregation: {agg}")
+    end = end or datetime.now()
+    step_seconds = parse_duration(step).total_seconds()
+    if step_seconds <= 0 or end <= start:
+        raise ValueError("Query needs a positive step and end after start")
+    
+    names = names or [f'{section}.{metric}' for section, metrics in SNAPSHOT_SERIES.items()
+                      for metric in metrics]
+    start_ts = start.timestamp()
+    buckets = math.ceil((end.timestamp() - start_ts) / step_seconds)
+    samples = {name: ([], []) for name in names}
+    
+    # Snapshot values share the snapshot timestamp
+    entries = snapshot_entries(metrics_dir, start=start, end=end)
+    for snapshot in parse_snapshot_files([entry['path'] for entry in entries], workers):
+        ts = snapshot['timestamp'].timestamp()
+        for name in names:
+            section, metric = name.split('.', 1)
+            values = snapshot['series'].get(section, {}).get(metric)
+            if values is not None and len(values):
+                samples[name][0].append(np.full(len(values), ts))
+                samples[name][1].append(values)
+    
+    if os.path.exists(os.path.join(metrics_dir, SQLITE_FILENAME)):
+        with SQLiteMetricsStore(metrics_dir) as store:
+            for name in names:
+                ts, values = store.load_samples(name, start, end)
+                samples[name][0].append(ts)
+                samples[name][1].append(values)
+    
+    for name in names:
+        section, metric = name.split('.', 1)
+        if section == 'system':
+            ts, values = load_series(metrics_dir, metric, start, end)
+            samples[name][0].append(ts)
+            samples[name][1].append(values)
+    
+    series = {}
+    for name, (ts_parts, value_parts) in samples.items():
+        ts = np.concatenate(ts_parts) if ts_parts else np.zeros(0)
+        values = np.concatenate(value_parts) if value_parts else np.zeros(0)
+        index = np.floor((ts - start_ts) / step_seconds).astype(np.int64)
+        keep = (index >= 0) & (index < buckets) & np.isfinite(values)
+        series[name] = _bucket(values[keep], index[keep], buckets, agg)
+    
+    return {
+        'timestamps': start_ts + np.arange(buckets) * step_seconds,
+        'step': step_seconds,
+        'agg': agg,
+        'series': series
+    }
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+import numpy as np
+
+# Default memory budget for parsed metrics files
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory held by a parsed value"""
+    if isinstance(value, np.ndarray):
+        # getsizeof already counts the buffer of arrays that own their data
+        return max(sys.getsizeof(value), value.nbytes)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            estimate_size(k) + estimate_size(v) for k, v in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+class ParseCache:
+    """Process-wide LRU cache of parsed metrics files
+
+    Entries are keyed by ``(path, mtime_ns, size)``, so a file is parsed
+    again only when it changes on disk. The least recently used entries are
+    evicted once the estimated size of all entries exceeds ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._keys = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        """Estimated bytes held by cached entries"""
+        return self._bytes
+
+    def lookup(self, path: str) -> Tuple[Tuple[str, int, int], Any]:
+        """Get the cache key for path and its cached value (None on a miss)"""
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, self._entries[key][0]
+            self.misses += 1
+            return key, None
+
+    def get(self, path: str, loader: Callable[[str], Any]) -> Any:
+        """Get the parsed contents of path, calling loader on a miss"""
+        key, value = self.lookup(path)
+        if value is None:
+            # Parse outside the lock so concurrent readers of other files proceed
+            value = loader(path)
+            self.put(key, value)
+        return value
+
+    def put(self, key: Tuple[str, int, int], value: Any):
+        """Store a parsed value, replacing any older version of the file"""
+        size = estimate_size(value)
+        with self._lock:
+            stale = self._keys.get(key[0])
+            if stale is not None and stale in self._entries:
+                self._bytes -= self._entries.pop(stale)[1]
+            if size > self.max_bytes:
+                self._keys.pop(key[0], None)
+                return
+            self._entries[key] = (value, size)
+            self._keys[key[0]] = key
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until within budget (lock held)"""
+        while self._bytes > self.max_bytes and self._entries:
+            (path, _, _), (_, size) = self._entries.popitem(last=False)
+            self._keys.pop(path, None)
+            self._bytes -= size
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get hit/miss counters and current usage"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+# Shared by every load_metrics caller in the process
+PARSE_CACHE = ParseCache(int(os.environ.get('METRICS_CACHE_BYTES', DEFAULT_CACHE_BYTES)))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+import os
+import atexit
+import socket
+import threading
+from time import monotonic, perf_counter_ns
+from typing import Optional
+
+# Set by TestWorkflowRunner for test subprocesses when a daemon is running
+ADDRESS_ENV = 'METRICS_DAEMON_ADDR'
+
+# Largest batched datagram: fits an Ethernet MTU for UDP
+MAX_PACKET_BYTES = {'udp': 1432, 'unix': 8192}
+
+def parse_address(address: str):
+    """Split 'udp://host:port' or 'unix:///path' into (family, sockaddr)"""
+    if address.startswith('unix://'):
+        return socket.AF_UNIX, address[len('unix://'):]
+    if address.startswith('udp://'):
+        address = address[len('udp://'):]
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid metrics daemon address: {address}")
+    return socket.AF_INET, (host, int(port))
+
+class MetricsClient:
+    """Fire-and-forget StatsD-style client for the local metrics daemon
+
+    Metric lines are batched into datagrams of up to MAX_PACKET_BYTES and
+    sent from a non-blocking socket when a batch is full, ``max_delay``
+    seconds after the previous send, on ``flush`` and at exit. Send errors
+    (no daemon, full socket buffer) are counted in ``dropped`` and never
+    raised, so instrumented tests behave the same with or without a
+    daemon. Without an address (argument or METRICS_DAEMON_ADDR) every
+    call is a no-op.
+    """
+
+    def __init__(self, address: Optional[str] = None, prefix: str = '',
+                 max_delay: float = 1.0):
+        address = address or os.environ.get(ADDRESS_ENV)
+        self.prefix = prefix
+        self.max_delay = max_delay
+        self.dropped = 0
+        self.sock = None
+        self._lines = []
+        self._size = 0
+        self._last_send = monotonic()
+        self._lock = threading.Lock()
+        if address:
+            family, self.sockaddr = parse_address(address)
+            self.max_packet = MAX_PACKET_BYTES['unix' if family == socket.AF_UNIX else 'udp']
+            self.sock = socket.socket(family, socket.SOCK_DGRAM)
+            self.sock.setblocking(False)
+            atexit.register(self.close)
+
+    @property
+    def enabled(self) -> bool:
+        return self.sock is not None
+
+    def _send(self, line: str):
+        if self.sock is None:
+            return
+        data = line.encode()
+        with self._lock:
+            full = self._size + len(data) + 1 > self.max_packet
+        if full:
+            self.flush()
+        with self._lock:
+            self._lines.append(data)
+            self._size += len(data) + 1
+            due = monotonic() - self._last_send >= self.max_delay
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Send the pending batch"""
+        with self._lock:
+            if self.sock is None or not self._lines:
+                return
+            lines, self._lines, self._size = self._lines, [], 0
+            self._last_send = monotonic()
+        try:
+            self.sock.sendto(b'\n'.join(lines), self.sockaddr)
+        except OSError:
+            self.dropped += len(lines)
+
+    def incr(self, name: str, value: float = 1, rate: float = 1.0):
+        """Increment a counter; rate < 1 marks a sampled count"""
+        suffix = f'|@{rate}' if rate < 1.0 else ''
+        self._send(f'{self.prefix}{name}:{value}|c{suffix}')
+
+    def gauge(self, name: str, value: float):
+        """Set a gauge to its latest value"""
+        line = f'{self.prefix}{name}:{value}|g'
+        if value < 0:
+            # A signed value is a relative change, so reset to 0 first (as
+            # StatsD clients do); one send keeps both lines in one datagram
+            line = f'{self.prefix}{name}:0|g\n{line}'
+        self._send(line)
+
+    def timing(self, name: str, seconds: float):
+        """Record a duration (sent in milliseconds, as StatsD does)"""
+        self._send(f'{self.prefix}{name}:{seconds * 1000:.6f}|ms')
+
+    def timer(self, name: str) -> '_ClientTimer':
+        """Time a block: ``with client.timer('name'): ...``"""
+        return _ClientTimer(self, name)
+
+    def close(self):
+        """Send pending metrics and close the socket"""
+        if self.sock is not None:
+            self.flush()
+            self.sock.close()
+            self.sock = None
+
+class _ClientTimer:
+    __slots__ = ('client', 'name', 'start_ns')
+
+    def __init__(self, client: MetricsClient, name: str):
+        self.client = client
+        self.name = name
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.client.timing(self.name, (perf_counter_ns() - self.start_ns) / 1e9)
+        return False
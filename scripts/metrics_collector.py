@@ -2,22 +2,48 @@
 
 import os
 import json
-import time
+import argparse
+import itertools
 import logging
 import threading
 import numpy as np
 from datetime import datetime
-from collections import defaultdict
-from load_metrics import load_metrics
-import psutil
+from collections import defaultdict, deque
+from metrics_manifest import update_manifest
+from ring_buffer import RingBuffer
+from online_stats import SeriesStats
+from quantile_sketch import QuantileSketch
+from gorilla_codec import append_block, series_file
+from metrics_sampler import PeriodicSampler, SyntheticProbe
+from process_tracker import ProcessTreeTracker
+from stack_profiler import StackProfiler
+from runtime_metrics import RuntimeMonitor, RUNTIME_SERIES
+import instrumentation
+from clock import SystemClock, VirtualClock
+from shared_ring import DEFAULT_RING_NAME, SharedRingWriter
+
+# Per-sample series held in fixed-capacity ring buffers
+SAMPLE_SERIES = ['timestamps', 'cpu_usage', 'memory_usage']
+
+# Memory is sampled in MB but stored in bytes, like CIMonitor writes it to
+# the same series
+BYTES_PER_MB = 1024 * 1024
+
+# Numbers collectors created by this process, for unique run ids
+_run_counter = itertools.count(1)
 
 class MetricsCollector:
-    def __init__(self):
+    def __init__(self, store=None, incremental=False, max_samples=86400, spill=False,
+                 series_codec=None, probe=None, profile_interval=None, runtime_metrics=False,
+                 live_ring=None, clock=None, metrics_dir=None):
+        # Time source for samples, timestamps and file names; a VirtualClock
+        # makes sampling run synchronously in simulated time
+        self.clock = clock or SystemClock()
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.metrics_dir = os.path.join(
+        self.metrics_dir = metrics_dir or os.path.join(
             self.base_dir,
             "sample_analysis_results",
-            f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
+            f"test_results_{self.clock.now().strftime('%Y_%m_%d')}",
             "metrics"
         )
         os.makedirs(self.metrics_dir, exist_ok=True)
@@ -37,10 +63,29 @@ class MetricsCollector:
             console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
             self.logger.addHandler(console_handler)
         
+        # Sampled series are bounded to max_samples (a day at 1 Hz by
+        # default); timestamps are float epoch seconds. With spill=True,
+        # evicted samples go to raw float64 files under metrics_dir/spill.
+        spill_dir = os.path.join(self.metrics_dir, 'spill')
+        # Unique per collector: spill files are appended to, so two
+        # collectors created in the same second must not share them
+        self.run_id = run_id = (f"{self.clock.now().strftime('%Y%m%d_%H%M%S')}"
+                                f"_{os.getpid()}_{next(_run_counter)}")
+        
+        # With runtime_metrics=True, GC pauses and collections (through
+        # gc.callbacks), thread count and event-loop lag are sampled on
+        # every tick as extra series aligned with the timestamps
+        self.runtime = RuntimeMonitor() if runtime_metrics else None
+        self.runtime_series = list(RUNTIME_SERIES) if runtime_metrics else []
+        self.sample_series = SAMPLE_SERIES + self.runtime_series
         self.metrics = {
-            'timestamps': [],
-            'cpu_usage': [0],
-            'memory_usage': [0],
+            name: RingBuffer(
+                max_samples,
+                spill_path=os.path.join(spill_dir, f'{name}_{run_id}.f64') if spill else None
+            )
+            for name in self.sample_series
+        }
+        self.metrics.update({
             'test_results': [],
             'performance': [],
             'quality_metrics': {
@@ -48,128 +93,273 @@ class MetricsCollector:
                 'consistency': 1.0,
                 'validity': 1.0
             }
-        }
-    def __init__(self):
-        self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        self.metrics_dir = os.path.join(
-            self.base_dir,
-            "sample_analysis_results",
-            f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
-            "metrics"
-        )
-        os.makedirs(self.metrics_dir, exist_ok=True)
+        })
+        self._sample_lock = threading.Lock()
+        self.running = False
         
-        # Setup logging
-        log_file = os.path.join(self.metrics_dir, 'metrics.log')
-        self.logger = logging.getLogger(__name__)
-        self.logger.setLevel(logging.INFO)
+        # Per-thread staging queues for test results; reporting threads only
+        # append to their own queue and flush_test_metrics merges them all
+        self._staging = threading.local()
+        self._staging_queues = []
+        self._staging_lock = threading.Lock()
         
-        # Add handlers if they don't exist
-        if not self.logger.handlers:
-            file_handler = logging.FileHandler(log_file)
-            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-            self.logger.addHandler(file_handler)
-            
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-            self.logger.addHandler(console_handler)
+        # Online accumulators keep analyze_metrics/check_thresholds O(1)
+        self.stats = {'cpu': SeriesStats(), 'memory': SeriesStats()}
+        self.test_counts = {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0}
         
-        self.metrics = {
-            'timestamps': [],
-            'cpu_usage': [0],
-            'memory_usage': [0],
-            'test_results': [],
-            'performance': [],
-            'quality_metrics': {
-                'completeness': 1.0,
-                'consistency': 1.0,
-                'validity': 1.0
-            }
-        }
-        self.running = False
+        # Operation timings from the instrumentation module (timer/@timed),
+        # received while collecting; sketches since the last write are kept
+        # separately so each store snapshot holds only its own timings
+        self.timings = {}
+        self._timing_sketches = {}
+        self._timing_lock = threading.Lock()
+        
+        # Thresholds evaluated on every sample once set_thresholds is called
+        self.thresholds = None
+        self.alerts = []
+        self._active_alerts = set()
+        
+        # Optional shared backend (see metrics_store). The store and the
+        # incremental NDJSON stream only receive samples added since the
+        # last write, tracked by the write cursor.
+        self.store = store
+        self.incremental = incremental
+        self.stream_file = None
+        self._write_cursor = {'timestamps': 0, 'test_results': 0, 'performance': 0}
+        self._segment_seq = 0
+        
+        # With series_codec='gorilla', CPU/memory samples are also appended
+        # to compressed daily block files on every save
+        self.series_codec = series_codec
+        self._block_cursor = 0
+        
+        # Resource probe used by the sampler (PsutilProbe by default)
+        self.probe = probe
+        self.sampler = None
+        
+        # Child process trees (e.g. test subprocesses) polled on every tick
+        self.process_tracker = ProcessTreeTracker()
+        
+        # Opt-in stack sampling on the collector thread; collapsed stacks
+        # are saved as metrics_<run_id>.folded next to the metrics files
+        self.profile_interval = profile_interval
+        self.profiler = StackProfiler() if profile_interval else None
+        
+        # With live_ring set (True for the default name), every sample is
+        # also published to a shared-memory ring while collecting, which
+        # dashboards in other processes read without touching the disk
+        self.live_ring_name = DEFAULT_RING_NAME if live_ring is True else live_ring
+        self.live_quality_fields = list(self.metrics['quality_metrics'])
+        self.live_fields = (['timestamp', 'cpu_usage', 'memory_usage']
+                            + self.live_quality_fields + self.runtime_series)
+        self.live_ring = None
         
     def start_collection(self, interval=1):
-        """Start collecting metrics"""
+        """Start collecting metrics every interval seconds (may be < 0.1)"""
         self.running = True
-        self.collection_thread = threading.Thread(
-            target=self._collect_metrics,
-            args=(interval,)
-        )
-        self.collection_thread.start()
+        if self.runtime is not None:
+            self.runtime.start()
+        if self.live_ring_name and self.live_ring is None:
+            self.live_ring = SharedRingWriter(self.live_fields, name=self.live_ring_name)
+        self.sampler = PeriodicSampler(self._sample_tick, interval, probe=self.probe,
+                                       logger=self.logger, clock=self.clock)
+        if self.profiler is not None:
+            self.sampler.add_task(self.profiler.sample, self.profile_interval)
+        instrumentation.add_listener(self.record_timing)
+        self.sampler.start()
+        
+    def _sample_tick(self, timestamp, cpu, memory):
+        """Sampler callback: record system usage and poll tracked processes"""
+        runtime = self.runtime.sample() if self.runtime is not None else None
+        self.record_sample(timestamp, cpu, memory, runtime)
+        if self.process_tracker.tracked:
+            self.process_tracker.poll()
+        
+    def track_process(self, pid):
+        """Attribute pid and its descendants' resource usage to one test"""
+        self.process_tracker.track(pid)
+        
+    def release_process(self, pid, rusage=None):
+        """Stop tracking pid and get its tree's CPU, RSS, I/O and context switches"""
+        return self.process_tracker.release(pid, rusage)
+        
+    def attach_event_loop(self, loop=None):
+        """Record the lag of an asyncio event loop (requires runtime_metrics)"""
+        if self.runtime is not None:
+            self.runtime.attach_loop(loop)
         
     def stop_collection(self):
         """Stop collecting metrics"""
         self.running = False
-        if hasattr(self, 'collection_thread'):
-            self.collection_thread.join()
+        instrumentation.remove_listener(self.record_timing)
+        if self.sampler is not None:
+            self.sampler.stop()
+            if self.sampler.missed_ticks:
+                self.logger.warning(f"Sampler missed {self.sampler.missed_ticks} ticks")
+        if self.runtime is not None:
+            self.runtime.stop()
+        if self.live_ring is not None:
+            self.live_ring.close()
+            self.live_ring = None
+        if self.store is not None:
+            self.store.flush()
+        for name in self.sample_series:
+            self.metrics[name].flush_spill()
             
-    def _collect_metrics(self, interval):
-        """Collect system and test metrics"""
-        while self.running:
-            timestamp = datetime.now().isoformat()
-            
-            # System metrics
-            cpu = psutil.cpu_percent(interval=0.1)
-            memory = psutil.Process().memory_info().rss / 1024 / 1024  # MB
-            
-            # Store metrics
+    def record_sample(self, timestamp, cpu, memory, runtime=None):
+        """Record one system sample (epoch seconds, CPU %, memory MB)
+
+        ``runtime`` maps RUNTIME_SERIES names to values; missing values are
+        recorded as NaN so runtime series stay aligned with the timestamps.
+        """
+        runtime = runtime or {}
+        with self._sample_lock:
             self.metrics['timestamps'].append(timestamp)
             self.metrics['cpu_usage'].append(cpu)
             self.metrics['memory_usage'].append(memory)
+            for name in self.runtime_series:
+                self.metrics[name].append(runtime.get(name, float('nan')))
+            if self.live_ring is not None:
+                quality = self.metrics['quality_metrics']
+                self.live_ring.append([timestamp, cpu, memory]
+                                      + [quality.get(name, float('nan')) for name in self.live_quality_fields]
+                                      + [runtime.get(name, float('nan')) for name in self.runtime_series])
+            self.stats['cpu'].add(cpu)
+            self.stats['memory'].add(memory)
             
-            time.sleep(interval)
+        if self.thresholds is not None:
+            self._evaluate_thresholds()
             
-    def _calculate_stats(self, values):
-        """Calculate statistics for a list of values"""
-        try:
-            if not values or len(values) == 0:
-                return {'mean': 0, 'max': 0, 'p95': 0}
-                
-            values = np.array(values)
-            if not np.isfinite(values).all():
-                values = values[np.isfinite(values)]
-                
-            if len(values) == 0:
-                return {'mean': 0, 'max': 0, 'p95': 0}
-                
-            return {
-                'mean': float(np.mean(values)),
-                'max': float(np.max(values)),
-                'p95': float(np.percentile(values, 95)) if len(values) > 1 else float(np.max(values))
-            }
+    def record_timing(self, name, seconds):
+        """Record one operation timing (instrumentation listener)"""
+        with self._timing_lock:
+            stats = self.timings.get(name)
+            if stats is None:
+                stats = self.timings[name] = SeriesStats()
+                self._timing_sketches[name] = QuantileSketch()
+            stats.add(seconds)
+            self._timing_sketches[name].add(seconds)
             
-        except Exception as e:
-            self.logger.error(f"Error calculating stats: {str(e)}")
-            return {'mean': 0, 'max': 0, 'p95': 0}
+    def _drain_timing_sketches(self):
+        """Get 'timing.<name>' sketches recorded since the last write"""
+        with self._timing_lock:
+            sketches = {
+                f'timing.{name}': sketch.to_dict()
+                for name, sketch in self._timing_sketches.items() if sketch.count
+            }
+            self._timing_sketches = {name: QuantileSketch() for name in self._timing_sketches}
+        return sketches
+        
+    def set_thresholds(self, thresholds):
+        """Evaluate thresholds on every sample instead of only on demand"""
+        self.thresholds = thresholds
+        self._active_alerts = set()
+        
+    def _evaluate_thresholds(self):
+        """Record alerts for metrics that have just crossed a threshold"""
+        alerts = self.check_thresholds(self.thresholds)
+        active = {alert['metric'] for alert in alerts}
+        for alert in alerts:
+            if alert['metric'] not in self._active_alerts:
+                alert['timestamp'] = self.clock.now().isoformat()
+                self.alerts.append(alert)
+                self.logger.warning(alert['message'])
+        self._active_alerts = active
             
+    def _test_record(self, test_result, timestamp):
+        """Build the stored form of a test result"""
+        record = {
+            'timestamp': timestamp,
+            'duration': test_result.get('duration', 0),
+            'status': test_result.get('status', 'unknown'),
+            'error': test_result.get('error')
+        }
+        if 'resources' in test_result:
+            record['resources'] = test_result['resources']
+        return record, test_result.get('quality')
+        
     def collect_test_metrics(self, test_result):
         """Collect test execution metrics"""
+        if test_result:
+            self.collect_test_metrics_batch([test_result])
+            
+    def collect_test_metrics_batch(self, test_results):
+        """Collect many test results under a single lock acquisition"""
+        timestamp = self.clock.time()
+        self._merge_test_records([self._test_record(result, timestamp)
+                                  for result in test_results if result])
+        
+    def stage_test_result(self, test_result):
+        """Queue a test result on the calling thread's staging buffer
+
+        Staging never takes a shared lock; results are merged into the
+        collected metrics by flush_test_metrics (called on save).
+        """
+        if not test_result:
+            return
+        queue = getattr(self._staging, 'queue', None)
+        if queue is None:
+            queue = self._staging.queue = deque()
+            with self._staging_lock:
+                self._staging_queues.append((threading.current_thread(), queue))
+        queue.append(self._test_record(test_result, self.clock.time()))
+        
+    def flush_test_metrics(self):
+        """Merge all staged test results into the collected metrics"""
+        with self._staging_lock:
+            queues = list(self._staging_queues)
+        
+        records = []
+        for _, queue in queues:
+            # popleft is atomic, so results staged during the drain are kept
+            for _ in range(len(queue)):
+                records.append(queue.popleft())
+        
+        # Drop drained queues of finished threads (e.g. from earlier pools)
+        with self._staging_lock:
+            self._staging_queues = [(thread, queue) for thread, queue in self._staging_queues
+                                    if queue or thread.is_alive()]
+        records.sort(key=lambda record: record[0]['timestamp'])
+        self._merge_test_records(records)
+        return len(records)
+        
+    def _merge_test_records(self, records):
+        """Append test records and update counters and quality metrics"""
+        if not records:
+            return
         try:
-            metrics = load_metrics(self.metrics_dir, '1h')
+            for record, _ in records:
+                record['timestamp'] = datetime.fromtimestamp(record['timestamp']).isoformat()
+            
+            with self._sample_lock:
+                self.metrics['test_results'].extend(record for record, _ in records)
+                for record, quality in records:
+                    self._count_test_result(record['status'])
+                    # Update quality metrics if available
+                    if quality:
+                        self.metrics['quality_metrics'].update(quality)
+            
+            if self.thresholds is not None:
+                self._evaluate_thresholds()
+            self.logger.debug(f"Collected {len(records)} test results")
             
-            # Update test metrics
-            if test_result:
-                # Add test result
-                self.metrics['test_results'].append({
-                    'timestamp': datetime.now().isoformat(),
-                    'duration': test_result.get('duration', 0),
-                    'status': test_result.get('status', 'unknown'),
-                    'error': test_result.get('error')
-                })
-                
-                # Update quality metrics if available
-                if 'quality' in test_result:
-                    self.metrics['quality_metrics'].update(test_result['quality'])
-                    
-                self.logger.info(f"Collected test metrics: {test_result}")
-                
         except Exception as e:
             self.logger.error(f"Error collecting test metrics: {str(e)}")
                 
+    def _count_test_result(self, status):
+        """Update the running pass/fail/skip counters"""
+        self.test_counts['total'] += 1
+        if status == 'pass':
+            self.test_counts['passed'] += 1
+        elif status == 'fail':
+            self.test_counts['failed'] += 1
+        elif status == 'skip':
+            self.test_counts['skipped'] += 1
+                
     def collect_performance_metrics(self, perf_data):
         """Collect performance test metrics"""
         self.metrics['performance'].append({
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self.clock.now().isoformat(),
             'response_time': perf_data.get('response_time'),
             'throughput': perf_data.get('throughput'),
             'concurrent_users': perf_data.get('users')
@@ -179,32 +369,26 @@ class MetricsCollector:
         """Analyze collected metrics"""
         try:
             # Get metrics with defaults
-            cpu_metrics = self.metrics.get('cpu_usage', [0])
-            memory_metrics = self.metrics.get('memory_usage', [0])
-            test_results = self.metrics.get('test_results', [])
             quality_metrics = self.metrics.get('quality_metrics', {
                 'completeness': 1.0,
                 'consistency': 1.0,
                 'validity': 1.0
             })
             
-            # Calculate system metrics safely
+            # System and test metrics come from the online accumulators
             system_metrics = {
-                'cpu': self._calculate_stats(cpu_metrics),
-                'memory': self._calculate_stats(memory_metrics)
-            }
-            
-            # Calculate test metrics
-            test_metrics = {
-                'total': len(test_results),
-                'passed': sum(1 for r in test_results if r.get('status') == 'pass'),
-                'failed': sum(1 for r in test_results if r.get('status') == 'fail')
+                'cpu': self.stats['cpu'].summary(),
+                'memory': self.stats['memory'].summary()
             }
+            test_metrics = dict(self.test_counts)
+            with self._timing_lock:
+                timings = {name: stats.summary() for name, stats in self.timings.items()}
             
             return {
                 'system': system_metrics,
                 'tests': test_metrics,
-                'quality': quality_metrics
+                'quality': quality_metrics,
+                'timings': timings
             }
             
         except Exception as e:
@@ -212,22 +396,195 @@ class MetricsCollector:
             return {
                 'system': {'cpu': {'mean': 0, 'max': 0, 'p95': 0},
                           'memory': {'mean': 0, 'max': 0, 'p95': 0}},
-                'tests': {'total': 0, 'passed': 0, 'failed': 0},
-                'quality': {'completeness': 1.0, 'consistency': 1.0, 'validity': 1.0}
+                'tests': {'total': 0, 'passed': 0, 'failed': 0, 'skipped': 0},
+                'quality': {'completeness': 1.0, 'consistency': 1.0, 'validity': 1.0},
+                'timings': {}
             }
         
+    def _pending_delta(self):
+        """Get the samples and results added since the last write"""
+        start = dict(self._write_cursor)
+        with self._sample_lock:
+            end = {
+                'timestamps': self.metrics['timestamps'].total,
+                'test_results': len(self.metrics['test_results']),
+                'performance': len(self.metrics['performance'])
+            }
+            # Samples evicted before this flush are only kept in the spill files
+            delta = {
+                name: self.metrics[name].since(start['timestamps']).tolist()
+                for name in self.sample_series
+            }
+        
+        # Unsampled runtime values (e.g. loop lag without a loop) become null
+        for name in self.runtime_series:
+            delta[name] = [None if np.isnan(v) else v for v in delta[name]]
+        delta['timestamps'] = [datetime.fromtimestamp(t).isoformat() for t in delta['timestamps']]
+        delta['test_results'] = self.metrics['test_results'][start['test_results']:end['test_results']]
+        delta['performance'] = self.metrics['performance'][start['performance']:end['performance']]
+        return delta, end
+        
+    def _delta_sketches(self, delta, prefix=''):
+        """Build mergeable sketches for the sampled series in a delta"""
+        sketches = {}
+        for name in ['cpu_usage', 'memory_usage']:
+            sketch = QuantileSketch()
+            sketch.add_many(delta[name])
+            sketches[f'{prefix}{name}'] = sketch.to_dict()
+        return sketches
+        
+    def _serializable_metrics(self):
+        """Get the retained metrics with sampled series as JSON lists"""
+        metrics = dict(self.metrics)
+        with self._sample_lock:
+            for name in self.sample_series:
+                metrics[name] = self.metrics[name].tolist()
+        for name in self.runtime_series:
+            metrics[name] = [None if np.isnan(v) else v for v in metrics[name]]
+        metrics['timestamps'] = [datetime.fromtimestamp(t).isoformat() for t in metrics['timestamps']]
+        return metrics
+        
+    def _store_snapshot(self):
+        """Build a store snapshot from samples added since the last write"""
+        delta, end = self._pending_delta()
+        delta['memory_usage'] = [m * BYTES_PER_MB for m in delta['memory_usage']]
+        timestamps = delta['timestamps']
+        performance = delta['performance']
+        
+        snapshot = {
+            'timestamp': self.clock.now().isoformat(),
+            'source': 'metrics_collector',
+            'performance': {
+                'response_time': [p['response_time'] for p in performance if p['response_time'] is not None],
+                'throughput': [p['throughput'] for p in performance if p['throughput'] is not None],
+                'error_rate': []
+            },
+            'system': {
+                'cpu_usage': delta['cpu_usage'],
+                'memory_usage': delta['memory_usage']
+            },
+            'sample_timestamps': {
+                'system.cpu_usage': timestamps,
+                'system.memory_usage': timestamps
+            },
+            'sketches': {**self._delta_sketches(delta, prefix='system.'),
+                         **self._drain_timing_sketches()},
+            'series': {},
+            'quality': dict(self.metrics['quality_metrics']),
+            'tests': {
+                'passed': self.test_counts['passed'],
+                'failed': self.test_counts['failed'],
+                'skipped': self.test_counts['skipped']
+            }
+        }
+        
+        # Runtime series are stored as 'runtime.<name>' with their own
+        # timestamps, skipping ticks that had no value
+        for name in self.runtime_series:
+            pairs = [(t, v) for t, v in zip(timestamps, delta[name]) if v is not None]
+            if pairs:
+                snapshot['series'][f'runtime.{name}'] = [v for _, v in pairs]
+                snapshot['sample_timestamps'][f'runtime.{name}'] = [t for t, _ in pairs]
+        
+        # With the Gorilla codec the block files are the one copy of the
+        # system samples; readers merge both sources, so keeping them here
+        # too would count every sample twice
+        if self.series_codec == 'gorilla':
+            snapshot['system'] = {'cpu_usage': [], 'memory_usage': []}
+            del snapshot['sample_timestamps']['system.cpu_usage']
+            del snapshot['sample_timestamps']['system.memory_usage']
+        return snapshot, end
+        
+    def _append_segment(self):
+        """Append samples added since the last flush to the NDJSON stream"""
+        if self.stream_file is None:
+            timestamp = self.clock.now().strftime('%Y%m%d_%H%M%S')
+            self.stream_file = os.path.join(self.metrics_dir, f'metrics_stream_{timestamp}.ndjson')
+        
+        delta, end = self._pending_delta()
+        segment = {
+            'seq': self._segment_seq,
+            'timestamp': self.clock.now().isoformat(),
+            **delta,
+            'sketches': {**self._delta_sketches(delta), **self._drain_timing_sketches()},
+            'quality_metrics': dict(self.metrics['quality_metrics'])
+        }
+        with open(self.stream_file, 'a') as f:
+            f.write(json.dumps(segment, separators=(',', ':')) + '\n')
+        
+        self._segment_seq += 1
+        return self.stream_file, end
+        
+    def _append_series_blocks(self):
+        """Append samples added since the last save as Gorilla blocks"""
+        with self._sample_lock:
+            start = self._block_cursor
+            timestamps = self.metrics['timestamps'].since(start)
+            series = {
+                'cpu_usage': self.metrics['cpu_usage'].since(start),
+                'memory_usage': self.metrics['memory_usage'].since(start) * BYTES_PER_MB
+            }
+            self._block_cursor = self.metrics['timestamps'].total
+        
+        if len(timestamps) == 0:
+            return
+        
+        # Split at day boundaries so each block lands in its daily file
+        days = np.array([datetime.fromtimestamp(t).toordinal() for t in timestamps])
+        for chunk in np.split(np.arange(len(timestamps)), np.flatnonzero(np.diff(days)) + 1):
+            for name, values in series.items():
+                path = series_file(self.metrics_dir, name, timestamps[chunk[0]])
+                append_block(path, timestamps[chunk], values[chunk])
+        
     def save_metrics(self):
         """Save metrics to file"""
+        self.flush_test_metrics()
+        
+        if self.profiler is not None:
+            try:
+                profile_file = os.path.join(self.metrics_dir, f'metrics_{self.run_id}.folded')
+                if self.profiler.save(profile_file):
+                    self.logger.info(f"Profile saved to {profile_file}")
+            except Exception as e:
+                self.logger.error(f"Error saving profile: {str(e)}")
+            
+        if self.series_codec == 'gorilla':
+            try:
+                self._append_series_blocks()
+            except Exception as e:
+                self.logger.error(f"Error writing series blocks: {str(e)}")
+            
+        if self.store is not None or self.incremental:
+            try:
+                if self.store is not None:
+                    snapshot, cursor = self._store_snapshot()
+                    location = self.store.write_snapshot(snapshot)
+                else:
+                    location, cursor = self._append_segment()
+                self._write_cursor = cursor
+                self.logger.info(f"Metrics saved to {location}")
+                return location
+            except Exception as e:
+                self.logger.error(f"Error saving metrics: {str(e)}")
+                return None
+            
         try:
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            timestamp = self.clock.now().strftime('%Y%m%d_%H%M%S')
             metrics_file = os.path.join(self.metrics_dir, f'metrics_{timestamp}.json')
             
+            snapshot = {
+                'timestamp': self.clock.now().isoformat(),
+                'metrics': self._serializable_metrics(),
+                'analysis': self.analyze_metrics(),
+                'sketches': {
+                    'cpu_usage': self.stats['cpu'].sketch.to_dict(),
+                    'memory_usage': self.stats['memory'].sketch.to_dict(),
+                    **{f'timing.{name}': stats.sketch.to_dict() for name, stats in list(self.timings.items())}
+                }
+            }
             with open(metrics_file, 'w') as f:
-                json.dump({
-                    'timestamp': datetime.now().isoformat(),
-                    'metrics': dict(self.metrics),
-                    'analysis': self.analyze_metrics()
-                }, f, indent=2)
+                json.dump(snapshot, f, indent=2)
+            update_manifest(self.metrics_dir, metrics_file, snapshot)
                 
             self.logger.info(f"Metrics saved to {metrics_file}")
             return metrics_file
@@ -270,14 +627,25 @@ class MetricsCollector:
         return alerts
 
 def main():
-    collector = MetricsCollector()
+    parser = argparse.ArgumentParser(description="Collect system metrics")
+    parser.add_argument("--duration", type=float, default=10,
+                      help="Seconds to collect for")
+    parser.add_argument("--virtual", action="store_true",
+                      help="Simulate the run in virtual time with a synthetic probe")
+    args = parser.parse_args()
+    
+    if args.virtual:
+        clock = VirtualClock()
+        collector = MetricsCollector(clock=clock, probe=SyntheticProbe(clock=clock))
+    else:
+        collector = MetricsCollector()
     
     try:
         # Start metrics collection
         collector.start_collection(interval=1)
         
         # Simulate test execution
-        time.sleep(10)
+        collector.clock.sleep(args.duration)
         
         # Stop collection and save results
         collector.stop_collection()
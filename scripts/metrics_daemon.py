@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import os
+import socket
+import logging
+import argparse
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from quantile_sketch import QuantileSketch
+from metrics_store import create_store
+from metrics_client import ADDRESS_ENV, parse_address
+
+# StatsD metric types accepted by the daemon ('h' is treated as a timer)
+METRIC_TYPES = {'c': 'counter', 'g': 'gauge', 'ms': 'timer', 'h': 'timer'}
+
+def parse_packet(data: bytes) -> Tuple[List[Tuple[str, float, str, float]], int]:
+    """Parse 'name:value|type[|@rate]' lines into (metrics, bad line count)"""
+    metrics = []
+    bad = 0
+    for line in data.decode('utf-8', 'replace').splitlines():
+        if not line:
+            continue
+        try:
+            name, rest = line.split(':', 1)
+            fields = rest.split('|')
+            value = float(fields[0])
+            kind = METRIC_TYPES[fields[1]]
+            rate = float(fields[2][1:]) if len(fields) > 2 and fields[2].startswith('@') else 1.0
+            if not name or rate <= 0:
+                raise ValueError(line)
+        except (ValueError, IndexError, KeyError):
+            bad += 1
+            continue
+        # A signed gauge value is a relative change
+        if kind == 'gauge' and fields[0][:1] in '+-':
+            kind = 'gauge_delta'
+        metrics.append((name, value, kind, rate))
+    return metrics, bad
+
+class MetricsAggregator:
+    """Pre-aggregate StatsD metrics between flushes
+
+    Counters are summed (scaled up by their sample rate), gauges keep their
+    last value across flushes, and timers go into a QuantileSketch per name.
+    ``flush`` turns one interval into a metrics store snapshot.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+        self._dirty_gauges = set()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, value: float, kind: str, rate: float = 1.0):
+        with self._lock:
+            if kind == 'counter':
+                self.counters[name] = self.counters.get(name, 0.0) + value / rate
+            elif kind == 'gauge':
+                self.gauges[name] = value
+                self._dirty_gauges.add(name)
+            elif kind == 'gauge_delta':
+                self.gauges[name] = self.gauges.get(name, 0.0) + value
+                self._dirty_gauges.add(name)
+            else:
+                sketch = self.timers.get(name)
+                if sketch is None:
+                    sketch = self.timers[name] = QuantileSketch()
+                # Milliseconds on the wire, seconds in the store
+                sketch.add(value / 1000, weight=max(int(round(1 / rate)), 1))
+
+    def flush(self, timestamp: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """Get the interval's snapshot and reset it; None if nothing arrived"""
+        with self._lock:
+            counters, self.counters = self.counters, {}
+            timers, self.timers = self.timers, {}
+            gauges = {name: self.gauges[name] for name in self._dirty_gauges}
+            self._dirty_gauges = set()
+        if not (counters or timers or gauges):
+            return None
+
+        series = {}
+        for name, value in counters.items():
+            series[f'counter.{name}'] = [value]
+        for name, value in gauges.items():
+            series[f'gauge.{name}'] = [value]
+        for name, sketch in timers.items():
+            series[f'timer.{name}.count'] = [sketch.count]
+            series[f'timer.{name}.mean'] = [sketch.mean]
+            series[f'timer.{name}.p95'] = [sketch.quantile(0.95)]
+        return {
+            'timestamp': (timestamp or datetime.now()).isoformat(),
+            'source': 'metrics_daemon',
+            'series': series,
+            'sketches': {f'timer.{name}': sketch.to_dict() for name, sketch in timers.items()}
+        }
+
+class MetricsDaemon:
+    """Local StatsD-style ingestion daemon writing into a metrics store
+
+    Listens on a UDP ('udp://127.0.0.1:8125'; port 0 picks a free one) or
+    Unix datagram ('unix:///path/to.sock') socket. A receive thread parses
+    packets into a MetricsAggregator and a flush thread writes one
+    snapshot per ``flush_interval`` seconds to the store.
+    """
+
+    def __init__(self, store, address: str = 'udp://127.0.0.1:8125',
+                 flush_interval: float = 10.0, logger: Optional[logging.Logger] = None):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.logger = logger or logging.getLogger(__name__)
+        self.aggregator = MetricsAggregator()
+        self.packets = 0
+        self.bad_lines = 0
+        self.family, self._bind_address = parse_address(address)
+        self.sock = None
+        self._stop_event = threading.Event()
+        self._threads = []
+
+    @property
+    def address(self) -> str:
+        """Bound address in the form clients accept"""
+        if self.family == socket.AF_UNIX:
+            return f'unix://{self._bind_address}'
+        host, port = self.sock.getsockname() if self.sock else self._bind_address
+        return f'udp://{host}:{port}'
+
+    def environ(self) -> Dict[str, str]:
+        """Environment variables pointing child processes at this daemon"""
+        return {ADDRESS_ENV: self.address}
+
+    def start(self):
+        """Bind the socket and start the receive and flush threads"""
+        self.sock = socket.socket(self.family, socket.SOCK_DGRAM)
+        if self.family == socket.AF_UNIX and os.path.exists(self._bind_address):
+            os.unlink(self._bind_address)
+        self.sock.bind(self._bind_address)
+        # Large receive buffer so bursts from many tests are not dropped
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        self.sock.settimeout(0.2)
+        self._stop_event.clear()
+        self._threads = [
+            threading.Thread(target=self._receive_loop, daemon=True),
+            threading.Thread(target=self._flush_loop, daemon=True)
+        ]
+        for thread in self._threads:
+            thread.start()
+        self.logger.info(f"Metrics daemon listening on {self.address}")
+
+    def _receive_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                data = self.sock.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            self.handle_packet(data)
+
+    def handle_packet(self, data: bytes):
+        """Aggregate the metrics of one datagram"""
+        metrics, bad = parse_packet(data)
+        self.packets += 1
+        if bad:
+            self.bad_lines += bad
+            self.logger.debug(f"Ignored {bad} malformed metric lines")
+        for name, value, kind, rate in metrics:
+            self.aggregator.add(name, value, kind, rate)
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> Optional[str]:
+        """Write the current interval to the store"""
+        snapshot = self.aggregator.flush()
+        if snapshot is None:
+            return None
+        try:
+            location = self.store.write_snapshot(snapshot)
+            self.store.flush()
+            return location
+        except Exception as e:
+            self.logger.error(f"Error writing daemon metrics: {str(e)}")
+            return None
+
+    def stop(self):
+        """Drain pending packets, write the last interval and close the socket"""
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.sock is not None:
+            # Datagrams already queued in the socket still belong to this run
+            self.sock.setblocking(False)
+            while True:
+                try:
+                    self.handle_packet(self.sock.recv(65535))
+                except OSError:
+                    break
+            self.sock.close()
+            self.sock = None
+        self.flush()
+        if self.family == socket.AF_UNIX and os.path.exists(self._bind_address):
+            os.unlink(self._bind_address)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Local StatsD-style metrics ingestion daemon")
+    parser.add_argument("--address", default='udp://127.0.0.1:8125',
+                      help="udp://host:port or unix:///path/to.sock")
+    parser.add_argument("--store", choices=['json', 'sqlite'], default='sqlite',
+                      help="Metrics store backend")
+    parser.add_argument("--flush-interval", type=float, default=10.0,
+                      help="Seconds between aggregated writes")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    metrics_dir = os.path.join(base_dir, "sample_analysis_results",
+                               f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
+                               "metrics")
+    store = create_store(args.store, metrics_dir)
+    daemon = MetricsDaemon(store, args.address, args.flush_interval)
+    daemon.start()
+    print(f"export {ADDRESS_ENV}={daemon.address}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,22 @@
 
 import os
 import json
+import math
 import yaml
 import pandas as pd
+import psutil
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
 from dash import Dash, dcc, html
 from dash.dependencies import Input, Output
 import plotly.graph_objs as go
 from metrics_visualizer import MetricsVisualizer
+from metrics_store import SQLITE_FILENAME, SQLiteMetricsStore
+from metrics_rollup import MetricsRollup
+from metrics_manifest import files_in_range
+from load_metrics import parse_duration, query_metrics
+from runtime_metrics import RUNTIME_SERIES
+from shared_ring import DEFAULT_RING_NAME, attach
 
 class MetricsDashboard:
     def __init__(self):
@@ -247,8 +255,42 @@ class MetricsDashboard:
         with open(export_file, 'w') as f:
             json.dump(data, f, indent=2)
             
-    def get_performance_data(self, time_range: str) -> Dict[str, List[float]]:
-        """Get performance metrics data"""
+    def _time_window(self, time_range: str):
+        """Get (start, end) for a dropdown value"""
+        end = datetime.now()
+        # Dropdown values are durations ('1h', '1w') or a number of days
+        if str(time_range).isdigit():
+            return end - timedelta(days=int(time_range)), end
+        return end - parse_duration(time_range), end
+        
+    def get_performance_data(self, time_range: str, agg: str = 'mean') -> Dict[str, List[float]]:
+        """Get performance metrics data, each bucket reduced with agg (e.g. 'p95')"""
+        start, end = self._time_window(time_range)
+        
+        has_store = os.path.exists(os.path.join(self.metrics_dir, SQLITE_FILENAME))
+        if has_store:
+            # Rollups bound the number of points regardless of the range.
+            # They are written by the rollup stage (see run()), never here,
+            # so a refresh only reads
+            with SQLiteMetricsStore(self.metrics_dir) as store:
+                rollup = MetricsRollup(store)
+                if rollup.available():
+                    return {
+                        metric: rollup.query(f'performance.{metric}', start, end, self.max_points)[agg]
+                        for metric in ['response_time', 'throughput', 'error_rate']
+                    }
+        
+        if has_store or files_in_range(self.metrics_dir, start=start, end=end):
+            # Bucket server-side to the number of points the graphs render
+            metrics = ['response_time', 'throughput', 'error_rate']
+            result = query_metrics(self.metrics_dir, start, end,
+                                   step=(end - start) / self.max_points, agg=agg,
+                                   names=[f'performance.{metric}' for metric in metrics])
+            return {
+                metric: [v for v in result['series'][f'performance.{metric}'].tolist() if not math.isnan(v)]
+                for metric in metrics
+            }
+        
         # Mock data for testing
         return {
             'response_time': [100, 150, 200],
@@ -256,6 +298,44 @@ class MetricsDashboard:
             'error_rate': [0.01, 0.02, 0.015]
         }
         
+    def get_runtime_data(self, time_range: str) -> Dict[str, List[Any]]:
+        """Get GC, thread and event-loop series bucketed for charting
+
+        GC pauses and collections are summed per bucket; thread count and
+        loop lag take the bucket maximum. Empty buckets are None (gaps).
+        """
+        start, end = self._time_window(time_range)
+        step = (end - start) / self.max_points
+        gc_names = [f'runtime.{name}' for name in RUNTIME_SERIES if name.startswith('gc_')]
+        peak_names = [f'runtime.{name}' for name in RUNTIME_SERIES if not name.startswith('gc_')]
+        
+        totals = query_metrics(self.metrics_dir, start, end, step=step, agg='sum', names=gc_names)
+        peaks = query_metrics(self.metrics_dir, start, end, step=step, agg='max', names=peak_names)
+        series = {**totals['series'], **peaks['series']}
+        
+        data = {'timestamps': [datetime.fromtimestamp(t) for t in totals['timestamps']]}
+        for name, values in series.items():
+            data[name.split('.', 1)[1]] = [None if math.isnan(v) else v for v in values.tolist()]
+        return data
+        
+    def get_live_data(self) -> Dict[str, Any]:
+        """Get the latest samples from the collector's shared-memory ring
+
+        Returns an empty dict while no collector is publishing. A reader
+        whose ring stops advancing is re-attached, since a new collector
+        run publishes a new segment under the same name.
+        """
+        if self.live_reader is not None and self.live_reader.total == self._live_total:
+            self.live_reader.close()
+            self.live_reader = None
+        if self.live_reader is None:
+            self.live_reader = attach(self.live_ring_name)
+            if self.live_reader is None:
+                return {}
+        self._live_total = self.live_reader.total
+        # Zero-copy views; the graph is built long before they are overwritten
+        return self.live_reader.latest(self.live_points)
+        
     def get_quality_data(self) -> Dict[str, float]:
         """Get quality metrics data"""
         # Mock data for testing
@@ -279,10 +359,30 @@ class MetricsDashboard:
             self.base_dir,
             "workflows/yaml_workflows/dashboard_config.yml"
         )
+        self.metrics_dir = os.path.join(
+            self.base_dir,
+            "sample_analysis_results",
+            f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
+            "metrics"
+        )
+        self.max_points = 1000
+        # Seconds between rollup runs while the dashboard is served (0 when
+        # a separate 'metrics_rollup.py --interval' process does it)
+        self.rollup_interval = 60
         self.visualizer = MetricsVisualizer()
+        # Colours for the graph panels, from the visualizer's palette
+        self.layout_config = {'visualization': {'colors': {
+            **self.visualizer.colors, 'secondary': self.visualizer.colors['warning']
+        }}}
         self.app = Dash(__name__)
         self.refresh_interval = 30  # seconds
         
+        # Live view read from the collector's shared-memory ring
+        self.live_ring_name = DEFAULT_RING_NAME
+        self.live_reader = None
+        self.live_points = 300
+        self._live_total = None
+        
         # Load dashboard configuration
         self.load_config()
         
@@ -326,6 +426,11 @@ class MetricsDashboard:
                     id='interval-component',
                     interval=self.refresh_interval * 1000,
                     n_intervals=0
+                ),
+                dcc.Interval(
+                    id='live-interval',
+                    interval=1000,
+                    n_intervals=0
                 )
             ], className='header'),
             
@@ -348,8 +453,11 @@ class MetricsDashboard:
                 html.H2('Performance Metrics'),
                 html.Div([
                     dcc.Graph(id='response-time-graph'),
+                    dcc.Graph(id='live-system-graph'),
                     dcc.Graph(id='cpu-usage-gauge'),
-                    dcc.Graph(id='memory-usage-gauge')
+                    dcc.Graph(id='memory-usage-gauge'),
+                    dcc.Graph(id='gc-pause-graph'),
+                    dcc.Graph(id='runtime-graph')
                 ], className='metrics-row')
             ], className='section'),
             
@@ -390,18 +498,71 @@ class MetricsDashboard:
              Input('time-range', 'value')]
         )
         def update_graphs(n, time_range):
-            metrics = self.load_metrics(int(time_range))
+            metrics = self.get_graph_data(time_range)
             
             return (
                 self.create_response_time_graph(metrics['performance']),
-                self.create_cpu_gauge(metrics['performance']),
-                self.create_memory_gauge(metrics['performance']),
+                self.create_cpu_gauge(metrics['system']),
+                self.create_memory_gauge(metrics['system']),
                 self.create_test_results_pie(metrics['test']),
                 self.create_test_duration_graph(metrics['test']),
                 self.create_quality_score_stat(metrics['quality']),
                 self.create_coverage_gauge(metrics['quality']),
                 self.create_error_rate_graph(metrics['performance'])
             )
+            
+        @self.app.callback(
+            [Output('gc-pause-graph', 'figure'),
+             Output('runtime-graph', 'figure')],
+            [Input('interval-component', 'n_intervals'),
+             Input('time-range', 'value')]
+        )
+        def update_runtime_graphs(n, time_range):
+            data = self.get_runtime_data(time_range)
+            return self.create_gc_pause_graph(data), self.create_runtime_graph(data)
+            
+        @self.app.callback(
+            Output('live-system-graph', 'figure'),
+            [Input('live-interval', 'n_intervals')]
+        )
+        def update_live_graph(n):
+            return self.create_live_system_graph(self.get_live_data())
+
+    def get_graph_data(self, time_range: str) -> Dict[str, pd.DataFrame]:
+        """Get the frames the graph panels plot, one row per point
+
+        Performance series come from get_performance_data, so they are
+        bucketed (rollup tiers or query_metrics) to at most max_points.
+        Columns the dashboard has no source for are left empty.
+        """
+        mean = self.get_performance_data(time_range)
+        p95 = self.get_performance_data(time_range, agg='p95')
+        performance = pd.DataFrame({
+            'avg_response_time': pd.Series(mean['response_time'], dtype=float),
+            'p95_response_time': pd.Series(p95['response_time'], dtype=float),
+            'error_rate': pd.Series(mean['error_rate'], dtype=float)
+        })
+        performance['timestamp'] = performance.index
+        system = pd.DataFrame({
+            'cpu_percent': [psutil.cpu_percent(interval=None)],
+            'memory_percent': [psutil.virtual_memory().percent]
+        })
+        
+        tests = self.get_test_data()
+        test = pd.DataFrame({
+            'status': [status for status, count in tests.items() for _ in range(count)]
+        })
+        test['timestamp'] = test.index
+        test['avg_duration'] = math.nan
+        
+        # No quality history yet: the score's delta reference is itself
+        quality = self.get_quality_data()
+        quality_frame = pd.DataFrame({
+            'quality_score': [sum(quality.values()) / len(quality) * 100] * 2,
+            'coverage_percent': [math.nan] * 2
+        })
+        return {'performance': performance, 'system': system, 'test': test,
+                'quality': quality_frame}
 
     def create_response_time_graph(self, df: pd.DataFrame) -> go.Figure:
         """Create response time graph"""
@@ -465,6 +626,91 @@ class MetricsDashboard:
             )]
         )
 
+    def create_live_system_graph(self, data: Dict[str, Any]) -> go.Figure:
+        """Create live CPU and memory graph from shared-memory samples"""
+        colors = self.visualizer.colors
+        timestamps = [datetime.fromtimestamp(t) for t in data.get('timestamp', [])]
+        return go.Figure(
+            data=[
+                go.Scatter(
+                    x=timestamps,
+                    y=data.get('cpu_usage', []),
+                    name='CPU (%)',
+                    line=dict(color=colors['primary'])
+                ),
+                go.Scatter(
+                    x=timestamps,
+                    y=data.get('memory_usage', []),
+                    name='Memory (MB)',
+                    yaxis='y2',
+                    line=dict(color=colors['warning'])
+                )
+            ],
+            layout=go.Layout(
+                title='Live System Usage',
+                xaxis_title='Time',
+                yaxis_title='CPU (%)',
+                yaxis2=dict(title='Memory (MB)', overlaying='y', side='right')
+            )
+        )
+
+    def create_gc_pause_graph(self, data: Dict[str, List[Any]]) -> go.Figure:
+        """Create GC pause graph with per-generation pause time and collections"""
+        colors = self.visualizer.colors
+        figure = go.Figure(
+            data=[
+                go.Scatter(
+                    x=data['timestamps'],
+                    y=[v * 1000 if v is not None else None for v in data[f'gc_pause_gen{gen}']],
+                    name=f'Gen {gen} pause',
+                    line=dict(color=color)
+                )
+                for gen, color in enumerate([colors['primary'], colors['warning'], colors['error']])
+            ],
+            layout=go.Layout(
+                title='GC Pauses',
+                xaxis_title='Time',
+                yaxis_title='Pause (ms)',
+                yaxis2=dict(title='Collections', overlaying='y', side='right')
+            )
+        )
+        figure.add_trace(go.Bar(
+            x=data['timestamps'],
+            y=data['gc_collections'],
+            name='Collections',
+            yaxis='y2',
+            opacity=0.3,
+            marker_color=colors['success']
+        ))
+        return figure
+
+    def create_runtime_graph(self, data: Dict[str, List[Any]]) -> go.Figure:
+        """Create thread count and event-loop lag graph"""
+        colors = self.visualizer.colors
+        return go.Figure(
+            data=[
+                go.Scatter(
+                    x=data['timestamps'],
+                    y=data['thread_count'],
+                    name='Threads',
+                    line=dict(color=colors['primary'])
+                ),
+                go.Scatter(
+                    x=data['timestamps'],
+                    y=[v * 1000 if v is not None else None for v in data['loop_lag']],
+                    name='Event loop lag',
+                    yaxis='y2',
+                    line=dict(color=colors['warning'])
+                )
+            ],
+            layout=go.Layout(
+                title='Threads and Event Loop Lag',
+                xaxis_title='Time',
+                yaxis_title='Threads',
+                yaxis2=dict(title='Lag (ms)', overlaying='y', side='right')
+            )
+        )
+
     def create_test_results_pie(self, df: pd.DataFrame) -> go.Figure:
         """Create test results pie chart"""
         results = df['status'].value_counts()
@@ -552,8 +798,18 @@ class MetricsDashboard:
         )
 
     def run(self, host: str = 'localhost', port: int = 8050):
-        """Run dashboard"""
-        self.app.run_server(host=host, port=port, debug=True)
+        """Run dashboard, with the rollup stage in the background"""
+        store = rollup = None
+        if self.rollup_interval > 0 and os.path.exists(os.path.join(self.metrics_dir, SQLITE_FILENAME)):
+            store = SQLiteMetricsStore(self.metrics_dir)
+            rollup = MetricsRollup(store)
+            rollup.start(self.rollup_interval)
+        try:
+            self.app.run_server(host=host, port=port, debug=True)
+        finally:
+            if rollup is not None:
+                rollup.stop()
+                store.close()
 
 def main():
     dashboard = MetricsDashboard()
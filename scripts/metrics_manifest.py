@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_VERSION = 1
+
+_manifest_lock = threading.Lock()
+
+def is_metrics_file(file_name: str) -> bool:
+    """Check whether a file name is a metrics snapshot"""
+    return file_name.startswith('metrics_') and file_name.endswith('.json')
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """Parse an ISO timestamp, ignoring anything that is not one"""
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _timestamp_range(data: Dict[str, Any]) -> List[datetime]:
+    """Collect every timestamp recorded in a metrics snapshot"""
+    timestamps = [_parse_timestamp(data.get('timestamp'))]
+
+    # Collector snapshots also carry per-sample and per-test timestamps
+    collected = data.get('metrics')
+    if isinstance(collected, dict):
+        timestamps.extend(_parse_timestamp(t) for t in collected.get('timestamps', []))
+        timestamps.extend(
+            _parse_timestamp(r.get('timestamp'))
+            for r in collected.get('test_results', [])
+            if isinstance(r, dict)
+        )
+
+    return [t for t in timestamps if t is not None]
+
+def summarize_metrics_file(metrics_dir: str, file_path: str,
+                           data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Build the manifest entry for a metrics file"""
+    stat = os.stat(file_path)
+    entry = {
+        'path': os.path.relpath(file_path, metrics_dir),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'timestamp': None,
+        'start': None,
+        'end': None,
+        'keys': []
+    }
+
+    try:
+        if data is None:
+            with open(file_path, 'r') as f:
+                data = json.load(f)
+    except (OSError, ValueError):
+        # Unreadable files stay indexed with no keys until they change
+        return entry
+
+    if not isinstance(data, dict):
+        return entry
+
+    timestamps = _timestamp_range(data)
+    document_time = _parse_timestamp(data.get('timestamp'))
+    entry['timestamp'] = document_time.isoformat() if document_time else None
+    if timestamps:
+        entry['start'] = min(timestamps).isoformat()
+        entry['end'] = max(timestamps).isoformat()
+    entry['keys'] = sorted(data.keys())
+    return entry
+
+def _read_manifest(metrics_dir: str) -> Dict[str, Any]:
+    """Read the manifest from disk, returning an empty one if missing"""
+    manifest_file = os.path.join(metrics_dir, MANIFEST_FILE)
+    try:
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {'version': MANIFEST_VERSION, 'files': {}}
+
+def _write_manifest(metrics_dir: str, manifest: Dict[str, Any]):
+    """Atomically replace the manifest on disk"""
+    manifest_file = os.path.join(metrics_dir, MANIFEST_FILE)
+    tmp_file = f"{manifest_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+def update_manifest(metrics_dir: str, file_path: str,
+                    data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Record a freshly written metrics file in the manifest"""
+    entry = summarize_metrics_file(metrics_dir, file_path, data)
+    with _manifest_lock:
+        manifest = _read_manifest(metrics_dir)
+        manifest['files'][entry['path']] = entry
+        _write_manifest(metrics_dir, manifest)
+    return entry
+
+def refresh_manifest(metrics_dir: str) -> Dict[str, Any]:
+    """Bring the manifest in line with the files on disk
+
+    Only files that are new or whose size/mtime changed are opened, so
+    files written by tools that do not maintain the manifest are picked
+    up once and then served from the index.
+    """
+    with _manifest_lock:
+        manifest = _read_manifest(metrics_dir)
+        known = manifest['files']
+        current = {}
+        changed = False
+
+        for root, _, files in os.walk(metrics_dir):
+            for file in files:
+                if not is_metrics_file(file):
+                    continue
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, metrics_dir)
+                entry = known.get(rel_path)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+
+                if (entry is None or entry['size'] != stat.st_size
+                        or entry['mtime_ns'] != stat.st_mtime_ns):
+                    entry = summarize_metrics_file(metrics_dir, file_path)
+                    changed = True
+                current[rel_path] = entry
+
+        if changed or len(current) != len(known):
+            manifest['files'] = current
+            if os.path.isdir(metrics_dir):
+                _write_manifest(metrics_dir, manifest)
+
+        return manifest
+
+def files_in_range(metrics_dir: str, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None,
+                   required_keys: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Get manifest entries whose time range overlaps [start, end]"""
+    selected = []
+
+    for entry in refresh_manifest(metrics_dir)['files'].values():
+        if entry['start'] is None:
+            continue
+        if required_keys and not set(required_keys).issubset(entry['keys']):
+            continue
+        if start is not None and datetime.fromisoformat(entry['end']) < start:
+            continue
+        if end is not None and datetime.fromisoformat(entry['start']) > end:
+            continue
+
+        selected.append(dict(entry, path=os.path.join(metrics_dir, entry['path'])))
+
+    selected.sort(key=lambda e: e['start'])
+    return selected
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+
+import json
+import math
+import argparse
+import threading
+import numpy as np
+from datetime import datetime
+from typing import Dict, List, Any
+from metrics_store import SQLiteMetricsStore
+from quantile_sketch import QuantileSketch
+
+# Pre-aggregated tiers, finest first: (name, bucket width in seconds)
+ROLLUP_TIERS = [
+    ('1m', 60),
+    ('1h', 3600),
+    ('1d', 86400)
+]
+
+class MetricsRollup:
+    """Background stage that rolls raw store samples up into coarser tiers
+
+    Each tier bucket keeps count, sum, min, max and a QuantileSketch, so
+    long dashboard ranges can be served from a bounded number of points
+    with mean/min/max/percentiles instead of every raw sample. Progress is
+    tracked by sample rowid, so late-arriving samples are still folded
+    into the bucket they belong to.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS rollups (
+            tier TEXT NOT NULL,
+            name TEXT NOT NULL,
+            bucket REAL NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            sketch TEXT NOT NULL,
+            PRIMARY KEY (tier, name, bucket)
+        )""",
+        """CREATE TABLE IF NOT EXISTS rollup_state (
+            key TEXT PRIMARY KEY,
+            value REAL NOT NULL
+        )"""
+    ]
+
+    def __init__(self, store: SQLiteMetricsStore, tiers: List = None, batch_size: int = 50000):
+        self.store = store
+        self.tiers = tiers or ROLLUP_TIERS
+        self.batch_size = batch_size
+        self.running = False
+        self._schema_ready = False
+
+    def ensure_schema(self):
+        """Create the rollup tables (done by the stage, never by readers)"""
+        if self._schema_ready:
+            return
+        with self.store.transaction() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+        self._schema_ready = True
+
+    def available(self) -> bool:
+        """Check whether a rollup stage has written tiers for this store"""
+        return self.store.has_table('rollups')
+
+    def run_once(self) -> int:
+        """Fold all samples added since the last run into the tiers"""
+        self.ensure_schema()
+        self.store.flush()
+        processed = 0
+
+        while True:
+            with self.store.transaction() as conn:
+                row = conn.execute(
+                    "SELECT value FROM rollup_state WHERE key = 'last_rowid'"
+                ).fetchone()
+                last_rowid = int(row[0]) if row else 0
+                rows = conn.execute(
+                    "SELECT rowid, name, ts, value FROM samples WHERE rowid > ? "
+                    "ORDER BY rowid LIMIT ?",
+                    (last_rowid, self.batch_size)
+                ).fetchall()
+                if not rows:
+                    return processed
+
+                buckets = self._aggregate(rows)
+                self._merge_buckets(conn, buckets)
+                conn.execute(
+                    "INSERT OR REPLACE INTO rollup_state (key, value) VALUES ('last_rowid', ?)",
+                    (rows[-1][0],)
+                )
+            processed += len(rows)
+
+    def _aggregate(self, rows) -> Dict[tuple, Dict[str, Any]]:
+        """Aggregate a batch of raw samples into tier buckets"""
+        buckets = {}
+        for _, name, ts, value in rows:
+            if value is None or not math.isfinite(value):
+                continue
+            for tier, width in self.tiers:
+                key = (tier, name, math.floor(ts / width) * width)
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = {
+                        'count': 0, 'sum': 0.0, 'min': value, 'max': value,
+                        'sketch': QuantileSketch()
+                    }
+                bucket['count'] += 1
+                bucket['sum'] += value
+                bucket['min'] = min(bucket['min'], value)
+                bucket['max'] = max(bucket['max'], value)
+                bucket['sketch'].add(value)
+        return buckets
+
+    def _merge_buckets(self, conn, buckets: Dict[tuple, Dict[str, Any]]):
+        """Merge aggregated buckets with any rows already stored"""
+        for (tier, name, start), bucket in buckets.items():
+            existing = conn.execute(
+                "SELECT count, sum, min, max, sketch FROM rollups "
+                "WHERE tier = ? AND name = ? AND bucket = ?",
+                (tier, name, start)
+            ).fetchone()
+            if existing:
+                bucket['count'] += existing[0]
+                bucket['sum'] += existing[1]
+                bucket['min'] = min(bucket['min'], existing[2])
+                bucket['max'] = max(bucket['max'], existing[3])
+                bucket['sketch'].merge(QuantileSketch.from_dict(json.loads(existing[4])))
+            conn.execute(
+                "INSERT OR REPLACE INTO rollups (tier, name, bucket, count, sum, min, max, sketch) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (tier, name, start, bucket['count'], bucket['sum'], bucket['min'],
+                 bucket['max'], json.dumps(bucket['sketch'].to_dict()))
+            )
+
+    def select_tier(self, start: datetime, end: datetime, max_points: int) -> str:
+        """Pick the coarsest tier that still gives max_points over the range"""
+        step = (end - start).total_seconds() / max(max_points, 1)
+        selected = 'raw'
+        for tier, width in self.tiers:
+            if width <= step:
+                selected = tier
+        return selected
+
+    def query(self, name: str, start: datetime, end: datetime,
+              max_points: int = 1000, quantile: float = 0.95) -> Dict[str, Any]:
+        """Get a metric series at the density requested by a dashboard"""
+        tier = self.select_tier(start, end, max_points)
+        quantile_key = f'p{int(quantile * 100)}'
+        series = {
+            'tier': tier,
+            'timestamps': [],
+            'count': [],
+            'mean': [],
+            'min': [],
+            'max': [],
+            quantile_key: []
+        }
+
+        if tier == 'raw':
+            rows = self.store.query(
+                "SELECT ts, value FROM samples WHERE name = ? AND ts >= ? AND ts <= ? "
+                "ORDER BY ts, rowid",
+                (name, start.timestamp(), end.timestamp())
+            )
+            if len(rows) <= max_points:
+                for ts, value in rows:
+                    series['timestamps'].append(datetime.fromtimestamp(ts).isoformat())
+                    series['count'].append(1)
+                    for key in ['mean', 'min', 'max', quantile_key]:
+                        series[key].append(value)
+                return series
+            # Ranges too short for the 1m tier can still hold more raw
+            # samples than max_points; bucket them to the requested step
+            step = max((end - start).total_seconds() / max(max_points, 1), 1e-9)
+            buckets = {}
+            for ts, value in rows:
+                index = min(int((ts - start.timestamp()) / step), max_points - 1)
+                buckets.setdefault(index, []).append(value)
+            for index, values in sorted(buckets.items()):
+                values = np.array(values)
+                bucket = start.timestamp() + index * step
+                series['timestamps'].append(datetime.fromtimestamp(bucket).isoformat())
+                series['count'].append(len(values))
+                series['mean'].append(float(values.mean()))
+                series['min'].append(float(values.min()))
+                series['max'].append(float(values.max()))
+                series[quantile_key].append(float(np.quantile(values, quantile)))
+            return series
+
+        if not self.available():
+            return series
+        rows = self.store.query(
+            "SELECT bucket, count, sum, min, max, sketch FROM rollups "
+            "WHERE tier = ? AND name = ? AND bucket >= ? AND bucket <= ? ORDER BY bucket",
+            (tier, name, start.timestamp() - dict(self.tiers)[tier], end.timestamp())
+        )
+
+        for bucket, count, total, low, high, sketch in rows:
+            series['timestamps'].append(datetime.fromtimestamp(bucket).isoformat())
+            series['count'].append(count)
+            series['mean'].append(total / count)
+            series['min'].append(low)
+            series['max'].append(high)
+            series[quantile_key].append(
+                QuantileSketch.from_dict(json.loads(sketch)).quantile(quantile)
+            )
+        return series
+
+    def start(self, interval: float = 60):
+        """Run the rollup stage periodically in a background thread"""
+        self.ensure_schema()
+        self.running = True
+        self._stop_event = threading.Event()
+        self.rollup_thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self.rollup_thread.start()
+
+    def stop(self):
+        """Stop the background rollup thread"""
+        self.running = False
+        if hasattr(self, 'rollup_thread'):
+            self._stop_event.set()
+            self.rollup_thread.join()
+
+    def _run(self, interval: float):
+        """Background loop"""
+        while self.running:
+            self.run_once()
+            self._stop_event.wait(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll up stored metrics into coarser tiers")
+    parser.add_argument("metrics_dir", help="Directory containing metrics.db")
+    parser.add_argument("--interval", type=float, default=0,
+                      help="Repeat every N seconds (0 runs once)")
+    args = parser.parse_args()
+
+    with SQLiteMetricsStore(args.metrics_dir) as store:
+        rollup = MetricsRollup(store)
+        if args.interval <= 0:
+            print(f"Rolled up {rollup.run_once()} samples")
+            return
+        rollup.start(args.interval)
+        try:
+            rollup.rollup_thread.join()
+        except KeyboardInterrupt:
+            rollup.stop()
+
+if __name__ == "__main__":
+    main()
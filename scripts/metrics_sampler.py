@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import os
+import math
+import time
+import logging
+import argparse
+import threading
+from typing import Callable, Dict, Optional, Tuple
+import psutil
+from clock import SystemClock
+
+class PsutilProbe:
+    """Non-blocking system CPU and process memory probe
+
+    ``cpu_percent(interval=None)`` reports utilisation since the previous
+    call, so each sample is the CPU delta over the last sampling period
+    instead of a separate 100 ms measurement window.
+    """
+
+    def __init__(self, pid: Optional[int] = None):
+        self.process = psutil.Process(pid)
+        psutil.cpu_percent(interval=None)
+
+    def cpu_percent(self) -> float:
+        """System CPU utilisation since the previous call"""
+        return psutil.cpu_percent(interval=None)
+
+    def memory_mb(self) -> float:
+        """Resident memory of the process in MB"""
+        return self.process.memory_info().rss / 1024 / 1024
+
+    def sample(self) -> Tuple[float, float]:
+        """Get (CPU %, resident memory in MB)"""
+        return self.cpu_percent(), self.memory_mb()
+
+    def close(self):
+        pass
+
+class ProcProbe:
+    """Low-overhead probe reading /proc through descriptors kept open
+
+    /proc/stat, /proc/<pid>/stat and /proc/<pid>/statm are opened once and
+    re-read with ``os.pread`` on every sample, avoiding the per-call
+    object and open/close overhead of psutil. Samples have the same
+    fields as PsutilProbe. Linux only; see ``ProcProbe.available()``.
+    """
+
+    def __init__(self, pid: Optional[int] = None):
+        proc_dir = f'/proc/{pid}' if pid else '/proc/self'
+        self._stat_fd = os.open('/proc/stat', os.O_RDONLY)
+        self._pid_stat_fd = os.open(f'{proc_dir}/stat', os.O_RDONLY)
+        self._statm_fd = os.open(f'{proc_dir}/statm', os.O_RDONLY)
+        self._page_mb = os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+        self._ticks = os.sysconf('SC_CLK_TCK')
+        self._last_busy, self._last_total = self._system_times()
+
+    @staticmethod
+    def available() -> bool:
+        return os.path.exists('/proc/stat') and os.path.exists('/proc/self/statm')
+
+    def _read(self, fd: int) -> bytes:
+        return os.pread(fd, 4096, 0)
+
+    def _system_times(self) -> Tuple[int, int]:
+        """Busy and total jiffies from the aggregate cpu line"""
+        data = self._read(self._stat_fd)
+        fields = [int(x) for x in data[:data.index(b'\n')].split()[1:]]
+        total = sum(fields[:8])
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        return total - idle, total
+
+    def cpu_percent(self) -> float:
+        """System CPU utilisation since the previous call"""
+        busy, total = self._system_times()
+        delta_busy, delta_total = busy - self._last_busy, total - self._last_total
+        self._last_busy, self._last_total = busy, total
+        return 100.0 * delta_busy / delta_total if delta_total > 0 else 0.0
+
+    def memory_mb(self) -> float:
+        """Resident memory of the process in MB"""
+        return int(self._read(self._statm_fd).split()[1]) * self._page_mb
+
+    def process_cpu_seconds(self) -> float:
+        """User plus system CPU time consumed by the process"""
+        data = self._read(self._pid_stat_fd)
+        # Fields after the parenthesised command name; utime/stime are 14/15
+        fields = data[data.rindex(b')') + 2:].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def sample(self) -> Tuple[float, float]:
+        """Get (CPU %, resident memory in MB)"""
+        return self.cpu_percent(), self.memory_mb()
+
+    def close(self):
+        """Close the /proc descriptors"""
+        for fd in (self._stat_fd, self._pid_stat_fd, self._statm_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self._stat_fd = self._pid_stat_fd = self._statm_fd = -1
+
+class SyntheticProbe:
+    """Deterministic probe for tests and simulations
+
+    ``cpu`` and ``memory`` are constants or functions of the clock's
+    epoch time, so samples taken under a VirtualClock are reproducible.
+    """
+
+    def __init__(self, cpu=10.0, memory=64.0, clock=None):
+        self.cpu = cpu
+        self.memory = memory
+        self.clock = clock or SystemClock()
+
+    def _value(self, source) -> float:
+        return float(source(self.clock.time()) if callable(source) else source)
+
+    def cpu_percent(self) -> float:
+        return self._value(self.cpu)
+
+    def memory_mb(self) -> float:
+        return self._value(self.memory)
+
+    def sample(self) -> Tuple[float, float]:
+        """Get (CPU %, resident memory in MB)"""
+        return self.cpu_percent(), self.memory_mb()
+
+    def close(self):
+        pass
+
+PROBE_BACKENDS = {
+    'psutil': PsutilProbe,
+    'proc': ProcProbe
+}
+
+def create_probe(backend: str = 'auto', pid: Optional[int] = None):
+    """Create a probe by backend name; 'auto' prefers /proc when available"""
+    if backend == 'auto':
+        backend = 'proc' if ProcProbe.available() else 'psutil'
+    if backend not in PROBE_BACKENDS:
+        raise ValueError(f"Unknown probe backend: {backend}")
+    return PROBE_BACKENDS[backend](pid)
+
+def benchmark_probes(samples: int = 10000) -> Dict[str, float]:
+    """Measure the per-sample cost of each available backend in microseconds"""
+    results = {}
+    for name, backend in PROBE_BACKENDS.items():
+        if backend is ProcProbe and not ProcProbe.available():
+            continue
+        probe = backend()
+        try:
+            start = time.perf_counter()
+            for _ in range(samples):
+                probe.sample()
+            results[name] = (time.perf_counter() - start) / samples * 1e6
+        finally:
+            probe.close()
+    return results
+
+class PeriodicSampler:
+    """Calls ``callback(timestamp, *probe.sample())`` on a fixed grid
+
+    Ticks are scheduled on the monotonic clock at ``start + k * interval``,
+    so the period does not drift with probe cost or scheduling jitter.
+    Timestamps are the epoch time of each tick, aligned to a multiple of
+    ``interval``; runs sampled at the same interval therefore share tick
+    times and can be compared point for point. When the sampler falls
+    more than a whole period behind, the missed ticks are counted in
+    ``missed_ticks`` and skipped instead of being sampled in a burst.
+
+    Extra periodic work (such as a stack profiler) can be scheduled on the
+    same thread with ``add_task``.
+
+    With a VirtualClock no thread is started: ticks are scheduled on the
+    clock and run synchronously whenever it is advanced.
+
+    Without ``probe`` the sampler creates its own and closes it on stop.
+    """
+
+    def __init__(self, callback: Callable[..., None], interval: float = 1.0,
+                 probe=None, logger: Optional[logging.Logger] = None, clock=None):
+        if interval <= 0:
+            raise ValueError("Sampling interval must be positive")
+        self.callback = callback
+        self.interval = interval
+        self.clock = clock or SystemClock()
+        self._owns_probe = probe is None
+        self.probe = probe or create_probe()
+        self.logger = logger or logging.getLogger(__name__)
+        self.ticks = 0
+        self.missed_ticks = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._tasks = []
+
+    def add_task(self, func: Callable[[], None], interval: float):
+        """Run func every interval seconds on the sampling thread"""
+        if interval <= 0:
+            raise ValueError("Task interval must be positive")
+        self._tasks.append({'func': func, 'interval': interval, 'next': None})
+
+    def _run_tasks(self, now: float):
+        """Run scheduled tasks that are due, skipping any missed runs"""
+        for task in self._tasks:
+            if now < task['next']:
+                continue
+            try:
+                task['func']()
+            except Exception as e:
+                self.logger.error(f"Error in sampler task: {str(e)}")
+            periods = math.floor((now - task['next']) / task['interval']) + 1
+            task['next'] += periods * task['interval']
+
+    def start(self):
+        """Start sampling in a background thread (or on a virtual clock)"""
+        self._stop_event.clear()
+        if self.probe is None:
+            self.probe = create_probe()
+        self._begin()
+        if self.clock.virtual:
+            self.clock.call_at(self._next_wake(), self._virtual_step)
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the thread to exit"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._owns_probe and self.probe is not None:
+            self.probe.close()
+            self.probe = None
+
+    @property
+    def running(self) -> bool:
+        if self.clock.virtual:
+            return not self._stop_event.is_set()
+        return self._thread is not None and self._thread.is_alive()
+
+    def _begin(self):
+        """Anchor tick 0 to the next interval boundary on the wall clock"""
+        now = self.clock.time()
+        self._first_tick = math.ceil(now / self.interval) * self.interval
+        self._monotonic_start = self.clock.monotonic() + (self._first_tick - now)
+        self._tick = 0
+        for task in self._tasks:
+            task['next'] = self.clock.monotonic()
+
+    def _deadline(self) -> float:
+        return self._monotonic_start + self._tick * self.interval
+
+    def _next_wake(self) -> float:
+        return min([self._deadline()] + [task['next'] for task in self._tasks])
+
+    def _step(self):
+        """Run due tasks, then the sample tick if it is due"""
+        deadline = self._deadline()
+        if self._tasks:
+            self._run_tasks(self.clock.monotonic())
+            if self.clock.monotonic() < deadline:
+                return
+
+        behind = int((self.clock.monotonic() - deadline) / self.interval)
+        if behind > 0:
+            self.missed_ticks += behind
+            self.logger.warning(f"Sampler missed {behind} ticks")
+            self._tick += behind
+
+        try:
+            self.callback(self._first_tick + self._tick * self.interval, *self.probe.sample())
+        except Exception as e:
+            self.logger.error(f"Error sampling metrics: {str(e)}")
+        self.ticks += 1
+        self._tick += 1
+
+    def _run(self):
+        """Sampling loop"""
+        while True:
+            wake = self._next_wake()
+            if self._stop_event.wait(max(wake - self.clock.monotonic(), 0)):
+                return
+            self._step()
+
+    def _virtual_step(self):
+        """Clock callback: take a step and schedule the next one"""
+        if self._stop_event.is_set():
+            return
+        self._step()
+        self.clock.call_at(self._next_wake(), self._virtual_step)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark resource probe backends")
+    parser.add_argument("--samples", type=int, default=10000,
+                      help="Samples taken per backend")
+    args = parser.parse_args()
+
+    for name, cost in benchmark_probes(args.samples).items():
+        print(f"{name:>8}: {cost:8.2f} us/sample ({1e6 / cost:,.0f} samples/s)")
+
+if __name__ == "__main__":
+    main()
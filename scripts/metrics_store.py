@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import time
+import itertools
+import sqlite3
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Any, Optional, Tuple
+from metrics_manifest import update_manifest
+from quantile_sketch import QuantileSketch, merge_sketches
+
+SQLITE_FILENAME = 'metrics.db'
+
+# Snapshot keys with their own columns or tables; anything else (e.g.
+# 'allocations') is kept as JSON in the snapshot's details
+SNAPSHOT_FIELDS = ['timestamp', 'source', 'quality', 'tests', 'performance', 'system',
+                   'series', 'sample_timestamps', 'sketches']
+
+# Sample series kept for every snapshot, in load_metrics order
+SNAPSHOT_SERIES = {
+    'performance': ['response_time', 'throughput', 'error_rate'],
+    'system': ['cpu_usage', 'memory_usage']
+}
+
+def empty_snapshot_metrics() -> Dict[str, Any]:
+    """Get an empty metrics dict in the load_metrics shape"""
+    metrics = {
+        section: {metric: [] for metric in names}
+        for section, names in SNAPSHOT_SERIES.items()
+    }
+    metrics['quality'] = None
+    metrics['tests'] = None
+    return metrics
+
+class MetricsStore(ABC):
+    """Base class for metrics storage backends
+
+    A snapshot uses the load_metrics layout: ``timestamp``, the
+    ``performance`` and ``system`` series, and the latest ``quality`` and
+    ``tests`` summaries. An optional ``series`` dict maps further
+    ``"section.metric"`` names to sample lists. An optional
+    ``sample_timestamps`` dict maps ``"section.metric"`` to per-sample ISO
+    timestamps; samples without one take the snapshot timestamp. An
+    optional ``sketches`` dict maps the same names to serialised
+    QuantileSketch dicts for the snapshot's samples.
+    """
+
+    @abstractmethod
+    def write_snapshot(self, snapshot: Dict[str, Any]) -> Optional[str]:
+        """Persist a snapshot, returning where it was written"""
+
+    @abstractmethod
+    def load_range(self, start: datetime,
+                   end: Optional[datetime] = None) -> Tuple[Dict[str, Any], Optional[datetime]]:
+        """Load series and the latest summaries for a time window"""
+
+    def flush(self):
+        """Write out any buffered snapshots"""
+
+    def close(self):
+        """Release backend resources"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class JSONFileStore(MetricsStore):
+    """Store each snapshot as a metrics_*.json file indexed by the manifest"""
+
+    def __init__(self, metrics_dir: str):
+        self.metrics_dir = metrics_dir
+        os.makedirs(self.metrics_dir, exist_ok=True)
+
+    def write_snapshot(self, snapshot: Dict[str, Any]) -> Optional[str]:
+        """Write a snapshot file and record it in the manifest
+
+        Files are named by timestamp and source; a sequence number is added
+        when another snapshot was already written in the same second, so
+        writers sharing the directory never replace each other's files.
+        """
+        timestamp = datetime.fromisoformat(snapshot['timestamp'])
+        base = f'metrics_{timestamp.strftime("%Y%m%d_%H%M%S")}'
+        if snapshot.get('source'):
+            base += f"_{snapshot['source']}"
+        for sequence in itertools.count():
+            filename = f'{base}.json' if sequence == 0 else f'{base}_{sequence}.json'
+            filepath = os.path.join(self.metrics_dir, filename)
+            try:
+                # Exclusive create: concurrent writers cannot claim the same name
+                with open(filepath, 'x') as f:
+                    json.dump(snapshot, f, indent=2)
+                break
+            except FileExistsError:
+                continue
+        update_manifest(self.metrics_dir, filepath, snapshot)
+        return filepath
+
+    def load_range(self, start: datetime,
+                   end: Optional[datetime] = None) -> Tuple[Dict[str, Any], Optional[datetime]]:
+        """Load snapshots through load_metrics' file scan"""
+        from load_metrics import load_snapshot_files
+        return load_snapshot_files(self.metrics_dir, start, end)
+
+class SQLiteMetricsStore(MetricsStore):
+    """SQLite-backed metrics store shared by collectors and dashboards
+
+    The database runs in WAL mode so several writer processes and any
+    number of dashboard readers can use it concurrently. Snapshots are
+    buffered and inserted in one transaction once ``batch_size`` of them
+    are pending or ``flush_interval`` seconds have passed.
+    """
+
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS snapshots (
+            id INTEGER PRIMARY KEY,
+            ts REAL NOT NULL,
+            source TEXT,
+            quality TEXT,
+            tests TEXT,
+            details TEXT
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots (ts)",
+        """CREATE TABLE IF NOT EXISTS samples (
+            snapshot_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            ts REAL NOT NULL,
+            value REAL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_samples_name_ts ON samples (name, ts)",
+        """CREATE TABLE IF NOT EXISTS sketches (
+            snapshot_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            ts REAL NOT NULL,
+            sketch TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_sketches_name_ts ON sketches (name, ts)"
+    ]
+
+    def __init__(self, metrics_dir: str, source: str = None,
+                 batch_size: int = 1, flush_interval: float = 5.0):
+        self.metrics_dir = metrics_dir
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        self.db_path = os.path.join(self.metrics_dir, SQLITE_FILENAME)
+        self.source = source
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            for statement in self.SCHEMA:
+                self.conn.execute(statement)
+            # Databases created before snapshot details were kept
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(snapshots)")]
+            if 'details' not in columns:
+                self.conn.execute("ALTER TABLE snapshots ADD COLUMN details TEXT")
+
+    def write_snapshot(self, snapshot: Dict[str, Any]) -> Optional[str]:
+        """Queue a snapshot, flushing once the batch is full"""
+        with self._lock:
+            self._pending.append(snapshot)
+            due = (len(self._pending) >= self.batch_size or
+                   time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+        return self.db_path
+
+    def flush(self):
+        """Insert all pending snapshots in a single transaction"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+            if not pending:
+                return
+
+            with self.conn:
+                for snapshot in pending:
+                    self._insert_snapshot(snapshot)
+
+    def _insert_snapshot(self, snapshot: Dict[str, Any]):
+        """Insert one snapshot and its samples"""
+        ts = datetime.fromisoformat(snapshot['timestamp']).timestamp()
+        quality = snapshot.get('quality')
+        tests = snapshot.get('tests')
+        details = {key: value for key, value in snapshot.items() if key not in SNAPSHOT_FIELDS}
+        cursor = self.conn.execute(
+            "INSERT INTO snapshots (ts, source, quality, tests, details) VALUES (?, ?, ?, ?, ?)",
+            (ts, snapshot.get('source', self.source),
+             json.dumps(quality) if quality is not None else None,
+             json.dumps(tests) if tests is not None else None,
+             json.dumps(details) if details else None)
+        )
+        snapshot_id = cursor.lastrowid
+
+        # Fixed dashboard series plus any extra 'section.metric' series
+        series = {
+            f'{section}.{metric}': snapshot.get(section, {}).get(metric, [])
+            for section, names in SNAPSHOT_SERIES.items() for metric in names
+        }
+        series.update(snapshot.get('series', {}))
+        
+        sample_timestamps = snapshot.get('sample_timestamps', {})
+        rows = []
+        for name, values in series.items():
+            stamps = sample_timestamps.get(name)
+            for i, value in enumerate(values):
+                sample_ts = (datetime.fromisoformat(stamps[i]).timestamp()
+                             if stamps else ts)
+                rows.append((snapshot_id, name, sample_ts, value))
+        self.conn.executemany(
+            "INSERT INTO samples (snapshot_id, name, ts, value) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        self.conn.executemany(
+            "INSERT INTO sketches (snapshot_id, name, ts, sketch) VALUES (?, ?, ?, ?)",
+            [(snapshot_id, name, ts, json.dumps(sketch))
+             for name, sketch in snapshot.get('sketches', {}).items()]
+        )
+
+    def load_range(self, start: datetime,
+                   end: Optional[datetime] = None) -> Tuple[Dict[str, Any], Optional[datetime]]:
+        """Load series and the latest summaries with indexed range queries"""
+        self.flush()
+        start_ts = start.timestamp()
+        end_ts = end.timestamp() if end is not None else float('inf')
+        metrics = empty_snapshot_metrics()
+
+        with self._lock:
+            for section, names in SNAPSHOT_SERIES.items():
+                for metric in names:
+                    rows = self.conn.execute(
+                        "SELECT value FROM samples WHERE name = ? AND ts >= ? AND ts <= ? "
+                        "ORDER BY ts, rowid",
+                        (f'{section}.{metric}', start_ts, end_ts)
+                    )
+                    metrics[section][metric] = [row[0] for row in rows]
+
+            latest = self.conn.execute(
+                "SELECT ts, quality, tests FROM snapshots "
+                "WHERE ts >= ? AND ts <= ? AND quality IS NOT NULL AND tests IS NOT NULL "
+                "ORDER BY ts DESC LIMIT 1",
+                (start_ts, end_ts)
+            ).fetchone()
+
+        latest_timestamp = None
+        if latest:
+            latest_timestamp = datetime.fromtimestamp(latest[0])
+            metrics['quality'] = json.loads(latest[1])
+            metrics['tests'] = json.loads(latest[2])
+        return metrics, latest_timestamp
+
+    def load_samples(self, name: str, start: datetime,
+                     end: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Load (epoch timestamps, values) arrays for one metric"""
+        self.flush()
+        end_ts = end.timestamp() if end is not None else float('inf')
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ts, value FROM samples WHERE name = ? AND ts >= ? AND ts <= ? "
+                "AND value IS NOT NULL ORDER BY ts, rowid",
+                (name, start.timestamp(), end_ts)
+            ).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+        return data[:, 0], data[:, 1]
+
+    def load_sketch(self, name: str, start: datetime,
+                    end: Optional[datetime] = None) -> QuantileSketch:
+        """Merge the stored sketches for a metric over a time window"""
+        self.flush()
+        end_ts = end.timestamp() if end is not None else float('inf')
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT sketch FROM sketches WHERE name = ? AND ts >= ? AND ts <= ?",
+                (name, start.timestamp(), end_ts)
+            ).fetchall()
+        return merge_sketches(QuantileSketch.from_dict(json.loads(row[0])) for row in rows)
+
+    def query(self, sql: str, params: Tuple = ()) -> List[tuple]:
+        """Run a read-only statement on the store's connection and get all rows"""
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def has_table(self, name: str) -> bool:
+        """Check whether a table (e.g. one added by MetricsRollup) exists"""
+        return bool(self.query(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ))
+
+    @contextmanager
+    def transaction(self):
+        """Use the store's connection exclusively, committing on success
+
+        For stages that keep their own tables next to the samples, e.g.
+        ``with store.transaction() as conn: conn.execute(...)``.
+        """
+        with self._lock, self.conn:
+            yield self.conn
+
+    def load_details(self, key: str, start: datetime,
+                     end: Optional[datetime] = None) -> List[Tuple[datetime, Any]]:
+        """Get (timestamp, value) for snapshots in a window that carry details[key]"""
+        self.flush()
+        end_ts = end.timestamp() if end is not None else float('inf')
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ts, details FROM snapshots WHERE ts >= ? AND ts <= ? "
+                "AND details IS NOT NULL ORDER BY ts, id",
+                (start.timestamp(), end_ts)
+            ).fetchall()
+        details = [(datetime.fromtimestamp(ts), json.loads(data)) for ts, data in rows]
+        return [(ts, data[key]) for ts, data in details if key in data]
+
+    def close(self):
+        """Flush pending snapshots and close the connection"""
+        self.flush()
+        self.conn.close()
+
+STORE_BACKENDS = {
+    'json': JSONFileStore,
+    'sqlite': SQLiteMetricsStore
+}
+
+def create_store(backend: str, metrics_dir: str, **kwargs) -> MetricsStore:
+    """Create a metrics store by backend name"""
+    if backend not in STORE_BACKENDS:
+        raise ValueError(f"Unknown metrics store backend: {backend}")
+    return STORE_BACKENDS[backend](metrics_dir, **kwargs)
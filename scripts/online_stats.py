@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+
+import math
+from typing import Dict
+from quantile_sketch import QuantileSketch
+
+class RunningStats:
+    """Constant-memory mean/variance/min/max using Welford's algorithm"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        """Add a sample, ignoring non-finite values"""
+        if not math.isfinite(value):
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @property
+    def variance(self) -> float:
+        """Sample variance"""
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self) -> float:
+        """Sample standard deviation"""
+        return math.sqrt(self.variance)
+
+class SeriesStats:
+    """Running mean/max and a quantile sketch for one sampled series"""
+
+    def __init__(self):
+        self.running = RunningStats()
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float):
+        """Add a sample"""
+        self.running.add(value)
+        self.sketch.add(value)
+
+    def summary(self) -> Dict[str, float]:
+        """Get statistics in the _calculate_stats format"""
+        if self.running.count == 0:
+            return {'mean': 0, 'max': 0, 'p95': 0}
+        return {
+            'mean': float(self.running.mean),
+            'max': float(self.running.max),
+            'p95': self.sketch.quantile(0.95) if self.running.count > 1 else float(self.running.max)
+        }
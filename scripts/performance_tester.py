@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 
+import math
 import time
+import queue
+import asyncio
+import multiprocessing
 import threading
 import argparse
 import os
@@ -8,52 +12,315 @@ import json
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from quantile_sketch import QuantileSketch
+from metrics_collector import MetricsCollector
+from metrics_store import create_store
+from allocation_tracker import AllocationTracker
+from instrumentation import timer
+from clock import SystemClock
+
+# Load engines: a thread per concurrent user, or coroutines on one event loop
+ENGINES = ['threads', 'asyncio']
+
+# Seconds between aggregates sent by load worker processes
+REPORT_INTERVAL = 1.0
+# Seconds to wait for all worker processes to import and reach the barrier
+WORKER_START_TIMEOUT = 60
 
 class PerformanceTester:
-    def __init__(self):
+    def __init__(self, profile_hz=0, store=None, track_allocations=False, runtime_metrics=False,
+                 clock=None, probe=None, engine='threads', processes=1):
+        # engine='asyncio' runs each virtual user as a coroutine on one event
+        # loop instead of a thread per user
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown load engine: {engine}")
+        if engine == 'asyncio' and clock is not None and clock.virtual:
+            raise ValueError("The asyncio engine runs on the event loop's clock")
+        self.engine = engine
+        # processes > 1 shards each load run's users across worker processes
+        if processes > 1 and clock is not None and clock.virtual:
+            raise ValueError("Worker processes cannot share a virtual clock")
+        self.processes = max(int(processes), 1)
+        self._results_lock = threading.Lock()
+        
+        # With a VirtualClock, scenario sleeps only advance virtual time and
+        # sessions run inline, so long runs finish deterministically in
+        # milliseconds (concurrency between sessions is not modelled)
+        self.clock = clock or SystemClock()
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.results_dir = os.path.join(self.base_dir, "sample_analysis_results")
         
-    def run_load_test(self, users=100, duration=60):
-        """Run load test with specified number of concurrent users"""
-        start_time = time.time()
+        # Optional metrics store and tracemalloc leak tracking for endurance runs
+        self.store = store
+        
+        # With profile_hz > 0, load runs are sampled by a collector-thread
+        # stack profiler and the collapsed stacks saved with its metrics;
+        # runtime_metrics adds GC, thread and event-loop series
+        self.collector = None
+        if profile_hz > 0 or runtime_metrics:
+            self.collector = MetricsCollector(
+                store=store,
+                profile_interval=1 / profile_hz if profile_hz > 0 else None,
+                runtime_metrics=runtime_metrics,
+                clock=self.clock,
+                probe=probe
+            )
+        self.track_allocations = track_allocations
+        
+    def run_load_test(self, users=100, duration=60, rate=None):
+        """Run load test with specified number of concurrent users
+        
+        Without ``rate`` the two engines apply different load. The thread
+        engine starts one session every 0.1 s whatever ``users`` is (about
+        10 sessions/s), and ``users`` only caps how many overlap. The asyncio
+        engine runs ``users`` virtual users that each loop session, 0.1 s
+        think time, session, so it offers roughly ``users`` / (session time
+        + 0.1 s) sessions/s. Pass ``rate`` to offer the same load with
+        either engine.
+        
+        With ``rate`` (sessions/second) the test is open-loop: arrivals are
+        scheduled on the monotonic clock regardless of how earlier sessions
+        are doing, at most ``users`` run at once, and response times are
+        measured from each session's intended start, so time spent queued
+        behind slow sessions is counted instead of omitted.
+        
+        With ``processes`` > 1 the users (and rate) are split across worker
+        processes whose interval aggregates are merged here.
+        """
+        results = self._new_results(rate)
+        
+        if self.collector is not None:
+            self.collector.start_collection()
+        
+        if self.processes > 1:
+            self._run_sharded(results, users, duration, rate)
+        else:
+            self._run_sessions(results, users, duration, rate)
+        
+        if self.collector is not None:
+            self.collector.stop_collection()
+            self.collector.save_metrics()
+                
+        return self._analyze_results(results)
+    
+    def _new_results(self, rate=None):
         results = {
             'successful_requests': 0,
             'failed_requests': 0,
-            'response_times': [],
+            'response_times': QuantileSketch(),
             'errors': []
         }
+        if rate is not None:
+            results['target_rate'] = rate
+        return results
+    
+    def _record_session(self, results, response_time=None, error=None):
+        """Count one finished session (a response time or an error)"""
+        with self._results_lock:
+            if error is None:
+                results['successful_requests'] += 1
+                results['response_times'].add(response_time)
+            else:
+                results['failed_requests'] += 1
+                results['errors'].append(error)
+    
+    def _drain_results(self, results):
+        """Get the counts and latency sketch recorded so far and reset them"""
+        with self._results_lock:
+            aggregate = {
+                'successful_requests': results['successful_requests'],
+                'failed_requests': results['failed_requests'],
+                'response_times': results['response_times'].to_dict(),
+                'errors': results['errors']
+            }
+            results['successful_requests'] = 0
+            results['failed_requests'] = 0
+            results['response_times'] = QuantileSketch()
+            results['errors'] = []
+        return aggregate
+    
+    def _run_sessions(self, results, users, duration, rate=None):
+        """Run sessions with this process's engine, recording into results"""
+        start_time = self.clock.monotonic()
         
-        def user_session():
+        def user_session(intended_start=None):
             try:
-                session_start = time.time()
                 # Simulate user operations
-                self._execute_test_scenario()
-                response_time = time.time() - session_start
-                
-                with threading.Lock():
-                    results['successful_requests'] += 1
-                    results['response_times'].append(response_time)
+                with timer('load.user_session', self.clock) as session:
+                    self._execute_test_scenario()
+                if intended_start is None:
+                    response_time = session.elapsed
+                else:
+                    response_time = self.clock.monotonic() - intended_start
+                self._record_session(results, response_time)
             except Exception as e:
-                with threading.Lock():
-                    results['failed_requests'] += 1
-                    results['errors'].append(str(e))
+                self._record_session(results, error=str(e))
+        
+        if self.engine == 'asyncio':
+            asyncio.run(self._run_async_sessions(results, users, duration, rate))
+        elif rate is not None:
+            self._run_open_loop(user_session, users, duration, rate, start_time)
+        elif self.clock.virtual:
+            while self.clock.monotonic() - start_time < duration:
+                user_session()
+                self.clock.sleep(0.1)
+        else:
+            # Execute concurrent user sessions
+            with ThreadPoolExecutor(max_workers=users) as executor:
+                while self.clock.monotonic() - start_time < duration:
+                    executor.submit(user_session)
+                    self.clock.sleep(0.1)  # Prevent overwhelming the system
+    
+    def _run_open_loop(self, user_session, users, duration, rate, start_time):
+        """Start sessions at a constant arrival rate for duration seconds"""
+        if rate <= 0:
+            raise ValueError("Arrival rate must be positive")
+        arrivals = int(math.ceil(duration * rate))
+        
+        if self.clock.virtual:
+            # Sessions run one after another, like a single server: arrivals
+            # that fall due while one runs wait and are measured late
+            for i in range(arrivals):
+                intended_start = start_time + i / rate
+                delay = intended_start - self.clock.monotonic()
+                if delay > 0:
+                    self.clock.sleep(delay)
+                user_session(intended_start)
+            return
         
-        # Execute concurrent user sessions
         with ThreadPoolExecutor(max_workers=users) as executor:
-            while time.time() - start_time < duration:
-                executor.submit(user_session)
-                time.sleep(0.1)  # Prevent overwhelming the system
-                
-        return self._analyze_results(results)
+            for i in range(arrivals):
+                # Arrival times come from the schedule, not from when the
+                # previous submit returned, so the rate does not drift
+                intended_start = start_time + i / rate
+                delay = intended_start - self.clock.monotonic()
+                if delay > 0:
+                    self.clock.sleep(delay)
+                executor.submit(user_session, intended_start)
+    
+    async def _run_async_sessions(self, results, users, duration, rate):
+        """Run the load test's sessions as coroutines on the running loop
+        
+        Closed-loop, each of the ``users`` virtual users runs sessions back
+        to back with 0.1 s of think time, so load grows with ``users`` (see
+        run_load_test). With ``rate``, arrivals are scheduled on the loop
+        clock and a semaphore caps concurrent sessions at ``users``.
+        """
+        loop = asyncio.get_running_loop()
+        if self.collector is not None:
+            self.collector.attach_event_loop(loop)
+        start_time = loop.time()
+        deadline = start_time + duration
+        
+        async def user_session(intended_start=None):
+            try:
+                with timer('load.user_session') as session:
+                    await self._execute_test_scenario_async()
+                if intended_start is None:
+                    response_time = session.elapsed
+                else:
+                    response_time = loop.time() - intended_start
+                self._record_session(results, response_time)
+            except Exception as e:
+                self._record_session(results, error=str(e))
+        
+        if rate is None:
+            async def virtual_user(offset):
+                # Stagger the first sessions so users do not start in lockstep
+                await asyncio.sleep(offset)
+                while loop.time() < deadline:
+                    await user_session()
+                    await asyncio.sleep(0.1)
+            
+            await asyncio.gather(*(virtual_user(0.1 * i / users) for i in range(users)))
+            return
+        
+        if rate <= 0:
+            raise ValueError("Arrival rate must be positive")
+        limit = asyncio.Semaphore(users)
+        
+        async def arrival(intended_start):
+            async with limit:
+                await user_session(intended_start)
+        
+        tasks = []
+        for i in range(int(math.ceil(duration * rate))):
+            intended_start = start_time + i / rate
+            delay = intended_start - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(arrival(intended_start)))
+        await asyncio.gather(*tasks)
     
-    def run_stress_test(self, start_users=100, max_users=1000, step=100):
+    def _run_sharded(self, results, users, duration, rate=None):
+        """Split the users across worker processes and merge their reports
+        
+        Workers are spawned (no threads inherited from this process), wait
+        on a barrier until all of them are ready so the load starts at
+        once, and every REPORT_INTERVAL seconds put their counts and a
+        serialized latency sketch on a queue; the sketches merge exactly.
+        """
+        # Never more workers than users: an empty shard would still run
+        # sessions and add load nobody asked for
+        processes = max(min(self.processes, users), 1)
+        ctx = multiprocessing.get_context('spawn')
+        barrier = ctx.Barrier(processes + 1)
+        reports = ctx.Queue()
+        shares = [users // processes + (1 if i < users % processes else 0)
+                  for i in range(processes)]
+        workers = []
+        for index, share in enumerate(shares):
+            options = {
+                'engine': self.engine,
+                'users': share,
+                'duration': duration,
+                # Each worker takes an equal part of the arrival rate, offset
+                # so that the combined arrivals stay evenly spaced
+                'rate': rate / processes if rate is not None else None,
+                'offset': index / rate if rate is not None else 0.0
+            }
+            worker = ctx.Process(target=_load_worker, args=(index, options, barrier, reports),
+                                 daemon=True)
+            worker.start()
+            workers.append(worker)
+        
+        # Wait for every worker to reach the barrier, giving up early if one dies
+        deadline = time.monotonic() + WORKER_START_TIMEOUT
+        while barrier.n_waiting < len(workers):
+            if time.monotonic() > deadline or any(w.exitcode is not None for w in workers):
+                barrier.abort()
+                for worker in workers:
+                    worker.terminate()
+                raise RuntimeError("Load worker processes failed to start")
+            time.sleep(0.05)
+        barrier.wait()
+        
+        finished = 0
+        while finished < len(workers):
+            try:
+                report = reports.get(timeout=REPORT_INTERVAL)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in workers):
+                    break
+                continue
+            results['successful_requests'] += report['successful_requests']
+            results['failed_requests'] += report['failed_requests']
+            results['response_times'].merge(QuantileSketch.from_dict(report['response_times']))
+            results['errors'].extend(report['errors'])
+            finished += report['final']
+        
+        for worker in workers:
+            worker.join()
+        if finished < len(workers):
+            results['errors'].append(f"{len(workers) - finished} load workers exited early")
+    
+    def run_stress_test(self, start_users=100, max_users=1000, step=100, rate=None):
         """Run stress test with increasing user load"""
         stress_results = []
         
         for num_users in range(start_users, max_users + 1, step):
             print(f"Testing with {num_users} users...")
-            result = self.run_load_test(users=num_users, duration=30)
+            result = self.run_load_test(users=num_users, duration=30, rate=rate)
             result['num_users'] = num_users
             stress_results.append(result)
             
@@ -64,21 +331,50 @@ class PerformanceTester:
                 
         return stress_results
     
-    def run_endurance_test(self, users=100, duration=3600):
+    def run_endurance_test(self, users=100, duration=3600, interval=300, rate=None):
         """Run endurance test for extended period"""
-        start_time = time.time()
+        start_time = self.clock.monotonic()
         interval_results = []
+        tracker = AllocationTracker() if self.track_allocations else None
+        if tracker is not None:
+            tracker.start()
         
-        while time.time() - start_time < duration:
-            result = self.run_load_test(users=users, duration=300)  # 5-minute intervals
-            interval_results.append(result)
-            
-            if self._check_degradation(result):
-                print("Performance degradation detected during endurance test")
-                break
+        try:
+            while self.clock.monotonic() - start_time < duration:
+                result = self.run_load_test(users=users, duration=interval, rate=rate)
+                if tracker is not None and result is not None:
+                    # Heap growth over the interval, with a leak flag across intervals
+                    result['allocations'] = tracker.checkpoint()
+                    self._store_allocations(result['allocations'])
+                    if result['allocations']['growth']['linear_growth']:
+                        print("Sustained linear memory growth detected during endurance test")
+                interval_results.append(result)
+                
+                if self._check_degradation(result):
+                    print("Performance degradation detected during endurance test")
+                    break
+        finally:
+            if tracker is not None:
+                tracker.stop()
                 
         return interval_results
     
+    def _store_allocations(self, allocations):
+        """Write traced-memory series for an endurance interval to the store"""
+        if self.store is None:
+            return
+        self.store.write_snapshot({
+            'timestamp': allocations['timestamp'],
+            'source': 'performance_tester',
+            'series': {
+                'memory.traced_bytes': [allocations['traced_bytes']],
+                'memory.traced_peak_bytes': [allocations['traced_peak_bytes']],
+                'memory.interval_growth_bytes': [allocations['interval_growth_bytes']]
+            },
+            'allocations': allocations
+        })
+        self.store.flush()
+    
     def _execute_test_scenario(self):
         """Execute a single test scenario"""
         # Simulate typical user operations
@@ -91,35 +387,61 @@ class PerformanceTester:
         for op in operations:
             op()
     
+    async def _execute_test_scenario_async(self):
+        """Execute a single test scenario as a coroutine"""
+        operations = [
+            self._simulate_database_query_async,
+            self._simulate_computation_async,
+            self._simulate_io_operation_async
+        ]
+        
+        for op in operations:
+            await op()
+    
     def _simulate_database_query(self):
         """Simulate database operation"""
-        time.sleep(np.random.normal(0.1, 0.02))  # Mean 100ms, SD 20ms
+        self.clock.sleep(np.random.normal(0.1, 0.02))  # Mean 100ms, SD 20ms
     
     def _simulate_computation(self):
         """Simulate CPU-intensive computation"""
-        time.sleep(np.random.normal(0.05, 0.01))  # Mean 50ms, SD 10ms
+        self.clock.sleep(np.random.normal(0.05, 0.01))  # Mean 50ms, SD 10ms
     
     def _simulate_io_operation(self):
         """Simulate I/O operation"""
-        time.sleep(np.random.normal(0.15, 0.03))  # Mean 150ms, SD 30ms
+        self.clock.sleep(np.random.normal(0.15, 0.03))  # Mean 150ms, SD 30ms
+    
+    async def _simulate_database_query_async(self):
+        """Simulate database operation without blocking the loop"""
+        await asyncio.sleep(np.random.normal(0.1, 0.02))
+    
+    async def _simulate_computation_async(self):
+        """Simulate CPU-intensive computation"""
+        await asyncio.sleep(np.random.normal(0.05, 0.01))
+    
+    async def _simulate_io_operation_async(self):
+        """Simulate I/O operation without blocking the loop"""
+        await asyncio.sleep(np.random.normal(0.15, 0.03))
     
     def _analyze_results(self, results):
         """Analyze test results"""
-        if not results['response_times']:
+        response_times = results['response_times']
+        if response_times.count == 0:
             return None
             
         analysis = {
             'total_requests': results['successful_requests'] + results['failed_requests'],
             'success_rate': results['successful_requests'] / (results['successful_requests'] + results['failed_requests']) * 100,
-            'avg_response_time': np.mean(results['response_times']),
-            'p95_response_time': np.percentile(results['response_times'], 95),
-            'max_response_time': max(results['response_times']),
-            'min_response_time': min(results['response_times']),
+            'avg_response_time': response_times.mean,
+            'p95_response_time': response_times.quantile(0.95),
+            'max_response_time': response_times.max,
+            'min_response_time': response_times.min,
             'error_count': len(results['errors'])
         }
+        if 'target_rate' in results:
+            analysis['target_rate'] = results['target_rate']
         
         # Save results
-        self._save_results(analysis)
+        self._save_results(analysis, response_times)
         return analysis
     
     def _check_degradation(self, result):
@@ -130,16 +452,56 @@ class PerformanceTester:
             return True
         return False
     
-    def _save_results(self, results):
+    def _save_results(self, results, response_times=None):
         """Save test results to file"""
-        timestamp = datetime.now().strftime("%Y_%m_%d_%H%M%S")
+        now = self.clock.now()
+        timestamp = now.strftime("%Y_%m_%d_%H%M%S")
         results_path = os.path.join(self.results_dir, 
-                                  datetime.now().strftime("%Y_%m_%d"),
+                                  now.strftime("%Y_%m_%d"),
                                   "performance")
         os.makedirs(results_path, exist_ok=True)
         
+        # The sketch lets percentiles be merged across runs later
+        data = dict(results)
+        if response_times is not None:
+            data['response_time_sketch'] = response_times.to_dict()
+        
         with open(os.path.join(results_path, f"perf_results_{timestamp}.json"), 'w') as f:
-            json.dump(results, f, indent=2)
+            json.dump(data, f, indent=2)
+
+def _load_worker(index, options, barrier, reports):
+    """Worker process: run a shard of the users and stream aggregates back"""
+    tester = PerformanceTester(engine=options['engine'])
+    results = tester._new_results()
+    stop = threading.Event()
+    
+    def report(final=False):
+        aggregate = tester._drain_results(results)
+        aggregate.update(worker=index, final=final)
+        reports.put(aggregate)
+    
+    def report_periodically():
+        while not stop.wait(REPORT_INTERVAL):
+            report()
+    
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        return
+    # Start reporting only once the load starts, so no empty interval
+    # reports arrive while the other workers are still spawning
+    reporter = threading.Thread(target=report_periodically, daemon=True)
+    reporter.start()
+    try:
+        if options['offset']:
+            time.sleep(options['offset'])
+        tester._run_sessions(results, options['users'], options['duration'], options['rate'])
+    except Exception as e:
+        tester._record_session(results, error=f"Load worker {index} failed: {str(e)}")
+    finally:
+        stop.set()
+        reporter.join()
+        report(final=True)
 
 def main():
     parser = argparse.ArgumentParser(description="Run performance tests")
@@ -149,16 +511,51 @@ def main():
                       help="Number of concurrent users")
     parser.add_argument("--duration", type=int, default=60,
                       help="Test duration in seconds")
+    parser.add_argument("--profile-hz", type=float, default=0,
+                      help="Sample thread stacks at this rate (0 disables profiling)")
+    parser.add_argument("--interval", type=int, default=300,
+                      help="Endurance test interval in seconds")
+    parser.add_argument("--track-allocations", action="store_true",
+                      help="Track heap growth with tracemalloc during endurance tests")
+    parser.add_argument("--store", choices=['json', 'sqlite'], default=None,
+                      help="Also write results to a metrics store")
+    parser.add_argument("--runtime-metrics", action="store_true",
+                      help="Record GC pauses, thread count and event-loop lag")
+    parser.add_argument("--engine", choices=ENGINES, default='threads',
+                      help="Run virtual users as threads or as asyncio coroutines. "
+                           "Without --rate, threads start one session per 0.1s "
+                           "(--users caps concurrency) while asyncio runs --users "
+                           "loops with 0.1s think time, so load scales with --users; "
+                           "use --rate to compare engines")
+    parser.add_argument("--processes", type=int, default=1,
+                      help="Split the users across this many worker processes")
+    parser.add_argument("--rate", type=float, default=None,
+                      help="Open-loop mode: start sessions at this rate per second "
+                           "(--users caps concurrency)")
     
     args = parser.parse_args()
-    tester = PerformanceTester()
+    store = None
+    if args.store:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        metrics_dir = os.path.join(base_dir, "sample_analysis_results",
+                                   f"test_results_{datetime.now().strftime('%Y_%m_%d')}",
+                                   "metrics")
+        store = create_store(args.store, metrics_dir)
+    tester = PerformanceTester(profile_hz=args.profile_hz, store=store,
+                               track_allocations=args.track_allocations,
+                               runtime_metrics=args.runtime_metrics,
+                               engine=args.engine, processes=args.processes)
     
     if args.type == 'load':
-        results = tester.run_load_test(users=args.users, duration=args.duration)
+        results = tester.run_load_test(users=args.users, duration=args.duration,
+                                       rate=args.rate)
     elif args.type == 'stress':
-        results = tester.run_stress_test(start_users=args.users)
+        results = tester.run_stress_test(start_users=args.users, rate=args.rate)
     else:
-        results = tester.run_endurance_test(users=args.users, duration=args.duration)
+        results = tester.run_endurance_test(users=args.users, duration=args.duration,
+                                            interval=args.interval, rate=args.rate)
+    if tester.store is not None:
+        tester.store.close()
         
     print(json.dumps(results, indent=2))
 
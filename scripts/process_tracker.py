@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import threading
+from typing import Any, Dict, Iterable, Optional
+import psutil
+
+class ProcessTreeTracker:
+    """Attribute CPU time, memory, I/O and context switches to process trees
+
+    Each tracked root PID is polled together with all of its descendants.
+    The last values seen for every process are kept, so children that exit
+    between polls still count towards the tree's totals. When the root is
+    reaped with ``os.wait4``, its rusage (which includes reaped
+    descendants) can be passed to ``release`` to cover the time since the
+    last poll.
+    """
+
+    def __init__(self):
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    def track(self, pid: int):
+        """Start tracking pid and its descendants"""
+        try:
+            root = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            root = None
+        with self._lock:
+            self._trees[pid] = {'root': root, 'processes': {}, 'peak_rss': 0,
+                                'lock': threading.Lock(), 'released': False}
+        self.poll([pid])
+
+    @property
+    def tracked(self) -> list:
+        with self._lock:
+            return list(self._trees)
+
+    def poll(self, pids: Optional[Iterable[int]] = None):
+        """Sample every tracked tree, or only the given roots"""
+        with self._lock:
+            trees = [self._trees[pid] for pid in (pids if pids is not None else self._trees)
+                     if pid in self._trees]
+        for tree in trees:
+            # The sampler thread and the test runner poll the same trees;
+            # a tree's lock keeps release() from summing it mid-update
+            with tree['lock']:
+                if not tree['released']:
+                    self._poll_tree(tree)
+
+    def _poll_tree(self, tree: Dict[str, Any]):
+        """Record the current usage of every process in a tree (lock held)"""
+        root = tree['root']
+        if root is None:
+            return
+        try:
+            processes = [root] + root.children(recursive=True)
+        except (psutil.NoSuchProcess, psutil.ZombieProcess):
+            processes = [root]
+        except psutil.AccessDenied:
+            return
+
+        rss = 0
+        for process in processes:
+            try:
+                with process.oneshot():
+                    key = (process.pid, process.create_time())
+                    cpu = process.cpu_times()
+                    memory = process.memory_info()
+                    ctx = process.num_ctx_switches()
+            except (psutil.NoSuchProcess, psutil.ZombieProcess, psutil.AccessDenied):
+                continue
+
+            usage = tree['processes'].setdefault(key, {
+                'io_read_bytes': 0,
+                'io_write_bytes': 0
+            })
+            usage.update({
+                'cpu_user': cpu.user,
+                'cpu_system': cpu.system,
+                'rss': memory.rss,
+                'ctx_switches_voluntary': ctx.voluntary,
+                'ctx_switches_involuntary': ctx.involuntary
+            })
+            try:
+                io = process.io_counters()
+                usage['io_read_bytes'] = io.read_bytes
+                usage['io_write_bytes'] = io.write_bytes
+            except (AttributeError, psutil.Error):
+                # I/O counters need extra privileges on some platforms
+                pass
+            rss += memory.rss
+
+        tree['peak_rss'] = max(tree['peak_rss'], rss)
+
+    def kill_descendants(self, pid: int):
+        """Kill the descendants of a tracked root, e.g. after a timeout"""
+        try:
+            children = psutil.Process(pid).children(recursive=True)
+        except psutil.Error:
+            return
+        for child in children:
+            try:
+                child.kill()
+            except psutil.Error:
+                pass
+
+    def release(self, pid: int, rusage=None) -> Dict[str, Any]:
+        """Stop tracking pid and get the tree's accumulated usage"""
+        with self._lock:
+            tree = self._trees.pop(pid, None)
+        if tree is None:
+            return {}
+
+        with tree['lock']:
+            self._poll_tree(tree)
+            tree['released'] = True
+        processes = tree['processes'].values()
+        usage = {
+            'cpu_user': sum(p['cpu_user'] for p in processes),
+            'cpu_system': sum(p['cpu_system'] for p in processes),
+            'peak_rss_bytes': tree['peak_rss'],
+            'io_read_bytes': sum(p['io_read_bytes'] for p in processes),
+            'io_write_bytes': sum(p['io_write_bytes'] for p in processes),
+            'ctx_switches_voluntary': sum(p['ctx_switches_voluntary'] for p in processes),
+            'ctx_switches_involuntary': sum(p['ctx_switches_involuntary'] for p in processes),
+            'processes': len(tree['processes'])
+        }
+
+        if rusage is not None:
+            # wait4 totals are exact for the root and its reaped descendants
+            usage['cpu_user'] = max(usage['cpu_user'], rusage.ru_utime)
+            usage['cpu_system'] = max(usage['cpu_system'], rusage.ru_stime)
+            usage['peak_rss_bytes'] = max(usage['peak_rss_bytes'], rusage.ru_maxrss * 1024)
+            usage['ctx_switches_voluntary'] = max(usage['ctx_switches_voluntary'], rusage.ru_nvcsw)
+            usage['ctx_switches_involuntary'] = max(usage['ctx_switches_involuntary'], rusage.ru_nivcsw)
+            usage['io_read_bytes'] = max(usage['io_read_bytes'], rusage.ru_inblock * 512)
+            usage['io_write_bytes'] = max(usage['io_write_bytes'], rusage.ru_oublock * 512)
+
+        usage['cpu_time'] = usage['cpu_user'] + usage['cpu_system']
+        return usage
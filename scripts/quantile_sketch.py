@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+import math
+from typing import Dict, Any, Iterable
+import numpy as np
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch)
+
+    Values are counted in logarithmic buckets of ratio ``gamma``, so any
+    quantile is returned within ``relative_accuracy`` of the true value.
+    Sketches built with the same accuracy can be merged exactly, which lets
+    percentiles be combined across threads, runs and files without keeping
+    raw samples. When more than ``max_bins`` buckets are in use the lowest
+    ones are collapsed, trading accuracy at the bottom of the distribution
+    for a hard memory bound.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("Relative accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self._min_indexable = 1e-9
+        self.bins = {}
+        self.negative_bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _key(self, value: float) -> int:
+        """Bucket index for a positive value"""
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        """Representative value of a bucket"""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, weight: int = 1):
+        """Add a value, ignoring non-finite ones"""
+        if not math.isfinite(value):
+            return
+        if value > self._min_indexable:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + weight
+            if len(self.bins) > self.max_bins:
+                self._collapse(self.bins)
+        elif value < -self._min_indexable:
+            key = self._key(-value)
+            self.negative_bins[key] = self.negative_bins.get(key, 0) + weight
+            if len(self.negative_bins) > self.max_bins:
+                self._collapse(self.negative_bins)
+        else:
+            self.zero_count += weight
+
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def add_many(self, values: Iterable[float]):
+        """Add an array of values in one vectorised pass"""
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values) == 0:
+            return
+
+        for bins, selected in ((self.bins, values[values > self._min_indexable]),
+                               (self.negative_bins, -values[values < -self._min_indexable])):
+            if len(selected) == 0:
+                continue
+            keys, counts = np.unique(np.ceil(np.log(selected) / self._log_gamma).astype(np.int64),
+                                     return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                bins[key] = bins.get(key, 0) + count
+            if len(bins) > self.max_bins:
+                self._collapse(bins)
+
+        self.zero_count += int(np.count_nonzero(np.abs(values) <= self._min_indexable))
+        self.count += len(values)
+        self.sum += float(values.sum())
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def _collapse(self, bins: Dict[int, int]):
+        """Fold the lowest buckets together to respect max_bins"""
+        keys = sorted(bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        total = sum(bins.pop(key) for key in excess)
+        target = keys[len(excess)]
+        bins[target] = bins.get(target, 0) + total
+
+    def merge(self, other: 'QuantileSketch'):
+        """Merge another sketch into this one"""
+        if not math.isclose(self.gamma, other.gamma):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for bins, other_bins in ((self.bins, other.bins),
+                                 (self.negative_bins, other.negative_bins)):
+            for key, count in other_bins.items():
+                bins[key] = bins.get(key, 0) + count
+            if len(bins) > self.max_bins:
+                self._collapse(bins)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def mean(self) -> float:
+        """Exact mean of the added values"""
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-th quantile (0 <= q <= 1)"""
+        if self.count == 0:
+            return 0.0
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative_bins, reverse=True):
+            seen += self.negative_bins[key]
+            if seen > rank:
+                return max(-self._value(key), self.min)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(self._value(key), self.max)
+        return self.max
+
+    def percentile(self, p: float) -> float:
+        """Estimate the p-th percentile (0 <= p <= 100)"""
+        return self.quantile(p / 100)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialise the sketch to a JSON-compatible dict"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'bins': {str(k): v for k, v in self.bins.items()},
+            'negative_bins': {str(k): v for k, v in self.negative_bins.items()},
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min if self.count else None,
+            'max': self.max if self.count else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuantileSketch':
+        """Rebuild a sketch serialised with to_dict"""
+        sketch = cls(data['relative_accuracy'], data.get('max_bins', 2048))
+        sketch.bins = {int(k): v for k, v in data['bins'].items()}
+        sketch.negative_bins = {int(k): v for k, v in data.get('negative_bins', {}).items()}
+        sketch.zero_count = data.get('zero_count', 0)
+        sketch.count = data['count']
+        sketch.sum = data['sum']
+        if sketch.count:
+            sketch.min = data['min']
+            sketch.max = data['max']
+        return sketch
+
+def merge_sketches(sketches: Iterable[QuantileSketch]) -> QuantileSketch:
+    """Merge several sketches into a new one"""
+    merged = None
+    for sketch in sketches:
+        if merged is None:
+            merged = QuantileSketch(sketch.relative_accuracy, sketch.max_bins)
+        merged.merge(sketch)
+    return merged if merged is not None else QuantileSketch()
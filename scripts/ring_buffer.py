@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from array import array
+from typing import Optional
+import numpy as np
+
+class RingBuffer:
+    """Fixed-capacity float64 ring buffer for sampled time series
+
+    Once ``capacity`` samples are held, each append overwrites the oldest
+    one. If ``spill_path`` is set, overwritten samples are appended to that
+    file as raw float64 values (in chronological order) instead of being
+    dropped; they are written in chunks of ``spill_chunk`` samples.
+    """
+
+    def __init__(self, capacity: int, spill_path: Optional[str] = None,
+                 spill_chunk: int = 4096):
+        if capacity <= 0:
+            raise ValueError("RingBuffer capacity must be positive")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spill_chunk = spill_chunk
+        self._data = np.zeros(capacity, dtype=np.float64)
+        self._total = 0
+        self._spill_pending = array('d')
+        self._lock = threading.Lock()
+
+    @property
+    def total(self) -> int:
+        """Number of samples ever appended"""
+        return self._total
+
+    @property
+    def evicted(self) -> int:
+        """Number of samples no longer held in memory"""
+        return self._total - len(self)
+
+    def __len__(self) -> int:
+        return min(self._total, self.capacity)
+
+    def append(self, value: float):
+        """Append a sample, evicting the oldest one when full"""
+        with self._lock:
+            pos = self._total % self.capacity
+            if self._total >= self.capacity and self.spill_path is not None:
+                self._spill_pending.append(self._data[pos])
+                if len(self._spill_pending) >= self.spill_chunk:
+                    self._flush_spill()
+            self._data[pos] = value
+            self._total += 1
+
+    def extend(self, values):
+        """Append several samples"""
+        for value in values:
+            self.append(value)
+
+    def _ordered(self) -> np.ndarray:
+        """Copy retained samples in chronological order (lock held)"""
+        if self._total <= self.capacity:
+            return self._data[:self._total].copy()
+        pos = self._total % self.capacity
+        return np.concatenate((self._data[pos:], self._data[:pos]))
+
+    def to_array(self) -> np.ndarray:
+        """Get retained samples in chronological order"""
+        with self._lock:
+            return self._ordered()
+
+    def since(self, index: int) -> np.ndarray:
+        """Get retained samples whose absolute index is at least ``index``"""
+        with self._lock:
+            values = self._ordered()
+            oldest = self._total - len(values)
+        return values[max(index - oldest, 0):]
+
+    def tolist(self) -> list:
+        """Get retained samples as a list"""
+        return self.to_array().tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        values = self.to_array()
+        return values.astype(dtype) if dtype is not None else values
+
+    def __iter__(self):
+        return iter(self.to_array())
+
+    def __getitem__(self, index):
+        return self.to_array()[index]
+
+    def _flush_spill(self):
+        """Write pending evicted samples to the spill file"""
+        if not self._spill_pending:
+            return
+        os.makedirs(os.path.dirname(self.spill_path) or '.', exist_ok=True)
+        with open(self.spill_path, 'ab') as f:
+            self._spill_pending.tofile(f)
+        self._spill_pending = array('d')
+
+    def flush_spill(self):
+        """Write any pending evicted samples to disk"""
+        with self._lock:
+            if self.spill_path is not None:
+                self._flush_spill()
+
+def read_spill(spill_path: str) -> np.ndarray:
+    """Read samples spilled by a RingBuffer"""
+    if not os.path.exists(spill_path):
+        return np.zeros(0, dtype=np.float64)
+    return np.fromfile(spill_path, dtype=np.float64)
@@ -2,11 +2,11 @@
 
 import os
 import sys
-import time
 import json
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
-import numpy as np
+from quantile_sketch import QuantileSketch
+from instrumentation import timer
 
 class TriangleTestRunner:
     def __init__(self):
@@ -58,41 +58,44 @@ class TriangleTestRunner:
     def run_performance_tests(self):
         """Run performance tests"""
         results = {
-            'response_times': [],
+            'response_times': QuantileSketch(),
             'errors': 0,
             'throughput': 0
         }
         
         # Single thread performance
-        start_time = time.time()
         iterations = 1000000
         
-        for _ in range(iterations):
-            try:
-                t0 = time.time()
-                self.triangle_area(3, 4, 5)
-                results['response_times'].append((time.time() - t0) * 1000)
-            except Exception:
-                results['errors'] += 1
+        # One Timer reused for every call, so the loop does not look up the
+        # histogram or build a timer per iteration. Throughput still includes
+        # the per-call timing and sketch update, as it always has.
+        call = timer('triangle.area')
+        with timer('triangle.single_thread') as total:
+            for _ in range(iterations):
+                try:
+                    with call:
+                        self.triangle_area(3, 4, 5)
+                    results['response_times'].add(call.elapsed * 1000)
+                except Exception:
+                    results['errors'] += 1
                 
-        total_time = time.time() - start_time
-        results['throughput'] = iterations / total_time
+        results['throughput'] = iterations / total.elapsed
         
         # Concurrent performance
         with ThreadPoolExecutor(max_workers=10) as executor:
-            start_time = time.time()
-            futures = []
-            
-            for _ in range(100):
-                futures.append(executor.submit(self.triangle_area, 3, 4, 5))
+            with timer('triangle.concurrent') as concurrent:
+                futures = []
                 
-            for future in futures:
-                try:
-                    future.result()
-                except Exception:
-                    results['errors'] += 1
+                for _ in range(100):
+                    futures.append(executor.submit(self.triangle_area, 3, 4, 5))
+                    
+                for future in futures:
+                    try:
+                        future.result()
+                    except Exception:
+                        results['errors'] += 1
                     
-        results['concurrent_time'] = time.time() - start_time
+        results['concurrent_time'] = concurrent.elapsed
         
         return results
     
@@ -100,14 +103,16 @@ class TriangleTestRunner:
         """Generate test execution report"""
         os.makedirs(results_path, exist_ok=True)
         
+        response_times = perf_results['response_times']
         report = {
             'timestamp': datetime.now().isoformat(),
             'unit_tests': unit_results,
             'performance': {
-                'avg_response_time': np.mean(perf_results['response_times']),
-                'p95_response_time': np.percentile(perf_results['response_times'], 95),
+                'avg_response_time': response_times.mean,
+                'p95_response_time': response_times.quantile(0.95),
                 'throughput': perf_results['throughput'],
-                'errors': perf_results['errors']
+                'errors': perf_results['errors'],
+                'response_time_sketch': response_times.to_dict()
             }
         }
         
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import gc
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+# Interpreter-level series recorded alongside CPU and memory
+RUNTIME_SERIES = [
+    'gc_pause_gen0',
+    'gc_pause_gen1',
+    'gc_pause_gen2',
+    'gc_collections',
+    'thread_count',
+    'loop_lag'
+]
+
+class GCMonitor:
+    """Record garbage collection pauses through ``gc.callbacks``
+
+    Pauses are accumulated per generation until ``drain`` is called, so a
+    sampler can turn them into one value per tick: the total pause time of
+    each generation and the number of collections since the last tick.
+    """
+
+    def __init__(self):
+        self._start = None
+        self._pauses = [0.0, 0.0, 0.0]
+        self._collections = 0
+        self.totals = {'collections': [0, 0, 0], 'pause_seconds': [0.0, 0.0, 0.0]}
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def _callback(self, phase: str, info: Dict[str, int]):
+        # Runs in whichever thread triggered the collection
+        if phase == 'start':
+            self._start = time.perf_counter()
+            return
+        if self._start is None:
+            return
+        pause = time.perf_counter() - self._start
+        self._start = None
+        generation = info.get('generation', 0)
+        with self._lock:
+            self._pauses[generation] += pause
+            self._collections += 1
+            self.totals['collections'][generation] += 1
+            self.totals['pause_seconds'][generation] += pause
+
+    def start(self):
+        """Register the GC callback"""
+        if not self._registered:
+            gc.callbacks.append(self._callback)
+            self._registered = True
+
+    def stop(self):
+        """Unregister the GC callback"""
+        if self._registered:
+            gc.callbacks.remove(self._callback)
+            self._registered = False
+
+    def drain(self) -> Dict[str, float]:
+        """Get pauses (seconds) per generation and collections since the last drain"""
+        with self._lock:
+            pauses, self._pauses = self._pauses, [0.0, 0.0, 0.0]
+            collections, self._collections = self._collections, 0
+        return {
+            'gc_pause_gen0': pauses[0],
+            'gc_pause_gen1': pauses[1],
+            'gc_pause_gen2': pauses[2],
+            'gc_collections': collections
+        }
+
+class LoopLagMonitor:
+    """Measure asyncio event-loop lag with a self-rescheduling timer
+
+    Every ``interval`` seconds a callback is scheduled on the loop; the
+    delay between when it was due and when it ran is the time the loop was
+    blocked. ``drain`` returns the worst lag seen since the previous call.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.loop = None
+        self._max_lag = None
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def attach(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Start measuring a loop; safe to call from any thread
+
+        Without ``loop`` this must be called from a coroutine or callback
+        on the loop to measure (it uses the running loop).
+        """
+        self.loop = loop or asyncio.get_running_loop()
+        self.loop.call_soon_threadsafe(self._schedule)
+
+    def detach(self):
+        """Stop measuring"""
+        loop, self.loop = self.loop, None
+        if loop is not None and self._handle is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._handle.cancel)
+
+    def _schedule(self):
+        if self.loop is None:
+            return
+        due = self.loop.time() + self.interval
+        self._handle = self.loop.call_at(due, self._tick, due)
+
+    def _tick(self, due: float):
+        lag = max(self.loop.time() - due, 0.0) if self.loop is not None else 0.0
+        with self._lock:
+            self._max_lag = lag if self._max_lag is None else max(self._max_lag, lag)
+        self._schedule()
+
+    def drain(self) -> Optional[float]:
+        """Worst lag in seconds since the last drain (None without a loop)"""
+        with self._lock:
+            lag, self._max_lag = self._max_lag, None
+        return lag
+
+class RuntimeMonitor:
+    """Collects GC, thread and event-loop metrics as one sample per tick"""
+
+    def __init__(self, loop_lag_interval: float = 0.05):
+        self.gc = GCMonitor()
+        self.loop_lag = LoopLagMonitor(loop_lag_interval)
+
+    def start(self):
+        self.gc.start()
+
+    def stop(self):
+        self.gc.stop()
+        self.loop_lag.detach()
+
+    def attach_loop(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Also record the lag of an asyncio event loop"""
+        self.loop_lag.attach(loop)
+
+    def sample(self) -> Dict[str, float]:
+        """Get one value per RUNTIME_SERIES name; loop_lag is NaN without a loop"""
+        values = self.gc.drain()
+        values['thread_count'] = threading.active_count()
+        lag = self.loop_lag.drain()
+        values['loop_lag'] = float('nan') if lag is None else lag
+        return values
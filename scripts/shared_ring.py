@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+import os
+import json
+from multiprocessing import shared_memory, resource_tracker
+from typing import Dict, Optional, Sequence
+import numpy as np
+
+# Name dashboards attach to when the collector publishes with the default
+DEFAULT_RING_NAME = 'test_metrics_live'
+
+MAGIC = 0x4D45545249435331  # 'METRICS1'
+VERSION = 2
+
+# Header: int64 slots, then a JSON list of field names, then the rows
+HEADER_SLOTS = ['magic', 'version', 'capacity', 'n_fields', 'seq', 'total', 'writer_pid']
+NAMES_OFFSET = 64
+NAMES_BYTES = 1024
+DATA_OFFSET = NAMES_OFFSET + NAMES_BYTES
+
+_SEQ = HEADER_SLOTS.index('seq')
+_TOTAL = HEADER_SLOTS.index('total')
+_WRITER_PID = HEADER_SLOTS.index('writer_pid')
+
+# Rings created by writers in this process (registered with its tracker)
+_owned = set()
+
+class SharedRingWriter:
+    """Publish samples to a shared-memory ring for readers in other processes
+
+    Rows of float64 fields are stored twice, at ``i % capacity`` and
+    ``i % capacity + capacity``, so the latest N rows (N <= capacity)
+    are always one contiguous slice that readers can view without
+    copying. A sequence counter is made odd while a row is written and
+    even once it is complete (a seqlock); readers use it to get a
+    consistent window without any lock shared with the writer.
+
+    There must be a single writer per ring. Creating a writer for a name
+    whose ring is still published by a live process raises
+    FileExistsError; a ring left behind by a writer that has exited is
+    replaced.
+    """
+
+    def __init__(self, fields: Sequence[str], capacity: int = 3600,
+                 name: Optional[str] = DEFAULT_RING_NAME):
+        if capacity <= 0:
+            raise ValueError("Ring capacity must be positive")
+        names = json.dumps(list(fields)).encode()
+        if len(names) > NAMES_BYTES:
+            raise ValueError("Too many ring fields")
+        self.fields = list(fields)
+        self.capacity = capacity
+        size = DATA_OFFSET + 2 * capacity * len(self.fields) * 8
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            _remove_stale_ring(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self.shm.name
+        _owned.add(self.shm._name)
+
+        self._header = np.ndarray((len(HEADER_SLOTS),), dtype=np.int64, buffer=self.shm.buf)
+        self._header[:] = [MAGIC, VERSION, capacity, len(self.fields), 0, 0, os.getpid()]
+        self.shm.buf[NAMES_OFFSET:NAMES_OFFSET + len(names)] = names
+        self._rows = np.ndarray((2 * capacity, len(self.fields)), dtype=np.float64,
+                                buffer=self.shm.buf, offset=DATA_OFFSET)
+
+    def append(self, values: Sequence[float]):
+        """Publish one row (one value per field)"""
+        header = self._header
+        total = int(header[_TOTAL])
+        pos = total % self.capacity
+        header[_SEQ] += 1
+        self._rows[pos] = values
+        self._rows[pos + self.capacity] = values
+        header[_TOTAL] = total + 1
+        header[_SEQ] += 1
+
+    @property
+    def total(self) -> int:
+        return int(self._header[_TOTAL])
+
+    def close(self, unlink: bool = True):
+        """Release the ring; unlink removes it for readers too"""
+        if self.shm is None:
+            return
+        # Views must go before the mapping can be closed
+        self._header = self._rows = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            _owned.discard(self.shm._name)
+        self.shm = None
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _remove_stale_ring(name: str):
+    """Unlink a ring whose writer has exited; refuse if it is still live"""
+    existing = shared_memory.SharedMemory(name=name)
+    writer_pid = 0
+    if existing.size >= DATA_OFFSET:
+        header = np.ndarray((len(HEADER_SLOTS),), dtype=np.int64, buffer=existing.buf)
+        if header[0] == MAGIC and header[1] == VERSION:
+            writer_pid = int(header[_WRITER_PID])
+        del header
+    if writer_pid and _pid_alive(writer_pid):
+        # Not ours to remove: keep the tracker from unlinking it at exit
+        if existing._name not in _owned:
+            resource_tracker.unregister(existing._name, 'shared_memory')
+        existing.close()
+        raise FileExistsError(
+            f"Metrics ring {name} is being written by process {writer_pid}; "
+            "use another ring name"
+        )
+    # Left behind by a collector that did not exit cleanly
+    existing.close()
+    existing.unlink()
+
+class SharedRingReader:
+    """Read-only view of a ring published by SharedRingWriter
+
+    Attaching never creates or removes the segment: the reader is
+    unregistered from the resource tracker, so its exit does not unlink
+    a ring the collector is still writing.
+    """
+
+    def __init__(self, name: str = DEFAULT_RING_NAME, retries: int = 100):
+        self.shm = shared_memory.SharedMemory(name=name)
+        # Only the creating process owns the segment
+        if self.shm._name not in _owned:
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.name = name
+        self.retries = retries
+
+        header = np.ndarray((len(HEADER_SLOTS),), dtype=np.int64, buffer=self.shm.buf)
+        if header[0] != MAGIC or header[1] != VERSION:
+            self.shm.close()
+            raise ValueError(f"Shared memory {name} is not a metrics ring")
+        self._header = header
+        self.capacity = int(header[2])
+        raw = bytes(self.shm.buf[NAMES_OFFSET:DATA_OFFSET]).rstrip(b'\0')
+        self.fields = json.loads(raw)
+        self._rows = np.ndarray((2 * self.capacity, len(self.fields)), dtype=np.float64,
+                                buffer=self.shm.buf, offset=DATA_OFFSET)
+        self._rows.flags.writeable = False
+
+    @property
+    def total(self) -> int:
+        """Number of rows ever published"""
+        return int(self._header[_TOTAL])
+
+    def latest(self, n: Optional[int] = None, copy: bool = False) -> Dict[str, np.ndarray]:
+        """Get the latest n rows (default: all retained) as field -> array
+
+        Without ``copy`` the arrays are read-only views into shared memory.
+        They stay valid until the writer has published ``capacity - n``
+        more rows; readers that poll well within that horizon (e.g. a
+        dashboard reading a minute of a one-hour ring) can use them
+        directly, others should pass ``copy=True``.
+        """
+        header = self._header
+        for _ in range(self.retries):
+            seq = int(header[_SEQ])
+            if seq % 2:
+                continue
+            total = int(header[_TOTAL])
+            count = min(total, self.capacity) if n is None else min(n, total, self.capacity)
+            start = (total - count) % self.capacity
+            window = self._rows[start:start + count]
+            if copy:
+                window = window.copy()
+            if int(header[_SEQ]) == seq:
+                return {field: window[:, i] for i, field in enumerate(self.fields)}
+        raise TimeoutError(f"Could not get a consistent read of {self.name}")
+
+    def close(self):
+        """Detach from the ring (the segment itself is left alone)"""
+        if self.shm is None:
+            return
+        self._header = self._rows = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Views returned by latest() are still alive; the mapping is
+            # released when they are garbage collected
+            pass
+        self.shm = None
+
+def attach(name: str = DEFAULT_RING_NAME) -> Optional[SharedRingReader]:
+    """Attach to a published ring, or None if no collector is publishing"""
+    try:
+        return SharedRingReader(name)
+    except (FileNotFoundError, ValueError):
+        return None
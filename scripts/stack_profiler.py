@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+
+class StackProfiler:
+    """Statistical profiler that samples every thread's Python stack
+
+    Each call to ``sample`` reads ``sys._current_frames()`` and counts one
+    hit for every thread's stack, keyed by thread name and the chain of
+    functions from the outermost frame inwards. Stacks are saved in the
+    collapsed ("folded") format read by flamegraph.pl and speedscope. The
+    calling thread is never sampled, so the profiler can be driven from a
+    collector's background thread.
+    """
+
+    def __init__(self, max_depth: int = 128):
+        self.max_depth = max_depth
+        self.samples = 0
+        self.stacks = Counter()
+        self._labels = {}
+        self._thread_names = {}
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def _label(self, code) -> str:
+        """Frame label 'function (file:line)', cached per code object"""
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._labels[code] = label
+        return label
+
+    def _thread_name(self, ident: int) -> str:
+        name = self._thread_names.get(ident)
+        if name is None:
+            # Refresh names only when an unknown thread shows up
+            self._thread_names = {t.ident: t.name for t in threading.enumerate()}
+            name = self._thread_names.get(ident, f'thread-{ident}')
+        return name
+
+    def sample(self):
+        """Record the current stack of every other thread"""
+        own = threading.get_ident()
+        frames = sys._current_frames()
+        stacks = []
+        last = {}
+        for ident, frame in frames.items():
+            if ident == own:
+                continue
+            # A frame's callers never change, so a thread still in the same
+            # innermost frame (typically blocked) has the same stack
+            previous = self._last.get(ident)
+            if previous is not None and previous[0] is frame:
+                stack = previous[1]
+            else:
+                labels = []
+                current = frame
+                while current is not None and len(labels) < self.max_depth:
+                    labels.append(self._label(current.f_code))
+                    current = current.f_back
+                labels.append(self._thread_name(ident))
+                stack = tuple(reversed(labels))
+            last[ident] = (frame, stack)
+            stacks.append(stack)
+        self._last = last
+        del frames
+
+        with self._lock:
+            self.stacks.update(stacks)
+            self.samples += 1
+
+    def collapsed(self) -> List[str]:
+        """Get 'frame;frame;frame count' lines, heaviest first"""
+        with self._lock:
+            items = self.stacks.most_common()
+        return [f"{';'.join(stack)} {count}" for stack, count in items]
+
+    def top_functions(self, limit: int = 10) -> Dict[str, int]:
+        """Get the functions most often on top of a stack"""
+        leaves = Counter()
+        with self._lock:
+            for stack, count in self.stacks.items():
+                leaves[stack[-1]] += count
+        return dict(leaves.most_common(limit))
+
+    def save(self, path: str) -> Optional[str]:
+        """Write the collapsed stacks to path; nothing is written without samples"""
+        lines = self.collapsed()
+        if not lines:
+            return None
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def reset(self):
+        """Drop all recorded samples"""
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+        self._last = {}
@@ -67,6 +67,22 @@ class TestDashboardVisualization(unittest.TestCase):
         trend_chart = self.visualizer.create_trend_chart(trend_data)
         self.assertIsNotNone(trend_chart)
         
+    def test_graph_panels(self):
+        """Test that the graph panels build from the bucketed dashboard data"""
+        metrics = self.dashboard.get_graph_data('7')
+        self.assertLessEqual(len(metrics['performance']), self.dashboard.max_points)
+        figures = [
+            self.dashboard.create_response_time_graph(metrics['performance']),
+            self.dashboard.create_cpu_gauge(metrics['system']),
+            self.dashboard.create_memory_gauge(metrics['system']),
+            self.dashboard.create_test_results_pie(metrics['test']),
+            self.dashboard.create_test_duration_graph(metrics['test']),
+            self.dashboard.create_quality_score_stat(metrics['quality']),
+            self.dashboard.create_coverage_gauge(metrics['quality']),
+            self.dashboard.create_error_rate_graph(metrics['performance'])
+        ]
+        self.assertEqual(len(figures), 8)
+        
     def test_export_dashboard(self):
         """Test dashboard export functionality"""
         export_file = os.path.join(self.test_dir, 'dashboard_export.json')
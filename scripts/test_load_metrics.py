@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from datetime import datetime, timedelta
+from load_metrics import load_metrics, load_series, parse_duration, query_metrics
+from gorilla_codec import append_block, decode_block, encode_block, series_file
+from metrics_cache import PARSE_CACHE, ParseCache
+from metrics_manifest import MANIFEST_FILE, update_manifest, refresh_manifest, files_in_range
+from metrics_store import JSONFileStore, SQLiteMetricsStore
+from metrics_rollup import MetricsRollup
+
+class TestLoadMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+
+    def write_snapshot(self, age_days, response_time=100.0, passed=90):
+        """Write a dashboard-style snapshot and record it in the manifest"""
+        date = datetime.now() - timedelta(days=age_days)
+        data = {
+            'timestamp': date.isoformat(),
+            'performance': {
+                'response_time': [response_time],
+                'throughput': [1000],
+                'error_rate': [0.01]
+            },
+            'quality': {'completeness': 0.9, 'consistency': 0.9, 'validity': 0.9},
+            'tests': {'passed': passed, 'failed': 1, 'skipped': 0},
+            'system': {'cpu_usage': [50.0], 'memory_usage': [1024.0]}
+        }
+        file_path = os.path.join(self.metrics_dir, f'metrics_{date.strftime("%Y%m%d_%H%M%S")}.json')
+        with open(file_path, 'w') as f:
+            json.dump(data, f)
+        update_manifest(self.metrics_dir, file_path, data)
+        return file_path
+
+    def test_manifest_updated_on_write(self):
+        """Test that writers record their files in the manifest"""
+        file_path = self.write_snapshot(0)
+
+        with open(os.path.join(self.metrics_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+
+        entry = manifest['files'][os.path.basename(file_path)]
+        self.assertEqual(entry['size'], os.path.getsize(file_path))
+        self.assertIn('performance', entry['keys'])
+        self.assertEqual(entry['start'], entry['end'])
+
+    def test_load_metrics_skips_files_outside_window(self):
+        """Test that files outside the time range are never opened"""
+        self.write_snapshot(0, response_time=100.0, passed=95)
+        old_file = self.write_snapshot(3, response_time=900.0)
+
+        # Corrupt the old file without changing its size or mtime
+        stat = os.stat(old_file)
+        with open(old_file, 'w') as f:
+            f.write('x' * stat.st_size)
+        os.utime(old_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        metrics = load_metrics(self.metrics_dir, '1d')
+        self.assertEqual(metrics['performance']['response_time'], [100.0])
+        self.assertEqual(metrics['tests']['passed'], 95)
+
+    def test_parse_cache_reuses_unchanged_files(self):
+        """Test that repeated loads only parse new or modified files"""
+        file_path = self.write_snapshot(0, response_time=100.0)
+        load_metrics(self.metrics_dir, '1d')
+        misses = PARSE_CACHE.misses
+
+        # Unchanged size and mtime: served from the cache without parsing
+        stat = os.stat(file_path)
+        with open(file_path, 'w') as f:
+            f.write('x' * stat.st_size)
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        metrics = load_metrics(self.metrics_dir, '1d')
+        self.assertEqual(metrics['performance']['response_time'], [100.0])
+        self.assertEqual(PARSE_CACHE.misses, misses)
+
+        # A rewritten file is parsed again
+        os.remove(file_path)
+        self.write_snapshot(0, response_time=250.0)
+        metrics = load_metrics(self.metrics_dir, '1d')
+        self.assertEqual(metrics['performance']['response_time'], [250.0])
+
+    def test_parse_cache_evicts_by_budget(self):
+        """Test that the least recently used entries are evicted first"""
+        cache = ParseCache(max_bytes=3 * 1024 * 8 + 1024)
+        paths = []
+        for i in range(4):
+            paths.append(os.path.join(self.metrics_dir, f'part_{i}.bin'))
+            with open(paths[-1], 'wb') as f:
+                f.write(b'x')
+
+        load = lambda path: np.zeros(1024)
+        for path in paths[:3]:
+            cache.get(path, load)
+        cache.get(paths[0], load)
+        cache.get(paths[3], load)
+
+        self.assertLessEqual(cache.size, cache.max_bytes)
+        cache.get(paths[0], load)
+        self.assertEqual(cache.hits, 2)
+        cache.get(paths[1], load)
+        self.assertEqual(cache.misses, 5)
+
+    def test_parallel_load_matches_serial(self):
+        """Test that a process-pool load merges like a serial one"""
+        for i in range(20):
+            self.write_snapshot(i / 48, response_time=float(i), passed=i)
+
+        PARSE_CACHE.clear()
+        serial = load_metrics(self.metrics_dir, '1d')
+        PARSE_CACHE.clear()
+        parallel = load_metrics(self.metrics_dir, '1d', workers=2)
+
+        self.assertEqual(parallel, serial)
+        self.assertEqual(parallel['tests']['passed'], 0)
+        self.assertEqual(sorted(parallel['performance']['response_time']), [float(i) for i in range(20)])
+
+    def test_refresh_indexes_unmanaged_files(self):
+        """Test that files written without the manifest are indexed on read"""
+        self.write_snapshot(0)
+        os.remove(os.path.join(self.metrics_dir, MANIFEST_FILE))
+
+        # Collector snapshots lack the dashboard sections and are skipped
+        with open(os.path.join(self.metrics_dir, 'metrics_collector.json'), 'w') as f:
+            json.dump({'timestamp': datetime.now().isoformat(), 'metrics': {}}, f)
+
+        manifest = refresh_manifest(self.metrics_dir)
+        self.assertEqual(len(manifest['files']), 2)
+        self.assertEqual(len(files_in_range(self.metrics_dir, required_keys=['performance'])), 1)
+
+        metrics = load_metrics(self.metrics_dir, '1w')
+        self.assertEqual(len(metrics['performance']['response_time']), 1)
+
+    def test_sqlite_store_round_trip(self):
+        """Test that load_metrics merges snapshots from the SQLite store"""
+        self.write_snapshot(0, response_time=100.0, passed=90)
+
+        now = datetime.now()
+        with SQLiteMetricsStore(self.metrics_dir, batch_size=2) as store:
+            for age_days, cpu in [(3, 10.0), (0, 20.0)]:
+                store.write_snapshot({
+                    'timestamp': (now - timedelta(days=age_days)).isoformat(),
+                    'performance': {'response_time': [200.0 + cpu]},
+                    'system': {'cpu_usage': [cpu], 'memory_usage': [512.0]},
+                    'quality': {'completeness': 0.5},
+                    'tests': {'passed': 42, 'failed': 0, 'skipped': 0}
+                })
+
+        metrics = load_metrics(self.metrics_dir, '1d')
+        self.assertEqual(sorted(metrics['performance']['response_time']), [100.0, 220.0])
+        self.assertEqual(sorted(metrics['system']['cpu_usage']), [20.0, 50.0])
+        self.assertEqual(metrics['tests']['passed'], 42)
+
+    def test_series_snapshots_in_both_stores(self):
+        """Test that series-only snapshots are queryable from JSON and SQLite"""
+        now = datetime.now().replace(microsecond=0)
+        snapshot = {
+            'timestamp': now.isoformat(),
+            'source': 'performance_tester',
+            'series': {'memory.traced_bytes': [4096.0]},
+            'allocations': {'top_sites': [{'site': 'leak.py:1', 'size_diff': 4096}]}
+        }
+        json_store = JSONFileStore(self.metrics_dir)
+        first = json_store.write_snapshot(snapshot)
+        # A snapshot from the same second must not replace the first
+        second = json_store.write_snapshot(dict(snapshot, series={'memory.traced_bytes': [8192.0]}))
+        self.assertNotEqual(first, second)
+
+        start = now - timedelta(minutes=1)
+        result = query_metrics(self.metrics_dir, start, now + timedelta(seconds=1),
+                               step='1m', agg='count', names=['memory.traced_bytes'])
+        self.assertEqual(np.nansum(result['series']['memory.traced_bytes']), 2)
+
+        sqlite_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, sqlite_dir, ignore_errors=True)
+        with SQLiteMetricsStore(sqlite_dir) as store:
+            store.write_snapshot(snapshot)
+            details = store.load_details('allocations', start)
+        self.assertEqual(details[0][1]['top_sites'][0]['site'], 'leak.py:1')
+
+    def test_rollup_tier_selection(self):
+        """Test that long ranges are served from pre-aggregated tiers"""
+        end = datetime(2026, 1, 2)
+        samples = [float(i % 100) for i in range(3 * 3600)]
+        stamps = [(end - timedelta(seconds=len(samples) - i)).isoformat() for i in range(len(samples))]
+
+        with SQLiteMetricsStore(self.metrics_dir) as store:
+            store.write_snapshot({
+                'timestamp': end.isoformat(),
+                'system': {'cpu_usage': samples},
+                'sample_timestamps': {'system.cpu_usage': stamps}
+            })
+            rollup = MetricsRollup(store)
+            # Readers never create the tiers; only the rollup stage does
+            self.assertFalse(rollup.available())
+            self.assertEqual(rollup.query('system.cpu_usage', end - timedelta(hours=3), end,
+                                          max_points=3)['count'], [])
+            self.assertFalse(store.has_table('rollups'))
+            self.assertEqual(rollup.run_once(), len(samples))
+            self.assertTrue(rollup.available())
+            self.assertEqual(rollup.run_once(), 0)
+
+            start = end - timedelta(hours=3)
+            hourly = rollup.query('system.cpu_usage', start, end, max_points=3)
+            self.assertEqual(hourly['tier'], '1h')
+            self.assertEqual(sum(hourly['count']), len(samples))
+            self.assertEqual(max(hourly['max']), 99.0)
+            self.assertAlmostEqual(hourly['p95'][0], 95.0, delta=1.0)
+
+            minutes = rollup.query('system.cpu_usage', start, end, max_points=180)
+            self.assertEqual(minutes['tier'], '1m')
+            self.assertEqual(len(minutes['timestamps']), 180)
+
+            raw = rollup.query('system.cpu_usage', end - timedelta(minutes=1), end, max_points=1000)
+            self.assertEqual(raw['tier'], 'raw')
+            
+            # Raw samples are bucketed too when they exceed max_points
+            raw = rollup.query('system.cpu_usage', end - timedelta(minutes=10), end, max_points=100)
+            self.assertEqual(raw['tier'], 'raw')
+            self.assertEqual(len(raw['timestamps']), 100)
+            self.assertEqual(sum(raw['count']), 600)
+            self.assertEqual(max(raw['max']), 99.0)
+
+    def test_parse_duration(self):
+        """Test that arbitrary duration strings are accepted"""
+        self.assertEqual(parse_duration('30m'), timedelta(minutes=30))
+        self.assertEqual(parse_duration('6h'), timedelta(hours=6))
+        self.assertEqual(parse_duration('30d'), timedelta(days=30))
+        self.assertEqual(parse_duration('1w'), timedelta(weeks=1))
+        with self.assertRaises(ValueError):
+            parse_duration('soon')
+        for unitless in (7, 1.5, '7'):
+            with self.assertRaises(ValueError):
+                parse_duration(unitless)
+
+    def test_load_metrics_honours_short_ranges(self):
+        """Test that '1h' loads one hour rather than a whole day"""
+        self.write_snapshot(0, response_time=100.0)
+        self.write_snapshot(0.5, response_time=900.0)
+
+        self.assertEqual(load_metrics(self.metrics_dir, '1h')['performance']['response_time'], [100.0])
+        self.assertEqual(len(load_metrics(self.metrics_dir, '1d')['performance']['response_time']), 2)
+
+    def test_query_metrics_buckets_all_sources(self):
+        """Test aligned bucketing across snapshots and the SQLite store"""
+        end = datetime.now().replace(microsecond=0)
+        start = end - timedelta(hours=2)
+        self.write_snapshot((end - start).total_seconds() / 86400 - 0.01, response_time=10.0)
+
+        with SQLiteMetricsStore(self.metrics_dir) as store:
+            stamps = [(end - timedelta(minutes=40, seconds=i)).isoformat() for i in range(4)]
+            store.write_snapshot({
+                'timestamp': end.isoformat(),
+                'performance': {'response_time': [20.0, 40.0, 60.0, 80.0]},
+                'sample_timestamps': {'performance.response_time': stamps}
+            })
+
+        for agg, expected in [('mean', 50.0), ('max', 80.0), ('count', 4), ('p50', 50.0)]:
+            result = query_metrics(self.metrics_dir, start, end, step='1h', agg=agg)
+            self.assertEqual(len(result['timestamps']), 2)
+            series = result['series']['performance.response_time']
+            self.assertEqual(len(series), 2)
+            self.assertAlmostEqual(series[1], expected)
+
+        result = query_metrics(self.metrics_dir, start, end, step='30m', agg='count')
+        np.testing.assert_array_equal(result['series']['performance.response_time'], [1, 0, 4, 0])
+        self.assertTrue(np.isnan(
+            query_metrics(self.metrics_dir, start, end, step='30m')['series']['performance.throughput'][1]
+        ))
+        with self.assertRaises(ValueError):
+            query_metrics(self.metrics_dir, start, end, agg='median')
+
+    def test_gorilla_series_round_trip(self):
+        """Test that compressed series blocks decode losslessly and by window"""
+        start = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+        timestamps = start.timestamp() + np.arange(3600, dtype=np.float64)
+        timestamps[1000] += 0.25  # Irregular tick
+        values = 1024.0 + np.cumsum(np.random.default_rng(0).integers(-2, 3, 3600))
+        values[10] = float('nan')
+
+        block = encode_block(timestamps, values)
+        self.assertLess(len(block), values.nbytes // 4)
+        decoded_ts, decoded_values = decode_block(block)
+        np.testing.assert_allclose(decoded_ts, timestamps, atol=5e-4)
+        np.testing.assert_array_equal(decoded_values, values)
+
+        path = series_file(self.metrics_dir, 'memory_usage', timestamps[0])
+        for chunk in range(0, 3600, 600):
+            append_block(path, timestamps[chunk:chunk + 600], values[chunk:chunk + 600])
+        ts, loaded = load_series(self.metrics_dir, 'memory_usage', start + timedelta(minutes=30))
+        self.assertEqual(len(ts), 1800)
+        np.testing.assert_array_equal(loaded, values[1800:])
+
+    def tearDown(self):
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    unittest.main()
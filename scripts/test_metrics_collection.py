@@ -3,11 +3,31 @@
 import os
 import json
 import time
+import threading
 import logging
+import subprocess
+import sys
+import shutil
+import socket
+import tempfile
 import unittest
-from datetime import datetime
+import gc
+import asyncio
+import numpy as np
+from datetime import datetime, timedelta
 from metrics_collector import MetricsCollector
+from metrics_store import JSONFileStore, SQLiteMetricsStore
+from allocation_tracker import AllocationTracker
+from metrics_sampler import PeriodicSampler, ProcProbe, PsutilProbe, SyntheticProbe
+from clock import VirtualClock
+from performance_tester import PerformanceTester
+from load_metrics import load_metrics, load_series, query_metrics, read_metrics_stream
+from ring_buffer import read_spill
 from ci_monitor import CIMonitor
+from shared_ring import HEADER_SLOTS, SharedRingWriter, attach
+from metrics_daemon import MetricsAggregator, MetricsDaemon, parse_packet
+from metrics_client import MetricsClient
+import instrumentation
 from alert_manager import AlertManager
 
 class TestMetricsCollection(unittest.TestCase):
@@ -33,25 +53,40 @@ class TestMetricsCollection(unittest.TestCase):
         )
         self.logger = logging.getLogger(__name__)
         
-        # Initialize components
-        self.collector = MetricsCollector()
-        self.monitor = CIMonitor()
+        # Initialize components on virtual time with a synthetic probe,
+        # writing into a temporary directory
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir, ignore_errors=True)
+        self.clock = VirtualClock(start=1_700_000_000)
+        self.probe = SyntheticProbe(cpu=lambda t: 10 + (t % 60), memory=64.0, clock=self.clock)
+        self.collector = MetricsCollector(clock=self.clock, probe=self.probe,
+                                          metrics_dir=self.metrics_dir)
+        self.monitor = CIMonitor(clock=self.clock, probe=self.probe, metrics_dir=self.metrics_dir)
         self.alert_manager = AlertManager()
 
     def test_metrics_collection(self):
         """Test basic metrics collection"""
-        # Start collection
+        # Start collection and simulate two hours of one-second samples
         self.collector.start_collection()
-        time.sleep(2)  # Allow some metrics to be collected
+        self.clock.advance(2 * 3600)
         
         # Verify metrics
         metrics = self.collector.metrics
         self.assertIn('timestamps', metrics)
         self.assertIn('cpu_usage', metrics)
         self.assertIn('memory_usage', metrics)
+        self.assertEqual(self.collector.sampler.ticks, 2 * 3600 + 1)
+        self.assertEqual(self.collector.sampler.missed_ticks, 0)
+        
+        cpu = self.collector.stats['cpu']
+        self.assertEqual(cpu.running.count, 2 * 3600 + 1)
+        self.assertEqual(cpu.summary()['max'], 69.0)
+        self.assertAlmostEqual(cpu.summary()['mean'], 39.5, delta=0.1)
         
         # Stop collection
         self.collector.stop_collection()
+        self.clock.advance(60)
+        self.assertEqual(self.collector.sampler.ticks, 2 * 3600 + 1)
 
     def test_performance_metrics(self):
         """Test performance metrics collection"""
@@ -111,6 +146,517 @@ class TestMetricsCollection(unittest.TestCase):
             self.assertIn('analysis', data)
             self.assertIn('timestamp', data)
 
+    def test_sqlite_store_backend(self):
+        """Test saving collector metrics to the SQLite store"""
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, ignore_errors=True)
+        collector = MetricsCollector(store=SQLiteMetricsStore(store_dir), metrics_dir=store_dir)
+        
+        collector.record_sample(time.time(), 35.0, 128.0)
+        collector.collect_test_metrics({'duration': 0.5, 'status': 'pass'})
+        collector.collect_test_metrics({'duration': 0.0, 'status': 'skip'})
+        collector.save_metrics()
+        
+        # A second save only writes samples added since the first
+        collector.save_metrics()
+        collector.store.close()
+        self.assertEqual(load_metrics(store_dir, '1h')['tests'],
+                         {'passed': 1, 'failed': 0, 'skipped': 1})
+        
+        # CIMonitor writes memory to the same series, in bytes
+        monitor = CIMonitor(store=SQLiteMetricsStore(store_dir), metrics_dir=store_dir)
+        monitor.save_metrics({'cpu_usage': 40.0, 'memory_usage': 256.0 * 1024 * 1024})
+        monitor.store.close()
+        
+        metrics = load_metrics(store_dir, '1h')
+        self.assertEqual(metrics['system']['cpu_usage'], [35.0, 40.0])
+        self.assertEqual(metrics['system']['memory_usage'],
+                         [128.0 * 1024 * 1024, 256.0 * 1024 * 1024])
+
+    def test_incremental_save(self):
+        """Test that incremental saves append only new samples"""
+        collector = MetricsCollector(incremental=True, metrics_dir=self.metrics_dir)
+        
+        for cpu in [10.0, 20.0, 30.0]:
+            collector.record_sample(time.time(), cpu, 64.0)
+            stream_file = collector.save_metrics()
+        collector.collect_test_metrics({'duration': 0.1, 'status': 'fail'})
+        collector.save_metrics()
+        
+        with open(stream_file) as f:
+            segments = [json.loads(line) for line in f]
+        self.assertEqual([len(s['cpu_usage']) for s in segments], [1, 1, 1, 0])
+        
+        metrics = read_metrics_stream(stream_file)
+        self.assertEqual(metrics['cpu_usage'], [10.0, 20.0, 30.0])
+        self.assertEqual(metrics['test_results'][-1]['status'], 'fail')
+
+    def test_bounded_retention(self):
+        """Test that sampled series are bounded and spill evicted samples"""
+        collector = MetricsCollector(max_samples=4, spill=True, metrics_dir=self.metrics_dir)
+        spill_path = collector.metrics['cpu_usage'].spill_path
+        # A collector created in the same second gets its own spill files
+        other = MetricsCollector(max_samples=4, spill=True, metrics_dir=self.metrics_dir)
+        self.assertNotEqual(other.metrics['cpu_usage'].spill_path, spill_path)
+        
+        for i in range(10):
+            collector.record_sample(1000.0 + i, float(i), 32.0)
+        collector.stop_collection()
+        
+        self.assertEqual(collector.metrics['cpu_usage'].tolist(), [6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(collector.metrics['cpu_usage'].total, 10)
+        self.assertEqual(read_spill(spill_path).tolist(), [0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(collector.analyze_metrics()['system']['cpu']['max'], 9.0)
+
+    def test_streaming_thresholds(self):
+        """Test that thresholds are evaluated on every sample"""
+        self.collector.set_thresholds({'cpu_p95': 80, 'memory_p95': 1024, 'failure_rate': 0.1})
+        
+        for i in range(200):
+            self.collector.record_sample(1000.0 + i, 20.0 + (i % 10), 64.0)
+        self.assertEqual(self.collector.alerts, [])
+        
+        for i in range(50):
+            self.collector.record_sample(1200.0 + i, 99.0, 64.0)
+        self.assertEqual([a['metric'] for a in self.collector.alerts], ['cpu'])
+        
+        cpu = self.collector.stats['cpu'].summary()
+        values = self.collector.metrics['cpu_usage'].to_array()
+        self.assertAlmostEqual(cpu['mean'], float(values.mean()))
+        self.assertEqual(cpu['max'], 99.0)
+        self.assertAlmostEqual(cpu['p95'], 99.0, delta=2.0)
+
+    def test_gorilla_samples_counted_once(self):
+        """Test that system samples are not duplicated between blocks and the store"""
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, ignore_errors=True)
+        store = SQLiteMetricsStore(store_dir)
+        collector = MetricsCollector(store=store, series_codec='gorilla',
+                                     clock=self.clock, probe=self.probe, metrics_dir=store_dir)
+        
+        start = self.clock.now()
+        collector.start_collection()
+        self.clock.advance(599.5)
+        collector.stop_collection()
+        collector.save_metrics()
+        store.close()
+        
+        result = query_metrics(store_dir, start, self.clock.now(), step='10m', agg='count',
+                               names=['system.cpu_usage'])
+        self.assertEqual(result['series']['system.cpu_usage'].sum(), 600)
+        
+        ts, memory = load_series(store_dir, 'memory_usage')
+        self.assertEqual(len(memory), 600)
+        self.assertEqual(memory[0], self.probe.memory_mb() * 1024 * 1024)
+        
+    def test_periodic_sampler_grid(self):
+        """Test that sub-100 ms ticks stay on an aligned grid and skip missed ticks"""
+        ticks = []
+        def record(timestamp, cpu, memory):
+            ticks.append(timestamp)
+            if len(ticks) == 5:
+                # A slow callback overruns two whole ticks and delays a third
+                self.clock.sleep(0.07)
+        
+        sampler = PeriodicSampler(record, 0.02, probe=SyntheticProbe(clock=self.clock),
+                                  clock=self.clock)
+        sampler.start()
+        self.clock.advance(0.4)
+        sampler.stop()
+        
+        steps = [round((b - a) / 0.02, 3) for a, b in zip(ticks, ticks[1:])]
+        self.assertTrue(all(step == int(step) and step >= 1 for step in steps))
+        self.assertTrue(all(abs(t / 0.02 - round(t / 0.02)) < 1e-3 for t in ticks))
+        self.assertEqual(sampler.missed_ticks, 2)
+        self.assertEqual(len(ticks), 21 - 2)
+        self.assertEqual(sum(steps) - len(steps), sampler.missed_ticks)
+
+    @unittest.skipUnless(ProcProbe.available(), "requires /proc")
+    def test_proc_probe_matches_psutil(self):
+        """Test that the /proc probe reports the same fields as psutil"""
+        proc_probe, psutil_probe = ProcProbe(), PsutilProbe()
+        self.addCleanup(proc_probe.close)
+        
+        for _ in range(3):
+            cpu, memory = proc_probe.sample()
+            self.assertGreaterEqual(cpu, 0.0)
+            self.assertLessEqual(cpu, 100.0)
+            self.assertAlmostEqual(memory, psutil_probe.memory_mb(), delta=8.0)
+        self.assertGreater(proc_probe.process_cpu_seconds(), 0.0)
+
+    @unittest.skipUnless(ProcProbe.available(), "requires /proc")
+    def test_sampler_closes_own_probe(self):
+        """Test that start/stop cycles do not leak the default probe's descriptors"""
+        collector = MetricsCollector(metrics_dir=self.metrics_dir)
+        collector.start_collection(interval=60)
+        collector.stop_collection()
+        open_fds = len(os.listdir('/proc/self/fd'))
+        for _ in range(5):
+            collector.start_collection(interval=60)
+            collector.stop_collection()
+        self.assertEqual(len(os.listdir('/proc/self/fd')), open_fds)
+        
+    def test_process_tree_attribution(self):
+        """Test that a child's descendants are attributed to its tree"""
+        code = ("import subprocess, sys; subprocess.run([sys.executable, '-c', "
+                "'x = sum(range(2000000)); import time; time.sleep(0.3)'])")
+        process = subprocess.Popen([sys.executable, '-c', code])
+        self.collector.track_process(process.pid)
+        
+        # Another thread keeps polling, as the sampler does, through release
+        stop = threading.Event()
+        def poll_constantly():
+            while not stop.is_set():
+                self.collector.process_tracker.poll()
+        poller = threading.Thread(target=poll_constantly)
+        poller.start()
+        self.addCleanup(poller.join)
+        self.addCleanup(stop.set)
+        
+        while process.poll() is None:
+            self.collector.process_tracker.poll()
+            time.sleep(0.05)
+        resources = self.collector.release_process(process.pid)
+        
+        self.assertEqual(resources['processes'], 2)
+        self.assertGreater(resources['cpu_time'], 0.0)
+        self.assertGreater(resources['peak_rss_bytes'], 0)
+        self.assertEqual(self.collector.process_tracker.tracked, [])
+        
+        self.collector.collect_test_metrics({'status': 'pass', 'resources': resources})
+        self.assertEqual(self.collector.metrics['test_results'][-1]['resources'], resources)
+
+    def test_metrics_daemon_ingestion(self):
+        """Test that a test subprocess can push StatsD metrics into the store"""
+        metrics, bad = parse_packet(b'a:1|c|@0.5\nb:+2|g\nc:1.5|ms\nbroken\nd:x|c')
+        self.assertEqual(metrics, [('a', 1.0, 'counter', 0.5), ('b', 2.0, 'gauge_delta', 1.0),
+                                   ('c', 1.5, 'timer', 1.0)])
+        self.assertEqual(bad, 2)
+        
+        # A negative gauge is set, not applied as a decrement
+        aggregator = MetricsAggregator()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as server:
+            server.bind(('127.0.0.1', 0))
+            client = MetricsClient(f'udp://127.0.0.1:{server.getsockname()[1]}')
+            client.gauge('level', 5)
+            client.gauge('level', -3)
+            client.close()
+            server.settimeout(5)
+            for name, value, kind, rate in parse_packet(server.recv(65536))[0]:
+                aggregator.add(name, value, kind, rate)
+        self.assertEqual(aggregator.gauges['level'], -3.0)
+        
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, ignore_errors=True)
+        store = SQLiteMetricsStore(store_dir)
+        for address in ['udp://127.0.0.1:0', f'unix://{store_dir}/metrics.sock']:
+            daemon = MetricsDaemon(store, address, flush_interval=60)
+            daemon.start()
+            child = (
+                "from metrics_client import MetricsClient\n"
+                "client = MetricsClient(prefix='child.')\n"
+                "for i in range(20):\n"
+                "    client.incr('tests')\n"
+                "    client.timing('step', 0.001 * (i + 1))\n"
+                "client.gauge('workers', 4)\n"
+                "with client.timer('block'):\n"
+                "    pass\n"
+            )
+            env = dict(os.environ, **daemon.environ())
+            subprocess.run([sys.executable, '-c', child], env=env, check=True, timeout=30,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+            daemon.stop()
+            self.assertEqual(daemon.bad_lines, 0)
+        
+        start = datetime.fromtimestamp(time.time() - 60)
+        _, counts = store.load_samples('counter.child.tests', start)
+        self.assertEqual(counts.tolist(), [20.0, 20.0])
+        _, workers = store.load_samples('gauge.child.workers', start)
+        self.assertEqual(workers.tolist(), [4.0, 4.0])
+        sketch = store.load_sketch('timer.child.step', start)
+        self.assertEqual(sketch.count, 40)
+        self.assertAlmostEqual(sketch.quantile(0.5), 0.010, delta=0.001)
+        store.close()
+        
+        # Daemon snapshots written to a JSON store are queryable as well
+        json_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, json_dir, ignore_errors=True)
+        daemon = MetricsDaemon(JSONFileStore(json_dir), 'udp://127.0.0.1:0', flush_interval=60)
+        daemon.start()
+        client = MetricsClient(daemon.address, prefix='child.')
+        for i in range(20):
+            client.incr('tests')
+        client.close()
+        daemon.stop()
+        result = query_metrics(json_dir, start, datetime.now() + timedelta(seconds=1),
+                               step='5m', agg='sum', names=['counter.child.tests'])
+        self.assertEqual(np.nansum(result['series']['counter.child.tests']), 20.0)
+
+    def test_stack_profiler_folded_output(self):
+        """Test that the collector thread profiles other threads into a .folded file"""
+        collector = MetricsCollector(probe=SyntheticProbe(), profile_interval=0.005,
+                                     metrics_dir=self.metrics_dir)
+        
+        done = threading.Event()
+        def busy_worker():
+            while not done.is_set():
+                sum(range(1000))
+        
+        worker = threading.Thread(target=busy_worker, name='busy')
+        worker.start()
+        collector.start_collection(interval=0.05)
+        time.sleep(0.3)
+        collector.stop_collection()
+        done.set()
+        worker.join()
+        collector.save_metrics()
+        
+        self.assertGreater(collector.profiler.samples, 10)
+        profile_file = os.path.join(collector.metrics_dir, f'metrics_{collector.run_id}.folded')
+        with open(profile_file) as f:
+            lines = f.read().splitlines()
+        busy = [line for line in lines if line.startswith('busy;')]
+        self.assertTrue(busy)
+        self.assertIn('busy_worker (test_metrics_collection.py:', busy[0])
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in lines))
+
+    def test_allocation_tracker_flags_leak(self):
+        """Test that steady heap growth is attributed and flagged"""
+        tracker = AllocationTracker(min_growth_bytes=512 * 1024)
+        tracker.start()
+        self.addCleanup(tracker.stop)
+        
+        leaked = []
+        checkpoints = []
+        for _ in range(4):
+            leaked.extend(bytearray(256) for _ in range(1000))
+            checkpoints.append(tracker.checkpoint())
+        
+        top = checkpoints[-1]['top_sites'][0]
+        self.assertIn('test_metrics_collection.py', top['site'])
+        self.assertGreater(top['size_diff'], 256 * 1000)
+        growth = checkpoints[-1]['growth']
+        self.assertTrue(growth['linear_growth'])
+        self.assertGreater(growth['slope_bytes_per_interval'], 256 * 1000)
+        self.assertFalse(checkpoints[0]['growth']['linear_growth'])
+
+    def test_runtime_metrics_series(self):
+        """Test GC pause, thread and loop-lag sampling and their stored series"""
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir, ignore_errors=True)
+        collector = MetricsCollector(store=SQLiteMetricsStore(store_dir), runtime_metrics=True,
+                                     metrics_dir=store_dir)
+        collector.runtime.start()
+        self.addCleanup(collector.runtime.stop)
+        
+        gc.collect()
+        gc.collect(0)
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        collector.attach_event_loop(loop)
+        
+        async def blocking_workload():
+            await asyncio.sleep(0.06)
+            time.sleep(0.1)
+            await asyncio.sleep(0.06)
+        
+        loop.run_until_complete(blocking_workload())
+        runtime = collector.runtime.sample()
+        self.assertGreaterEqual(runtime['gc_collections'], 2)
+        self.assertGreater(runtime['gc_pause_gen2'], 0)
+        self.assertGreaterEqual(runtime['thread_count'], 1)
+        self.assertGreater(runtime['loop_lag'], 0.03)
+        
+        # Without a loop, lag is unsampled and left out of the stored series
+        collector.runtime.loop_lag.detach()
+        now = time.time()
+        collector.record_sample(now - 1, 10.0, 100.0, runtime)
+        collector.record_sample(now, 12.0, 101.0, collector.runtime.sample())
+        collector.save_metrics()
+        collector.store.close()
+        
+        result = query_metrics(store_dir, datetime.fromtimestamp(now - 60), step='1h', agg='count',
+                               names=['runtime.gc_collections', 'runtime.loop_lag'])
+        self.assertEqual(result['series']['runtime.gc_collections'][0], 2)
+        self.assertEqual(result['series']['runtime.loop_lag'][0], 1)
+
+    def test_instrumented_timings(self):
+        """Test that timer/@timed feed histograms, the collector and CIMonitor"""
+        instrumentation.reset()
+        self.addCleanup(instrumentation.disable)
+        
+        @instrumentation.timed('test.operation')
+        def operation():
+            time.sleep(0.002)
+        
+        instrumentation.disable()
+        operation()
+        with instrumentation.timer('test.block') as block:
+            time.sleep(0.002)
+        self.assertGreaterEqual(block.elapsed, 0.002)
+        self.assertEqual(instrumentation.snapshot(), {})
+        
+        instrumentation.add_listener(self.collector.record_timing)
+        instrumentation.add_listener(self.monitor.record_timing)
+        self.addCleanup(instrumentation.remove_listener, self.collector.record_timing)
+        self.addCleanup(instrumentation.remove_listener, self.monitor.record_timing)
+        for _ in range(5):
+            operation()
+        
+        summary = instrumentation.snapshot()['test.operation']
+        self.assertEqual(summary['count'], 5)
+        self.assertGreaterEqual(summary['min'], 0.002)
+        self.assertGreaterEqual(summary['p95'], summary['min'])
+        self.assertGreater(self.collector.analyze_metrics()['timings']['test.operation']['mean'], 0.002)
+        self.assertEqual(self.monitor.registry.get_sample_value(
+            'operation_duration_seconds_count', {'operation': 'test.operation'}), 5)
+        
+        sketches = self.collector._drain_timing_sketches()
+        self.assertEqual(sketches['timing.test.operation']['count'], 5)
+        self.assertEqual(self.collector._drain_timing_sketches(), {})
+        
+        # Recording stops with the last listener unless enabled explicitly
+        instrumentation.remove_listener(self.collector.record_timing)
+        self.assertTrue(instrumentation.is_enabled())
+        instrumentation.remove_listener(self.monitor.record_timing)
+        self.assertFalse(instrumentation.is_enabled())
+        instrumentation.enable()
+        instrumentation.add_listener(self.collector.record_timing)
+        instrumentation.remove_listener(self.collector.record_timing)
+        self.assertTrue(instrumentation.is_enabled())
+
+    def test_live_ring_cross_process(self):
+        """Test that another process reads the latest samples from shared memory"""
+        ring_name = f'test_metrics_live_{os.getpid()}'
+        collector = MetricsCollector(live_ring=ring_name, clock=self.clock, probe=self.probe,
+                                     metrics_dir=self.metrics_dir)
+        collector.start_collection(interval=60)
+        self.addCleanup(collector.stop_collection)
+        
+        now = time.time()
+        for i in range(5):
+            collector.record_sample(now + i, 10.0 + i, 100.0)
+        
+        reader_code = (
+            "import json, sys\n"
+            "from shared_ring import attach\n"
+            "reader = attach(sys.argv[1])\n"
+            "data = reader.latest(3)\n"
+            "print(json.dumps({k: v.tolist() for k, v in data.items()}))\n"
+            "del data\n"
+            "reader.close()\n"
+        )
+        result = subprocess.run([sys.executable, '-c', reader_code, ring_name],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=30)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        data = json.loads(result.stdout)
+        self.assertEqual(data['cpu_usage'], [12.0, 13.0, 14.0])
+        self.assertEqual(data['completeness'], [1.0, 1.0, 1.0])
+        
+        # A second writer must not take over a ring that is still live
+        with self.assertRaises(FileExistsError):
+            SharedRingWriter(['timestamp'], name=ring_name)
+        
+        # The reader's exit leaves the ring in place; stopping removes it
+        reader = attach(ring_name)
+        self.assertEqual(reader.total, 5)
+        view = reader.latest(2)['timestamp']
+        self.assertFalse(view.flags.writeable)
+        reader.close()
+        collector.stop_collection()
+        self.assertIsNone(attach(ring_name))
+        
+        # A ring left behind by a writer that has exited is replaced
+        stale = SharedRingWriter(['timestamp'], name=ring_name)
+        dead = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'],
+                              capture_output=True, text=True, check=True)
+        stale._header[HEADER_SLOTS.index('writer_pid')] = int(dead.stdout)
+        stale.close(unlink=False)
+        replacement = SharedRingWriter(['timestamp'], name=ring_name)
+        replacement.close()
+
+    def test_open_loop_latency_includes_queueing(self):
+        """Test that open-loop response times count waiting behind slow sessions"""
+        np.random.seed(0)
+        tester = PerformanceTester(clock=self.clock)
+        tester.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tester.results_dir, ignore_errors=True)
+        
+        # Sessions take ~0.3 s: 2/s keeps up, 5/s builds a queue
+        under = tester.run_load_test(users=1, duration=60, rate=2)
+        self.assertEqual(under['total_requests'], 120)
+        self.assertEqual(under['target_rate'], 2)
+        self.assertLess(under['p95_response_time'], 0.5)
+        
+        over = tester.run_load_test(users=1, duration=60, rate=5)
+        self.assertEqual(over['total_requests'], 300)
+        self.assertGreater(over['p95_response_time'], 10 * under['p95_response_time'])
+        self.assertGreater(over['max_response_time'], 25)
+        
+    def test_asyncio_load_engine(self):
+        """Test that coroutine virtual users run on one thread and report the same format"""
+        tester = PerformanceTester(engine='asyncio')
+        tester.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tester.results_dir, ignore_errors=True)
+        
+        # Count threads while the sessions run
+        threads = []
+        scenario = tester._execute_test_scenario_async
+        async def counted_scenario():
+            threads.append(threading.active_count())
+            await scenario()
+        tester._execute_test_scenario_async = counted_scenario
+        
+        result = tester.run_load_test(users=1000, duration=0.5)
+        self.assertGreaterEqual(result['total_requests'], 1000)
+        self.assertEqual(result['success_rate'], 100.0)
+        self.assertGreater(result['min_response_time'], 0.1)
+        self.assertLess(max(threads), 10)
+        
+        with self.assertRaises(ValueError):
+            PerformanceTester(engine='asyncio', clock=self.clock)
+        
+    def test_sharded_load_workers(self):
+        """Test that worker processes' reports merge into one result"""
+        tester = PerformanceTester(processes=2)
+        tester.results_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tester.results_dir, ignore_errors=True)
+        
+        result = tester.run_load_test(users=4, duration=1.5, rate=20)
+        self.assertEqual(result['total_requests'], 30)
+        self.assertEqual(result['success_rate'], 100.0)
+        self.assertEqual(result['target_rate'], 20)
+        self.assertGreater(result['min_response_time'], 0.1)
+        
+        with self.assertRaises(ValueError):
+            PerformanceTester(processes=2, clock=self.clock)
+        
+    def test_staged_test_results(self):
+        """Test that results staged from many threads are all merged"""
+        def report(worker):
+            for i in range(250):
+                self.collector.stage_test_result({
+                    'duration': 0.01,
+                    'status': 'fail' if i % 50 == 0 else 'pass'
+                })
+        
+        threads = [threading.Thread(target=report, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.collector.metrics['test_results'], [])
+        
+        self.assertEqual(self.collector.flush_test_metrics(), 2000)
+        # Queues of the finished threads are dropped once drained
+        self.assertEqual(self.collector._staging_queues, [])
+        self.collector.collect_test_metrics_batch([{'duration': 0.2, 'status': 'pass'}] * 10)
+        
+        self.assertEqual(len(self.collector.metrics['test_results']), 2010)
+        self.assertEqual(self.collector.test_counts, {'total': 2010, 'passed': 1970, 'failed': 40, 'skipped': 0})
+        self.assertEqual(self.collector.flush_test_metrics(), 0)
+
     def test_alert_integration(self):
         """Test alert integration"""
         # Set test thresholds
@@ -130,7 +676,7 @@ class TestMetricsCollection(unittest.TestCase):
         """Test monitor integration"""
         # Start monitoring
         self.monitor.start_monitoring()
-        time.sleep(2)
+        self.clock.advance(2)
         
         # Collect metrics
         metrics = self.monitor._get_test_metrics()
@@ -138,6 +684,7 @@ class TestMetricsCollection(unittest.TestCase):
         # Verify metrics
         self.assertIsInstance(metrics, dict)
         self.assertIn('total', metrics)
+        self.assertEqual(self.monitor._get_cpu_usage(), 10 + self.clock.time() % 60)
         
         # Stop monitoring
         self.monitor.stop_monitoring()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+import numpy as np
+from quantile_sketch import QuantileSketch, merge_sketches
+
+class TestQuantileSketch(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(42)
+
+    def assertWithinAccuracy(self, estimate, expected, accuracy=0.01):
+        self.assertLessEqual(abs(estimate - expected), accuracy * abs(expected) + 1e-12)
+
+    def test_relative_error_bound(self):
+        """Test that quantiles stay within the relative accuracy"""
+        values = self.rng.lognormal(mean=-2, sigma=1, size=50000)
+        sketch = QuantileSketch(relative_accuracy=0.01)
+        for value in values:
+            sketch.add(float(value))
+
+        for q in [0.5, 0.9, 0.95, 0.99]:
+            expected = float(np.quantile(values, q, method='lower'))
+            self.assertWithinAccuracy(sketch.quantile(q), expected)
+        self.assertAlmostEqual(sketch.mean, float(values.mean()))
+        self.assertEqual(sketch.max, float(values.max()))
+
+    def test_merge_matches_single_sketch(self):
+        """Test that merged shards answer like one sketch over all values"""
+        shards = [self.rng.exponential(0.2, size=10000) for _ in range(4)]
+        single = QuantileSketch()
+        single.add_many(np.concatenate(shards))
+
+        parts = []
+        for shard in shards:
+            sketch = QuantileSketch()
+            sketch.add_many(shard)
+            parts.append(sketch)
+        merged = merge_sketches(parts)
+
+        self.assertEqual(merged.count, single.count)
+        self.assertEqual(merged.bins, single.bins)
+        self.assertEqual(merged.quantile(0.95), single.quantile(0.95))
+
+    def test_serialization_round_trip(self):
+        """Test that sketches survive JSON serialisation"""
+        sketch = QuantileSketch()
+        sketch.add_many([-1.0, 0.0, 0.5, 2.0, 30.0])
+        restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+        self.assertEqual(restored.count, 5)
+        self.assertEqual(restored.quantile(0.5), sketch.quantile(0.5))
+        self.assertEqual(restored.quantile(0.0), -1.0)
+
+    def test_bins_are_bounded(self):
+        """Test that the number of buckets never exceeds max_bins"""
+        sketch = QuantileSketch(max_bins=64)
+        sketch.add_many(np.logspace(-6, 6, 10000))
+        self.assertLessEqual(len(sketch.bins), 64)
+        self.assertWithinAccuracy(sketch.quantile(0.99), float(np.quantile(np.logspace(-6, 6, 10000), 0.99, method='lower')))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,14 +3,18 @@
 import os
 import yaml
 import json
+import time
 import logging
+import tempfile
 import subprocess
 from datetime import datetime
 from typing import Dict, Any, List
 from concurrent.futures import ThreadPoolExecutor
+from process_tracker import ProcessTreeTracker
+from instrumentation import timer
 
 class TestWorkflowRunner:
-    def __init__(self):
+    def __init__(self, collector=None, metrics_daemon=None):
         self.base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.config_file = os.path.join(
             self.base_dir,
@@ -22,6 +26,15 @@ class TestWorkflowRunner:
             f"test_results_{datetime.now().strftime('%Y_%m_%d')}"
         )
         os.makedirs(self.results_dir, exist_ok=True)
+        # Optional MetricsCollector that receives every test result
+        self.collector = collector
+        # Per-test resource usage of each test process and its children
+        self.process_tracker = (collector.process_tracker if collector is not None
+                                else ProcessTreeTracker())
+        self.poll_interval = 0.1
+        # Optional MetricsDaemon whose address is passed to test processes,
+        # so tests can emit metrics with metrics_client.MetricsClient
+        self.metrics_daemon = metrics_daemon
         self.setup_logging()
         self.load_config()
 
@@ -102,9 +115,13 @@ class TestWorkflowRunner:
             futures = []
             for test_file in self._get_test_files(category):
                 futures.append(
-                    executor.submit(self._run_single_test, test_file, timeout)
+                    executor.submit(self._run_and_stage_test, test_file, timeout)
                 )
 
+        # Merge the per-thread staged results once the category is done
+        if self.collector is not None:
+            self.collector.flush_test_metrics()
+
         return {
             'total': len(futures),
             'results': [f.result() for f in futures]
@@ -118,40 +135,89 @@ class TestWorkflowRunner:
         for test_file in self._get_test_files(category):
             results.append(self._run_single_test(test_file, timeout))
 
+        if self.collector is not None:
+            self.collector.collect_test_metrics_batch(results)
+
         return {
             'total': len(results),
             'results': results
         }
 
+    def _run_and_stage_test(self, test_file: str, timeout: int) -> Dict[str, Any]:
+        """Run a test and stage its result on this worker thread"""
+        result = self._run_single_test(test_file, timeout)
+        if self.collector is not None:
+            self.collector.stage_test_result(result)
+        return result
+
+    def _wait_test_process(self, process: subprocess.Popen, timeout: int):
+        """Wait for a test process while polling its tree; returns its rusage"""
+        deadline = time.monotonic() + timeout
+        while True:
+            if hasattr(os, 'wait4'):
+                pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    process.returncode = os.waitstatus_to_exitcode(status)
+                    return rusage
+            elif process.poll() is not None:
+                return None
+
+            if time.monotonic() >= deadline:
+                self.process_tracker.kill_descendants(process.pid)
+                process.kill()
+                process.wait()
+                raise subprocess.TimeoutExpired(process.args, timeout)
+            self.process_tracker.poll([process.pid])
+            time.sleep(self.poll_interval)
+
+    def _test_environment(self) -> Dict[str, str]:
+        """Environment for test processes"""
+        env = dict(os.environ)
+        if self.metrics_daemon is not None:
+            env.update(self.metrics_daemon.environ())
+        return env
+
     def _run_single_test(self, test_file: str, timeout: int) -> Dict[str, Any]:
         """Run a single test"""
+        process = None
+        rusage = None
         try:
-            start_time = datetime.now()
-            result = subprocess.run(
-                ["python3", test_file],
-                cwd=self.base_dir,
-                capture_output=True,
-                text=True,
-                timeout=timeout
-            )
-            duration = (datetime.now() - start_time).total_seconds()
-
-            return {
-                'file': test_file,
-                'status': 'pass' if result.returncode == 0 else 'fail',
-                'duration': duration,
-                'output': result.stdout,
-                'error': result.stderr
-            }
+            with tempfile.TemporaryFile('w+') as stdout, tempfile.TemporaryFile('w+') as stderr:
+                with timer('workflow.test') as test_timer:
+                    process = subprocess.Popen(
+                        ["python3", test_file],
+                        cwd=self.base_dir,
+                        env=self._test_environment(),
+                        stdout=stdout,
+                        stderr=stderr,
+                        text=True
+                    )
+                    self.process_tracker.track(process.pid)
+                    rusage = self._wait_test_process(process, timeout)
+                duration = test_timer.elapsed
+                stdout.seek(0)
+                stderr.seek(0)
+
+                return {
+                    'file': test_file,
+                    'status': 'pass' if process.returncode == 0 else 'fail',
+                    'duration': duration,
+                    'output': stdout.read(),
+                    'error': stderr.read(),
+                    'resources': self.process_tracker.release(process.pid, rusage)
+                }
         except subprocess.TimeoutExpired:
             return {
                 'file': test_file,
                 'status': 'timeout',
                 'duration': timeout,
                 'output': '',
-                'error': f'Test exceeded timeout of {timeout} seconds'
+                'error': f'Test exceeded timeout of {timeout} seconds',
+                'resources': self.process_tracker.release(process.pid)
             }
         except Exception as e:
+            if process is not None:
+                self.process_tracker.release(process.pid)
             return {
                 'file': test_file,
                 'status': 'error',
@@ -195,7 +261,8 @@ class TestWorkflowRunner:
                 'failed': 0,
                 'errors': 0,
                 'timeouts': 0,
-                'duration': 0
+                'duration': 0,
+                'cpu_time': 0
             }
 
             for test in result['results']:
@@ -209,6 +276,18 @@ class TestWorkflowRunner:
                     cat_analysis['timeouts'] += 1
 
                 cat_analysis['duration'] += test['duration']
+                cat_analysis['cpu_time'] += test.get('resources', {}).get('cpu_time', 0)
+
+            # Heaviest tests by CPU time, to spot resource hogs in a category
+            measured = [t for t in result['results'] if t.get('resources')]
+            cat_analysis['top_resources'] = [
+                {
+                    'file': t['file'],
+                    'cpu_time': t['resources']['cpu_time'],
+                    'peak_rss_bytes': t['resources']['peak_rss_bytes']
+                }
+                for t in sorted(measured, key=lambda t: t['resources']['cpu_time'], reverse=True)[:5]
+            ]
 
             analysis['categories'][category] = cat_analysis
             analysis['summary']['passed'] += cat_analysis['passed']